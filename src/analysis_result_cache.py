@@ -0,0 +1,219 @@
+"""
+    @file Responsible for keeping finished playlist analyses (the chart data) so they are not redone.
+    \nEntries are keyed by (playlist_id, snapshot_id) and shared by every user: anyone analyzing the same snapshot
+    of a playlist gets the same charts. Recently used results are kept in memory (bounded by their estimated size),
+    and those pushed out can optionally spill to a sqlite file in the data dir
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class AnalysisResultCache():
+    def __init__(self,
+                 max_memory_bytes : int = constants.ANALYSIS_RESULT_CACHE_MAX_MEMORY_BYTES,
+                 spill_path : Optional[pathlib.Path] = None,
+                 max_spill_bytes : int = constants.ANALYSIS_RESULT_CACHE_MAX_SPILL_BYTES,
+                 is_verbose : bool = False) -> None:
+        """Thread safe LRU cache of (chart_data_artist, chart_data_album, chart_data_genre) results.
+        \n:param `max_memory_bytes` The most (estimated) memory the in-memory results may use.
+            Least recently used results are dropped (or spilled) first. Bigger results are never kept in memory
+        \n:param `spill_path` A sqlite file results dropped from memory are written to. None to not spill
+        \n:param `max_spill_bytes` Once the spilled results are bigger than this, the least recently used are dropped"""
+        self._max_memory_bytes = max_memory_bytes
+        self._max_spill_bytes = max_spill_bytes
+        self._is_verbose = is_verbose
+        self._lock = threading.Lock()
+
+        # (playlist_id, snapshot_id) -> (result, estimated size in bytes)
+        self._results = OrderedDict()
+        self._memory_bytes = 0
+
+        # monitoring
+        self._num_hits = 0
+        self._num_spill_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+
+        self._spill_conn = None
+        self._spill_bytes = 0
+        if spill_path is not None:
+            self._spill_conn = sqlite3.connect(str(spill_path), check_same_thread=False, isolation_level=None)
+            self._spill_conn.execute("PRAGMA journal_mode=WAL")
+            self._spill_conn.execute("PRAGMA synchronous=NORMAL")
+            self._spill_conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                          playlist_id TEXT NOT NULL,
+                                          snapshot_id TEXT NOT NULL,
+                                          body        TEXT NOT NULL,
+                                          size_bytes  INTEGER NOT NULL,
+                                          last_access REAL NOT NULL,
+                                          PRIMARY KEY (playlist_id, snapshot_id))""")
+            self._spill_conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            self._spill_bytes = self._spill_conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results"
+                                                         ).fetchone()[0]
+
+    def get(self, playlist_id : str, snapshot_id : Optional[str]) -> Optional[Tuple[Dict, Dict, Dict]]:
+        """:return A copy of the cached result of this snapshot, None if it is not cached"""
+        if snapshot_id is None:
+            return None
+
+        key = (playlist_id, snapshot_id)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self._num_hits += 1
+                return self._copy_result(self._results[key][0])
+
+            result = self._get_spilled(key)
+            if result is None:
+                self._num_misses += 1
+                return None
+            self._num_spill_hits += 1
+            # Back in memory, it is the most recently used result again
+            self._put_in_memory(key, result)
+            return self._copy_result(result)
+
+    def put(self, playlist_id : str, snapshot_id : Optional[str], result : Tuple[Dict, Dict, Dict]) -> None:
+        """Caches the result of this snapshot. Drops the results of the playlist's older snapshots,
+        they can never be asked for again"""
+        if snapshot_id is None:
+            return
+
+        key = (playlist_id, snapshot_id)
+        with self._lock:
+            for old_key in [old_key for old_key in self._results.keys() if old_key[0] == playlist_id]:
+                self._remove_from_memory(old_key)
+            if self._spill_conn is not None:
+                self._remove_spilled(playlist_id)
+            self._put_in_memory(key, self._copy_result(result))
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            num_lookups = self._num_hits + self._num_spill_hits + self._num_misses
+            stats = {"num_results": len(self._results),
+                     "memory_bytes": self._memory_bytes,
+                     "max_memory_bytes": self._max_memory_bytes,
+                     "num_hits": self._num_hits,
+                     "num_spill_hits": self._num_spill_hits,
+                     "num_misses": self._num_misses,
+                     "num_evictions": self._num_evictions,
+                     "hit_rate": 0.0 if num_lookups == 0 else (self._num_hits + self._num_spill_hits) / num_lookups}
+            if self._spill_conn is not None:
+                stats["spill_bytes"] = self._spill_bytes
+                stats["max_spill_bytes"] = self._max_spill_bytes
+            return stats
+
+    def _put_in_memory(self, key : Tuple[str, str], result : Tuple[Dict, Dict, Dict]) -> None:
+        """Adds the result as the most recently used, then evicts until under the memory limit
+        \n:pre the lock is held"""
+        size_bytes = self._estimate_size(result)
+        if size_bytes > self._max_memory_bytes:
+            self._spill(key, result)
+            return
+
+        self._results[key] = (result, size_bytes)
+        self._memory_bytes += size_bytes
+        while self._memory_bytes > self._max_memory_bytes:
+            evicted_key = next(iter(self._results))
+            evicted_result = self._results[evicted_key][0]
+            self._remove_from_memory(evicted_key)
+            self._num_evictions += 1
+            self._spill(evicted_key, evicted_result)
+
+    def _remove_from_memory(self, key : Tuple[str, str]) -> None:
+        """:pre the lock is held"""
+        self._memory_bytes -= self._results.pop(key)[1]
+
+    def _spill(self, key : Tuple[str, str], result : Tuple[Dict, Dict, Dict]) -> None:
+        """Writes a result dropped from memory to the spill file (if there is one)
+        \n:pre the lock is held"""
+        if self._spill_conn is None:
+            return
+
+        body = json.dumps(result)
+        if len(body) > self._max_spill_bytes:
+            return
+        self._spill_conn.execute("BEGIN")
+        try:
+            old_row = self._spill_conn.execute("""SELECT size_bytes FROM results
+                                                  WHERE playlist_id = ? AND snapshot_id = ?""", key).fetchone()
+            self._spill_conn.execute("""INSERT OR REPLACE INTO results
+                                        (playlist_id, snapshot_id, body, size_bytes, last_access)
+                                        VALUES (?, ?, ?, ?, ?)""", (*key, body, len(body), time.time()))
+            self._spill_bytes += len(body) - (0 if old_row is None else old_row[0])
+            self._evict_spilled_if_needed()
+            self._spill_conn.execute("COMMIT")
+        except BaseException:
+            self._spill_conn.execute("ROLLBACK")
+            self._spill_bytes = self._spill_conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results"
+                                                         ).fetchone()[0]
+            raise
+
+        if self._is_verbose:
+            print(f"Spilled the analysis of playlist {key[0]} (snapshot {key[1]}) to disk")
+
+    def _get_spilled(self, key : Tuple[str, str]) -> Optional[Tuple[Dict, Dict, Dict]]:
+        """:pre the lock is held"""
+        if self._spill_conn is None:
+            return None
+        row = self._spill_conn.execute("SELECT body FROM results WHERE playlist_id = ? AND snapshot_id = ?",
+                                       key).fetchone()
+        if row is None:
+            return None
+        self._spill_conn.execute("UPDATE results SET last_access = ? WHERE playlist_id = ? AND snapshot_id = ?",
+                                 (time.time(), *key))
+        return tuple(json.loads(row[0]))
+
+    def _remove_spilled(self, playlist_id : str) -> None:
+        """Drops every spilled snapshot of the playlist
+        \n:pre the lock is held"""
+        row = self._spill_conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results WHERE playlist_id = ?",
+                                       (playlist_id,)).fetchone()
+        if row[0] == 0:
+            return
+        self._spill_conn.execute("DELETE FROM results WHERE playlist_id = ?", (playlist_id,))
+        self._spill_bytes -= row[0]
+
+    def _evict_spilled_if_needed(self) -> None:
+        """Drops the least recently used spilled results until under the spill size limit
+        \n:pre the lock is held"""
+        while self._spill_bytes > self._max_spill_bytes:
+            rows = self._spill_conn.execute("""SELECT playlist_id, snapshot_id, size_bytes FROM results
+                                               ORDER BY last_access LIMIT ?""",
+                                            (constants.ANALYSIS_RESULT_CACHE_EVICT_BATCH_SIZE,)).fetchall()
+            if len(rows) == 0:
+                self._spill_bytes = 0
+                break
+
+            keys_to_evict = []
+            for playlist_id, snapshot_id, size_bytes in rows:
+                if self._spill_bytes <= self._max_spill_bytes:
+                    break
+                keys_to_evict.append((playlist_id, snapshot_id))
+                self._spill_bytes -= size_bytes
+            self._spill_conn.executemany("DELETE FROM results WHERE playlist_id = ? AND snapshot_id = ?",
+                                         keys_to_evict)
+
+    @classmethod
+    def _estimate_size(cls, result : Tuple[Dict, Dict, Dict]) -> int:
+        """:return Roughly how many bytes the result takes in memory (the dicts, their keys and their counts)"""
+        size_bytes = sys.getsizeof(result)
+        for chart_data in result:
+            size_bytes += sys.getsizeof(chart_data)
+            for key, value in chart_data.items():
+                size_bytes += sys.getsizeof(key) + sys.getsizeof(value)
+        return size_bytes
+
+    @classmethod
+    def _copy_result(cls, result : Tuple[Dict, Dict, Dict]) -> Tuple[Dict, Dict, Dict]:
+        """So callers can not change what is cached"""
+        return tuple(dict(chart_data) for chart_data in result)
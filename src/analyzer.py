@@ -1,17 +1,25 @@
 #-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Set, Tuple, Iterable
+from collections import ChainMap
+import hashlib
 
 #------------------------------Project Imports-----------------------------#
 import constants
-from utils import Utils
 from scraper import Scraper
 from data_manager import DataManager
+from track_aggregator import TrackAggregator
+from playlist_analysis_state import PlaylistAnalysisState
+from analysis_result_cache import AnalysisResultCache
 
 class Analyzer():
-    def __init__(self, is_verbose, data_mananger_obj : DataManager) -> None:
-        """Class Used to analyze the data coming out of scraper in a form usable by WebApp"""
+    def __init__(self, is_verbose, data_mananger_obj : DataManager,
+                 analysis_result_cache : Optional[AnalysisResultCache] = None) -> None:
+        """Class Used to analyze the data coming out of scraper in a form usable by WebApp
+        \n:param `analysis_result_cache` Where `analyze_playlist` keeps its results. Defaults to an in-memory cache"""
         self._is_verbose = is_verbose
         self._data_manager = data_mananger_obj
+        self._analysis_result_cache = analysis_result_cache if analysis_result_cache is not None \
+            else AnalysisResultCache(is_verbose=is_verbose)
 
     def analyze_raw_track_list(self, raw_track_list:
                             List[Dict],
@@ -23,43 +31,128 @@ class Analyzer():
         Each dict is readily usable for the rendering of the pie-charts.
         \n`NOTE:` before using the dictionaries to make the chart, use `Utils.prep_keys_for_html()`
             to unescape the key names"""
-        # eventual returns
-        analyzed_chart_data_artist = {}
-        analyzed_chart_data_album = {}
-        analyzed_chart_data_genre = {}
+        return self.analyze_raw_track_pages([raw_track_list], access_token)
+
+    def analyze_raw_track_pages(self, raw_track_pages : Iterable[List[Dict]],
+                                access_token : str) -> Tuple[Dict, Dict, Dict]:
+        """Same as `analyze_raw_track_list`, but takes the tracks one page at a time
+        (i.e. from `Scraper.stream_songs_from_playlist`). Artists and albums are counted as each page arrives
+        and a page is let go of once it is counted, so the whole playlist is never held in memory.
+        \n:param `raw_track_pages` Iterable of lists of raw track dicts from the API call itself
+        \n:return a Tuple of (chart_data_artist, chart_data_album, chart_data_genre). See `analyze_raw_track_list`"""
+        # Memory-mapped index, only the artists in this playlist are ever looked up / decoded
+        existing_artist_genre_mapping = self._data_manager.get_artist_genre_lookup()
+
+        # Each page is reduced to integer columns as it arrives, the names are only counted at the end
+        track_aggregator = TrackAggregator()
+        for page_num, raw_track_list in enumerate(raw_track_pages):
+            track_aggregator.add_tracks(raw_track_list)
+            if self._is_verbose:
+                print(f"Counted page {page_num} ({len(raw_track_list)} tracks, "
+                      f"{track_aggregator.get_num_tracks()} so far)")
+            # Done with this page, don't keep it alive while the next one downloads
+            del raw_track_list
+
+        analyzed_chart_data_artist = track_aggregator.get_artist_counts()
+        analyzed_chart_data_album = track_aggregator.get_album_counts()
+
+        artist_to_url_map = self._build_artist_url_map(track_aggregator.get_artist_spotify_ids(),
+                                                       existing_artist_genre_mapping)
+        analyzed_chart_data_genre = self._analyze_playlist_for_genre(analyzed_chart_data_artist,
+                                                                     artist_to_url_map,
+                                                                     existing_artist_genre_mapping,
+                                                                     access_token)
+
+        # Make sure all of the keys are put in a valid form for json keys
+        # replace all keys with ' or " in them with escape sequences
+        # Will get converted back later
+        return (self._prep_keys_for_json(analyzed_chart_data_artist),
+                self._prep_keys_for_json(analyzed_chart_data_album),
+                self._prep_keys_for_json(analyzed_chart_data_genre))
+
+    def analyze_playlist(self, playlist_id : str, snapshot_id : Optional[str],
+                         get_raw_track_pages : Callable[[], Iterable[List[Dict]]],
+                         access_token : str) -> Tuple[Dict, Dict, Dict]:
+        """Same as `analyze_raw_track_pages`, but builds on the last analysis of this playlist (saved by the
+        DataManager). Only the tracks added / removed since then are counted, and the tracks are not
+        requested at all if the playlist's snapshot_id has not changed.
+        \nRecent results are cached by (playlist_id, snapshot_id) for every user, see `get_result_cache_stats`
+        \n:param `snapshot_id` The playlist's current snapshot_id (see `Scraper.get_playlist_header`).
+            None to analyze the playlist without saving the result
+        \n:param `get_raw_track_pages` Returns the playlist's tracks one page at a time
+            (i.e. from `Scraper.stream_songs_from_playlist`). Only called if the playlist changed
+        \n:return a Tuple of (chart_data_artist, chart_data_album, chart_data_genre). See `analyze_raw_track_list`.
+            Keys are in the order they were first counted, which can differ from `analyze_raw_track_pages`"""
+        cached_result = self._analysis_result_cache.get(playlist_id, snapshot_id)
+        if cached_result is not None:
+            if self._is_verbose:
+                print(f"Using the cached analysis of playlist {playlist_id} (snapshot {snapshot_id})")
+            return cached_result
 
-        existing_artist_genre_mapping = self._data_manager.get_artist_genre_mappings()
+        state = None
+        state_dict = self._data_manager.get_playlist_analysis_state(playlist_id)
+        if state_dict is not None:
+            state = PlaylistAnalysisState.from_dict(state_dict)
 
-        artist_to_url_map = {}
-
-        for raw_track in raw_track_list:
-            parsed_raw_track = self.parse_raw_track(raw_track, artist_to_url_map, existing_artist_genre_mapping)
+        if state is not None and snapshot_id is not None and state.snapshot_id == snapshot_id:
+            if self._is_verbose:
+                print(f"Playlist {playlist_id} has not changed since snapshot {snapshot_id}, reusing its analysis")
+        else:
+            if state is None:
+                state = PlaylistAnalysisState(playlist_id)
+            track_counts, track_info = PlaylistAnalysisState.count_tracks(get_raw_track_pages())
 
-            cur_track = parsed_raw_track["track_name"]
+            existing_artist_genre_mapping = self._data_manager.get_artist_genre_lookup()
 
-            # Perform metric calcs for each artist and album - functions update in place
-            cur_artist = self._analyze_raw_track_artists(parsed_raw_track, analyzed_chart_data_artist)
-            cur_album = self._analyze_raw_track_album(parsed_raw_track, analyzed_chart_data_album)
+            def get_new_artist_genres(artist_spotify_ids : Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+                artist_to_url_map = self._build_artist_url_map(artist_spotify_ids, existing_artist_genre_mapping)
+                return self._get_artists_genres(dict.fromkeys(artist_spotify_ids.keys(), 0),
+                                                artist_to_url_map,
+                                                existing_artist_genre_mapping,
+                                                access_token)
 
+            num_changed_tracks = state.update(snapshot_id, track_counts, track_info, get_new_artist_genres)
             if self._is_verbose:
-                print("Track {} by {} from their {} album".format(
-                    cur_track, cur_artist, cur_album
-                ))
-
-        self._analyze_playlist_for_genre(analyzed_chart_data_artist,
-                                         analyzed_chart_data_genre,
-                                         artist_to_url_map,
-                                         existing_artist_genre_mapping,
-                                         access_token)
+                print(f"Applied {num_changed_tracks} added / removed tracks to the analysis of playlist {playlist_id}")
+            if snapshot_id is not None:
+                self._data_manager.save_playlist_analysis_state(playlist_id, state.to_dict())
+
+        # Make sure all of the keys are put in a valid form for json keys
+        analyzed_data_tuple = tuple(self._prep_keys_for_json(analyzed_data) for analyzed_data in state.get_chart_data())
+        self._analysis_result_cache.put(playlist_id, snapshot_id, analyzed_data_tuple)
+        return analyzed_data_tuple
+
+    def analyze_library(self, user_id : str, playlist_snapshot_ids : Dict[str, Optional[str]],
+                        get_raw_track_pages : Callable[[], Iterable[List[Dict]]],
+                        access_token : str) -> Tuple[Dict, Dict, Dict]:
+        """Analyzes every track in the user's library (all of their playlists) at once.
+        A track in several playlists is only counted once. Genres of unknown artists are requested in batches.
+        \n:param `playlist_snapshot_ids` playlist_id -> snapshot_id of every playlist in the library.
+            The result is cached until one of them changes
+        \n:param `get_raw_track_pages` Returns the tracks of every playlist, one page at a time
+            (i.e. from `Scraper.stream_songs_from_playlists`). Only called if the library is not cached
+        \n:return a Tuple of (chart_data_artist, chart_data_album, chart_data_genre). See `analyze_raw_track_list`.
+            Every track has one lead artist, so the number of unique tracks is the sum of the artist counts"""
+        # The library only looks the same if every playlist is on the same snapshot
+        library_id = f"library:{user_id}"
+        library_snapshot_id = None
+        if None not in playlist_snapshot_ids.values():
+            library_snapshot_id = hashlib.sha1(repr(sorted(playlist_snapshot_ids.items())).encode()).hexdigest()
+
+        cached_result = self._analysis_result_cache.get(library_id, library_snapshot_id)
+        if cached_result is not None:
+            if self._is_verbose:
+                print(f"Using the cached library analysis of {user_id}")
+            return cached_result
 
-        # Make sure all of the genres are put in a valid form for json keys
-        # replace all keys with ' or " in them with escape sequences
-        # Will get converted back later
-        self._prep_keys_for_json(analyzed_chart_data_artist)
-        self._prep_keys_for_json(analyzed_chart_data_album)
-        self._prep_keys_for_json(analyzed_chart_data_genre)
+        analyzed_data_tuple = self.analyze_raw_track_pages(self._skip_duplicate_tracks(get_raw_track_pages()),
+                                                           access_token)
+        self._analysis_result_cache.put(library_id, library_snapshot_id, analyzed_data_tuple)
+        return analyzed_data_tuple
 
-        return (analyzed_chart_data_artist, analyzed_chart_data_album, analyzed_chart_data_genre)
+    def get_result_cache_stats(self) -> Dict:
+        """:return Hit / miss counters and memory use of the `analyze_playlist` result cache"""
+        return self._analysis_result_cache.get_stats()
 
     def parse_raw_track(self, raw_track,
                         artist_url_map: dict,
@@ -109,7 +202,8 @@ class Analyzer():
                         artist_to_url_map : dict,
                         existing_artist_genre_mapping : dict,
                         access_token : str,
-                        new_artist_genre_mappings : dict) -> Optional[Tuple[List[str], Dict, int]]:
+                        new_artist_genre_mappings : dict,
+                        requested_artist_ids : Optional[Set[str]] = None) -> Optional[Tuple[List[str], Dict, int]]:
         """Function to get genre information of 1 artist. \
         Handles deciding to grab from remote vs. local data. \
         Creates a dictionary of all genres mappings obtained from remote!
@@ -121,11 +215,13 @@ class Analyzer():
         \n:param `artist` the name of the artist
         \n:param `new_artist_genre_mappings`: The current dictionary of NEW artist->genre mappings
             Will be updated as new mappings are requested from remote
+        \n:param `requested_artist_ids` Ids of artists already requested (i.e. in a batch) during this analysis.
+            If the artist is one of them but its genres are still unknown, it is not requested again
 
         \nReturn: (artist_genres, new_artist_genre_mappings, artist_track_count) OR None
                 \n\t\tWhere artist_genres = their genres in list form
                 \n\t\tWhere new_artist_genre_mappings = any new mappings which should be used to update the data file
-                \n\t\tNone - When the artist does not have a spotify url to query
+                \n\t\tNone - When the artist does not have a spotify url to query, or requesting them failed
         """
         if artist not in artist_to_url_map.keys() and artist not in existing_artist_genre_mapping.keys():
             if self._is_verbose:
@@ -142,7 +238,17 @@ class Analyzer():
         # Grab from remote
         elif artist in artist_to_url_map.keys():
             artist_url = artist_to_url_map[artist]
+            # The batch failed / did not know them. Retrying 1 by 1 would only spend more of the rate limit
+            if requested_artist_ids is not None and self._get_artist_id_from_url(artist_url) in requested_artist_ids:
+                if self._is_verbose:
+                    print(f"ERROR: could not get the genres of artist {artist}, trying again next analysis")
+                return None
             artist_genres = Scraper.get_artist_info(artist_url, access_token)
+            # A failed request is not saved, so the artist is requested again next time
+            if artist_genres is None:
+                if self._is_verbose:
+                    print(f"ERROR: failed to get the genres of artist {artist}")
+                return None
             new_artist_genre_mappings.update({artist: artist_genres})
         return (artist_genres, new_artist_genre_mappings, artist_track_count)
 
@@ -158,93 +264,147 @@ class Analyzer():
         return (id, song_name, album, artists)
 
 
-    def _analyze_raw_track_artists(self, cur_parsed_track: Dict, cur_artist_info : Dict) -> str:
-        """:brief Given a track to analyze and the current analysis dict,\
-            updates `cur_artist_info` after analyzing the current track `IN PLACE`.
-        \n:param `cur_parsed_track` a dict representing a parsed track
-        \n:param `cur_artist_info` The current metrics on artists. `Will get updated in place`
-        :return The artist of the current track
-        """
-        cur_artist = cur_parsed_track["artists"][0]
-
-        # do the metric calculations and update the results
-        # TODO: better handle features
-        # TODO - try an abstract this to a function - for the other analyze functions too
-        cur_num_tracks_by_artist = cur_artist_info.get(cur_artist, 0)
-        cur_num_tracks_by_artist += 1
-        cur_artist_info[cur_artist] = cur_num_tracks_by_artist
-
-        return cur_artist
-
-    def _analyze_raw_track_album(self, cur_parsed_track: Dict, cur_album_info: Dict) -> str:
-        """:brief Given a track to analyze and the current analysis dict,\
-            updates `cur_album_info` after analyzing the current track `IN PLACE`.
-        \n:param `cur_parsed_track` a dict representing a parsed track
-        \n:param `cur_album_info` The current metrics on albums. `Will get updated in place`
-        \n:return The current album name
-        """
-        cur_album = str(cur_parsed_track["album"])
-        if cur_album == "" or cur_album == " ":
-            cur_album = constants.DEFAULT_NO_ALBUM_NAME
-
-        cur_num_tracks_in_album = cur_album_info.get(cur_album, 0)
-        cur_num_tracks_in_album += 1
-        cur_album_info[cur_album] = cur_num_tracks_in_album
-
-        return cur_album
-
     def _analyze_playlist_for_genre(self,
                                 analyzed_artist_dict: Dict,
-                                genre_info: Dict,
                                 artist_to_url_map : dict,
                                 existing_artist_genre_mapping : dict,
-                                access_token : str) -> None:
-        """:brief Given a track to analyze and the current analysis dict,\
-            updates `cur_genre_info` after analyzing the current track `IN PLACE`.
+                                access_token : str) -> Dict:
+        """:brief Given the artist analysis of a playlist, counts the genres of its tracks.
+        \n:param `analyzed_artist_dict` a dict representing the final analysis of artists
+        \n:param `artist_to_url_map` Maps a artist's name to their spotify API URI
+        \n:param existing_artist_genre_mapping - Existing map of artist_name -> genre.
+        \n:param `access_token` The token recieved on authentication from spotify
+        \n:return The genre metrics, genre -> number of tracks
+        """
+        artist_genres_by_artist = self._get_artists_genres(analyzed_artist_dict,
+                                                           artist_to_url_map,
+                                                           existing_artist_genre_mapping,
+                                                           access_token)
+
+        # Count each genre for the number of times its artists are in the playlist
+        return TrackAggregator.count_genres(analyzed_artist_dict, artist_genres_by_artist)
+
+    def _get_artists_genres(self,
+                            analyzed_artist_dict: Dict,
+                            artist_to_url_map : dict,
+                            existing_artist_genre_mapping : dict,
+                            access_token : str) -> Dict[str, List[str]]:
+        """:brief Finds the genres of every artist in `analyzed_artist_dict`, locally or from remote.
+        Saves the ones that came from remote.
         \n:param `analyzed_artist_dict` a dict representing the final analysis of artists
-        \n:param `genre_info` The genre metrics. `Generated in this function`
         \n:param `artist_to_url_map` Maps a artist's name to their spotify API URI
         \n:param existing_artist_genre_mapping - Existing map of artist_name -> genre.
         \n:param `access_token` The token recieved on authentication from spotify
-        \n:return None
+        \n:return artist_name -> their genres. Artists without a spotify url to query are left out
         """
         # Used to update the local file oncne all new mappings have been discovered
-        new_artist_genre_mappings = {}
-
-        # For each artist, grab their genres from spotify and use that in metric calculations
+        # Resolve every unknown artist up front so they cost a few batched requests instead of 1 each
+        new_artist_genre_mappings, requested_artist_ids = self._get_unknown_artist_genres(
+                                                                    analyzed_artist_dict,
+                                                                    artist_to_url_map,
+                                                                    existing_artist_genre_mapping,
+                                                                    access_token)
+        known_artist_genre_mapping = ChainMap(new_artist_genre_mappings, existing_artist_genre_mapping)
+
+        # For each artist, grab their genres. Artists the batch could not resolve are left out of this analysis
+        # (and not saved), so they are requested again next time
+        artist_genres_by_artist = {}
         for artist in analyzed_artist_dict.keys():
             genres_update_count_tuple = self.get_artist_genres(artist,
                                             analyzed_artist_dict,
                                             artist_to_url_map,
-                                            existing_artist_genre_mapping,
+                                            known_artist_genre_mapping,
                                             access_token,
-                                            new_artist_genre_mappings)
+                                            new_artist_genre_mappings,
+                                            requested_artist_ids)
 
             if genres_update_count_tuple is None:
                 continue
-            artist_genres = genres_update_count_tuple[0]
+            artist_genres_by_artist[artist] = genres_update_count_tuple[0]
             new_artist_genre_mappings = genres_update_count_tuple[1]
-            artist_track_count = genres_update_count_tuple[2]
 
-            # Update the count of a given genre in the playlist
-            self._update_genre_count(artist_genres, genre_info, artist_track_count)
+        self._data_manager.update_artist_genre_mappings(new_artist_genre_mappings)
+        return artist_genres_by_artist
+
+    def _get_unknown_artist_genres(self,
+                                   analyzed_artist_dict : Dict,
+                                   artist_to_url_map : dict,
+                                   existing_artist_genre_mapping : dict,
+                                   access_token : str) -> Tuple[Dict, Set[str]]:
+        """:brief Collects every artist whose genres are not known locally and requests them in batches
+        \n:param `analyzed_artist_dict` a dict representing the final analysis of artists
+        \n:param `artist_to_url_map` Maps a artist's name to their spotify API URI
+        \n:param `existing_artist_genre_mapping` - Existing map of artist_name -> genre.
+        \n:param `access_token` The token recieved on authentication from spotify
+        \n:return (Dict of the NEW artist_name -> List[genres] mappings that were found,
+            the ids of every artist that was requested)"""
+        artist_id_to_name = {}
+        for artist in analyzed_artist_dict.keys():
+            if artist in existing_artist_genre_mapping or artist not in artist_to_url_map:
+                continue
+            artist_id_to_name[self._get_artist_id_from_url(artist_to_url_map[artist])] = artist
+
+        if len(artist_id_to_name) == 0:
+            return ({}, set())
 
+        if self._is_verbose:
+            print(f"Requesting the genres of {len(artist_id_to_name)} new artists")
 
-        self._data_manager.update_artist_genre_mappings(new_artist_genre_mappings)
+        artist_id_to_genres = Scraper.get_several_artists_info(list(artist_id_to_name.keys()), access_token)
+        return ({artist_id_to_name[artist_id]: genres for artist_id, genres in artist_id_to_genres.items()},
+                set(artist_id_to_name.keys()))
 
-    def _prep_keys_for_json(self, analyzed_data : dict) -> None:
+    def _get_artist_id_from_url(self, artist_url : str) -> str:
+        """The url always ends with the artist's id (see `_update_artist_url_map`)"""
+        return artist_url.rsplit("/", 1)[-1]
+
+    def _prep_keys_for_json(self, analyzed_data : dict) -> dict:
         """Given a dictionary of the analyzed_data (from its respective processing function),
         makes keys valid -> replaces ' and " with escape sequences.
-        \nNOTE: done `in place`"""
-        unescaped_key_change_lists = Utils.get_keys_with_unescaped_quotes(analyzed_data)
-        keys_to_escape_single, keys_to_escape_double = unescaped_key_change_lists
-
+        \n:return A new dict with the escaped keys. Same keys / order as swapping them with
+            `Utils.get_keys_with_unescaped_quotes` + `Utils.swap_dict_keys`, but in one pass"""
         # Used to remove ' from key names until it is safe to put them back in
         # eventually the ' wrapped around key's are ALL changed to ",
         # but that will also change ' in the keys to " which is BAD for parsing.
         # change the ' to know what they are later
-        Utils.swap_dict_keys(analyzed_data, keys_to_escape_single)
-        Utils.swap_dict_keys(analyzed_data, keys_to_escape_double)
+        # Swapping re-inserts the changed keys at the end: first those with only ', then those with "
+        unchanged_items = []
+        single_quote_items = []
+        double_quote_items = []
+        for key, value in analyzed_data.items():
+            if '"' in key:
+                key = key.replace("'", constants.SINGLE_QUOTE_ESCAPE_SEQ)
+                double_quote_items.append((key.replace('"', constants.DOUBLE_QUOTE_ESCAPE_SEQ), value))
+            elif "'" in key:
+                single_quote_items.append((key.replace("'", constants.SINGLE_QUOTE_ESCAPE_SEQ), value))
+            else:
+                unchanged_items.append((key, value))
+        return dict(unchanged_items + single_quote_items + double_quote_items)
+
+    def _skip_duplicate_tracks(self, raw_track_pages : Iterable[List[Dict]]) -> Iterable[List[Dict]]:
+        """:return The same pages, without the tracks already seen on an earlier page (or earlier on the same one).
+        Only the track keys are remembered, not the tracks"""
+        seen_track_keys = set()
+        for raw_track_list in raw_track_pages:
+            unique_track_list = []
+            for raw_track in raw_track_list:
+                track_key = PlaylistAnalysisState.get_track_key(raw_track)
+                if track_key not in seen_track_keys:
+                    seen_track_keys.add(track_key)
+                    unique_track_list.append(raw_track)
+            # Done with this page, don't keep it alive while the next one downloads
+            del raw_track_list
+            yield unique_track_list
+
+    def _build_artist_url_map(self, artist_spotify_ids : Dict[str, Optional[str]],
+                              existing_artist_genre_mapping : dict) -> Dict[str, str]:
+        """:param `artist_spotify_ids` artist name -> their spotify id (None for local files)
+        \n:return artist name -> api url, for the artists whose genres are not already known"""
+        artist_to_url_map = {}
+        for artist_name, artist_id in artist_spotify_ids.items():
+            if artist_name not in existing_artist_genre_mapping:
+                self._update_artist_url_map(artist_to_url_map, {"id": artist_id}, artist_name)
+        return artist_to_url_map
 
     def _update_artist_url_map(self, artist_url_map: dict, lead_artist_dict : dict, lead_artist_name : str) -> bool:
         """Checks if the artist is in the artist->api url map. Adds it if it is not.
@@ -265,18 +425,3 @@ class Analyzer():
             did_add = True
 
         return did_add
-
-    def _update_genre_count(self, artist_genres : List[str], genre_info : dict, artist_track_count : int):
-        """:brief Updates the genre count dictionary
-        \n:param `artist_genres` The list of genres a given artist is associated with
-        \n:param `artist_track_count` The number of times the artist has a track in the playlist
-        \n:param `genre_info` The genre metrics used for the chart. Gets updated in this function"""
-        # Update the count of a given genre in the playlist
-        for cur_genre in artist_genres:
-            if cur_genre == "" or cur_genre == " ":
-                cur_genre = constants.DEFAULT_NO_GENRE_NAME
-            cur_genre_count_in_playlist = genre_info.get(cur_genre, 0)
-
-            # Count the genre for the number of times this artist is in the playlist
-            cur_genre_count_in_playlist += artist_track_count
-            genre_info[cur_genre] = cur_genre_count_in_playlist
@@ -0,0 +1,157 @@
+"""
+    @file Responsible for persisting the artist -> genres map without rewriting all of it on every update.
+    \nThe map is a json snapshot + an append-only ndjson journal of the updates made since.
+    \nReading replays the journal on top of the snapshot. Once the journal grows big enough it is folded
+    into a fresh snapshot in the background.
+    \nThe map is not kept in memory, it is read from disk when asked for (lookups go through a GenreIndex instead)
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import os
+import pathlib
+import threading
+from typing import Dict, List, Optional
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class ArtistGenreJournal():
+    def __init__(self, snapshot_path : pathlib.Path,
+                 journal_path : Optional[pathlib.Path] = None,
+                 compact_threshold_bytes : int = constants.ARTIST_GENRE_JOURNAL_COMPACT_THRESHOLD_BYTES,
+                 is_verbose : bool = False) -> None:
+        """Thread safe. Only the journal's size is kept in memory, the map is read from disk when asked for
+        \n:param `snapshot_path` The json map (i.e. artist_genre_map.json)
+        \n:param `journal_path` Where updates are appended. Defaults to `<snapshot stem>.journal.ndjson`
+        \n:param `compact_threshold_bytes` The journal is compacted into the snapshot once it is bigger than this"""
+        self._snapshot_path = pathlib.Path(snapshot_path)
+        self._journal_path = pathlib.Path(journal_path) if journal_path is not None else \
+            self._snapshot_path.with_name(self._snapshot_path.stem + constants.ARTIST_GENRE_JOURNAL_SUFFIX)
+        self._compact_threshold_bytes = compact_threshold_bytes
+        self._is_verbose = is_verbose
+
+        self._lock = threading.Lock()
+        self._is_compacting = False
+        self._journal_size_bytes = self._drop_corrupt_journal_tail()
+
+    def get_mappings(self) -> Dict[str, List[str]]:
+        """Reads the full map from disk. Costs O(map), use a GenreIndex to look up a few artists
+        \n:return The snapshot with every journal record replayed on top, in order"""
+        with self._lock:
+            return self._read_mappings(self._journal_size_bytes)
+
+    def update_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        """Appends one journal record with the new mappings. Costs O(new mappings), not O(map)"""
+        if len(new_mappings) == 0:
+            return
+
+        record = (json.dumps(new_mappings, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self._journal_path, 'ab') as journal_file:
+                journal_file.write(record)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self._journal_size_bytes += len(record)
+
+            should_compact = self._journal_size_bytes > self._compact_threshold_bytes and not self._is_compacting
+            if should_compact:
+                self._is_compacting = True
+
+        if should_compact:
+            threading.Thread(target=self._compact, daemon=True).start()
+
+    def get_last_modified(self) -> float:
+        """:return When the map on disk (snapshot or journal) last changed, as a unix timestamp. 0 if never"""
+        last_modified = 0.0
+        for path in (self._snapshot_path, self._journal_path):
+            try:
+                last_modified = max(last_modified, os.path.getmtime(path))
+            except FileNotFoundError:
+                pass
+        return last_modified
+
+    def compact(self) -> None:
+        """Folds the journal into a fresh snapshot now (on this thread)"""
+        with self._lock:
+            if self._is_compacting:
+                return
+            self._is_compacting = True
+        self._compact()
+
+    def _compact(self) -> None:
+        """Writes the current map as the new snapshot, then drops the journal records it already contains.
+        \nUpdates can keep being appended while the snapshot is written.
+        \nA crash at any point is safe: replaying records already in the snapshot gives the same map"""
+        try:
+            with self._lock:
+                compacted_journal_size = self._journal_size_bytes
+
+            # Only compaction replaces the snapshot / shortens the journal, so nothing read here changes underneath
+            mapping_dict = self._read_mappings(compacted_journal_size)
+            self._write_atomically(self._snapshot_path, json.dumps(mapping_dict, indent=2).encode("utf-8"))
+
+            with self._lock:
+                # Keep only what was appended while the snapshot was being written
+                with open(self._journal_path, 'rb') as journal_file:
+                    journal_file.seek(compacted_journal_size)
+                    remaining_records = journal_file.read()
+                self._write_atomically(self._journal_path, remaining_records)
+                self._journal_size_bytes = len(remaining_records)
+
+            if self._is_verbose:
+                print(f"Compacted the artist genre journal into {self._snapshot_path}")
+        except Exception as err:
+            print(f"ERROR: failed to compact the artist genre journal: {err}")
+        finally:
+            with self._lock:
+                self._is_compacting = False
+
+    def _read_mappings(self, journal_size_bytes : int) -> Dict[str, List[str]]:
+        """:param `journal_size_bytes` How much of the journal to replay (records appended after are left out)
+        \n:return The snapshot with the journal records replayed on top, in order"""
+        mapping_dict = {}
+        if self._snapshot_path.is_file():
+            with open(self._snapshot_path, 'r') as snapshot_file:
+                mapping_dict = dict(json.load(snapshot_file))
+
+        if journal_size_bytes > 0:
+            with open(self._journal_path, 'rb') as journal_file:
+                for line in journal_file:
+                    journal_size_bytes -= len(line)
+                    if journal_size_bytes < 0:
+                        break
+                    mapping_dict.update(json.loads(line))
+        return mapping_dict
+
+    def _drop_corrupt_journal_tail(self) -> int:
+        """Checks every journal record. Only the last record can be corrupt (cut short by a crash mid-append),
+        it is truncated so the next append starts on a fresh line instead of after the partial record
+        \n:return The size of the valid journal"""
+        if not self._journal_path.is_file():
+            return 0
+
+        valid_size_bytes = 0
+        with open(self._journal_path, 'rb') as journal_file:
+            for line in journal_file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("record was cut short")
+                    json.loads(line)
+                    valid_size_bytes += len(line)
+                except ValueError:
+                    print(f"ERROR: dropping a corrupt record at the end of {self._journal_path}")
+                    break
+
+        if valid_size_bytes != os.path.getsize(self._journal_path):
+            os.truncate(self._journal_path, valid_size_bytes)
+        return valid_size_bytes
+
+    def _write_atomically(self, path : pathlib.Path, contents : bytes) -> None:
+        """Writes a temp file then renames it over `path`, so `path` is never left half written"""
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(contents)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
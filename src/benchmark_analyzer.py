@@ -0,0 +1,134 @@
+"""
+    @file Benchmarks `Analyzer.analyze_raw_track_list` against the per-track counting it replaced.
+    \nRuns on a generated library (see `fake_spotify_server.SyntheticLibrary`) with every artist's genres already
+    known, so no request is sent and only the counting is timed. Both paths must give the exact same chart data.
+    \nExample: `python benchmark_analyzer.py --num-tracks 50000 --repeat 5`
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+#------------------------------Project Imports-----------------------------#
+import constants
+from analyzer import Analyzer
+from fake_spotify_server import SyntheticLibrary
+from utils import Utils
+
+class InMemoryGenreData():
+    def __init__(self, artist_genre_mapping : Dict[str, List[str]]) -> None:
+        """Stands in for the DataManager, so the benchmark never touches the data directory"""
+        self._artist_genre_mapping = artist_genre_mapping
+
+    def get_artist_genre_lookup(self) -> Dict[str, List[str]]:
+        return self._artist_genre_mapping
+
+    def update_artist_genre_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        self._artist_genre_mapping.update(new_mappings)
+
+
+def generate_raw_tracks(num_tracks : int, num_artists : int, num_albums : int, seed : int) -> List[Dict]:
+    """:return `num_tracks` raw tracks (the "track" of each get-playlist-items item).
+    Includes the awkward cases: names with quotes, albums without a name and local files"""
+    library = SyntheticLibrary(num_playlists=1, tracks_per_playlist=1, num_artists=num_artists,
+                               num_albums=num_albums, seed=seed)
+    playlist_id = next(iter(library.playlists))
+    library.playlists[playlist_id]["tracks"] = []
+    library.add_tracks(playlist_id, num_tracks)
+
+    raw_tracks = []
+    for idx, stored_track in enumerate(library.playlists[playlist_id]["tracks"]):
+        raw_track = library.build_track(stored_track)["track"]
+        if idx % 97 == 0:
+            raw_track["artists"][0]["name"] = raw_track["artists"][0]["name"] + " 'n' the \"Band\""
+        if idx % 89 == 0:
+            raw_track["album"]["name"] = " "
+        if idx % 211 == 0:
+            raw_track["artists"][0] = {"id": None, "name": f"Local File Artist {idx % 5}"}
+        raw_tracks.append(raw_track)
+    return raw_tracks
+
+
+def build_artist_genre_mapping(raw_tracks : List[Dict], library_seed : int) -> Dict[str, List[str]]:
+    """:return artist_name -> genres for every (non local) lead artist in `raw_tracks`"""
+    artist_genre_mapping = {}
+    for idx, raw_track in enumerate(raw_tracks):
+        lead_artist_dict = raw_track["artists"][0]
+        if lead_artist_dict["id"] is None or lead_artist_dict["name"] in artist_genre_mapping:
+            continue
+        num_genres = (idx + library_seed) % 4
+        artist_genre_mapping[lead_artist_dict["name"]] = \
+            [" " if genre_idx == 3 else f"genre {(idx + genre_idx) % 300}" for genre_idx in range(num_genres)]
+    return artist_genre_mapping
+
+
+def analyze_per_track(analyzer : Analyzer, raw_tracks : List[Dict],
+                      artist_genre_mapping : Dict[str, List[str]]) -> Tuple[Dict, Dict, Dict]:
+    """The counting `Analyzer.analyze_raw_track_list` did before the TrackAggregator:
+    a parsed dict per track, dict updates per track, then swapping the quoted keys of each result"""
+    analyzed_artist, analyzed_album, analyzed_genre = {}, {}, {}
+    artist_to_url_map = {}
+    for raw_track in raw_tracks:
+        parsed_raw_track = analyzer.parse_raw_track(raw_track, artist_to_url_map, artist_genre_mapping)
+
+        cur_artist = parsed_raw_track["artists"][0]
+        analyzed_artist[cur_artist] = analyzed_artist.get(cur_artist, 0) + 1
+
+        cur_album = str(parsed_raw_track["album"])
+        if cur_album == "" or cur_album == " ":
+            cur_album = constants.DEFAULT_NO_ALBUM_NAME
+        analyzed_album[cur_album] = analyzed_album.get(cur_album, 0) + 1
+
+    for artist, artist_track_count in analyzed_artist.items():
+        if artist not in artist_genre_mapping:
+            continue
+        for cur_genre in artist_genre_mapping[artist]:
+            if cur_genre == "" or cur_genre == " ":
+                cur_genre = constants.DEFAULT_NO_GENRE_NAME
+            analyzed_genre[cur_genre] = analyzed_genre.get(cur_genre, 0) + artist_track_count
+
+    for analyzed_data in (analyzed_artist, analyzed_album, analyzed_genre):
+        keys_to_escape_single, keys_to_escape_double = Utils.get_keys_with_unescaped_quotes(analyzed_data)
+        Utils.swap_dict_keys(analyzed_data, keys_to_escape_single)
+        Utils.swap_dict_keys(analyzed_data, keys_to_escape_double)
+    return (analyzed_artist, analyzed_album, analyzed_genre)
+
+
+def time_best_of(repeat : int, func : Callable) -> Tuple[float, object]:
+    """:return (the fastest of `repeat` runs in sec, the result of the last run)"""
+    best_sec = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed_sec = time.perf_counter() - start
+        best_sec = elapsed_sec if best_sec is None else min(best_sec, elapsed_sec)
+    return (best_sec, result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the playlist analysis counting")
+    parser.add_argument("--num-tracks", type=int, default=20000)
+    parser.add_argument("--num-artists", type=int, default=2000)
+    parser.add_argument("--num-albums", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raw_tracks = generate_raw_tracks(args.num_tracks, args.num_artists, args.num_albums, args.seed)
+    artist_genre_mapping = build_artist_genre_mapping(raw_tracks, args.seed)
+    analyzer = Analyzer(False, InMemoryGenreData(artist_genre_mapping))
+
+    per_track_sec, per_track_result = time_best_of(
+        args.repeat, lambda: analyze_per_track(analyzer, raw_tracks, artist_genre_mapping))
+    aggregated_sec, aggregated_result = time_best_of(
+        args.repeat, lambda: analyzer.analyze_raw_track_list(raw_tracks, access_token=""))
+
+    # Same keys, counts and order (the order decides the pie chart's slices)
+    for per_track_data, aggregated_data in zip(per_track_result, aggregated_result):
+        assert list(per_track_data.items()) == list(aggregated_data.items()), "the chart data differs"
+
+    print(f"{len(raw_tracks)} tracks, {len(aggregated_result[0])} artists, {len(aggregated_result[1])} albums, "
+          f"{len(aggregated_result[2])} genres (best of {args.repeat})")
+    print(f"per track:  {per_track_sec * 1000:.1f} ms")
+    print(f"aggregated: {aggregated_sec * 1000:.1f} ms ({per_track_sec / aggregated_sec:.1f}x faster)")
@@ -57,3 +57,94 @@ class CLIParser():
             dest="redirect_localhost",
             help="Set this flag to have the redirect url after authroziation be localhost instead of an actual IP"
         )
+
+        self.parser.add_argument(
+            "--pool-connections",
+            type=int,
+            required=False,
+            default=constants.SPOTIFY_SESSION_POOL_CONNECTIONS,
+            dest="pool_connections",
+            help="The number of hosts to keep pooled keep-alive connections for when talking to spotify"
+        )
+
+        self.parser.add_argument(
+            "--pool-maxsize",
+            type=int,
+            required=False,
+            default=constants.SPOTIFY_SESSION_POOL_MAXSIZE,
+            dest="pool_maxsize",
+            help="The max number of keep-alive connections to keep open per spotify host"
+        )
+
+        self.parser.add_argument(
+            "--pagination-workers",
+            type=int,
+            required=False,
+            default=constants.DEFAULT_MAX_PAGINATION_WORKERS,
+            dest="pagination_workers",
+            help="How many pages of a large playlist to request from spotify at once. 1 requests them one at a time"
+        )
+
+        self.parser.add_argument(
+            "--spotify-api-base-uri",
+            type=str,
+            required=False,
+            default=constants.SPOTIFY_API_BASE_URI,
+            dest="spotify_api_base_uri",
+            help="Base uri of the spotify web api. Point it at a local stand-in (fake_spotify_server.py) to run offline"
+        )
+
+        self.parser.add_argument(
+            "--spotify-accounts-base-uri",
+            type=str,
+            required=False,
+            default=constants.SPOTIFY_ACCOUNTS_BASE_URI,
+            dest="spotify_accounts_base_uri",
+            help="Base uri of the spotify accounts service (authorize / token). Can point at a local stand-in too"
+        )
+
+        self.parser.add_argument(
+            "--record-cassette",
+            type=str,
+            required=False,
+            default=None,
+            dest="record_cassette",
+            help="Record every spotify request / response (tokens redacted) to this cassette file. Saved on exit"
+        )
+
+        self.parser.add_argument(
+            "--replay-cassette",
+            type=str,
+            required=False,
+            default=None,
+            dest="replay_cassette",
+            help="Answer every spotify request from this cassette file instead of calling spotify"
+        )
+
+        self.parser.add_argument(
+            "--replay-timing-scale",
+            type=float,
+            required=False,
+            default=1.0,
+            dest="replay_timing_scale",
+            help="Multiplies the recorded response times when replaying. 1 keeps the original timings, 0 skips them"
+        )
+
+        self.parser.add_argument(
+            "--storage-backend",
+            type=str,
+            required=False,
+            choices=[constants.STORAGE_BACKEND_JSON, constants.STORAGE_BACKEND_SQLITE],
+            default=constants.DEFAULT_STORAGE_BACKEND,
+            dest="storage_backend",
+            help="Where users and the artist genre map are saved. sqlite imports the existing json files on first use"
+        )
+
+        self.parser.add_argument(
+            "--analysis-cache-spill",
+            action="store_true",
+            required=False,
+            default=False,
+            dest="analysis_cache_spill",
+            help="Keep finished playlist analyses that are pushed out of memory in a file in the data dir"
+        )
@@ -1,4 +1,6 @@
 """File used to prevent the burying of constants / magic numbers"""
+import os
+
 # Overall Project constants
 PROJECT_NAME = "Spotify API Scraper Parser"
 
@@ -7,6 +9,9 @@ DEFAULT_AUTH_FILENAME =                 "default_app_auth.json"
 EXPECTED_AUTH_FILENAME =                "app_auth.json"
 EXPECTED_USER_DATA_FILENAME =           "user_info.json"
 EXPECTED_ARTIST_TO_GENRE_MAP_FILENAME = "artist_genre_map.json"
+RESPONSE_CACHE_FILENAME =               "response_cache.sqlite3"
+ANALYSIS_RESULT_CACHE_SPILL_FILENAME =  "analysis_result_cache.sqlite3"
+STORAGE_DB_FILENAME =                   "storage.sqlite3"
 DATA_DIR_NAME =                         "data"
 FRONTEND_DIR_NAME =                     "frontend"
 STATIC_DIR_NAME =                       "static"
@@ -23,19 +28,21 @@ DEFAULT_NO_ALBUM_NAME =                 "Album Unknown"
 DEFAULT_NO_GENRE_NAME =                 "Other Genre"
 
 # URL/URI Related constants
-SPOTIFY_API_BASE_URI =          "https://api.spotify.com"
-SPOTIFY_ACCOUNTS_BASE_URI =     "https://accounts.spotify.com"
-SPOTIFY_AUTH_BASE_URL =         "https://accounts.spotify.com/authorize?"
-SPOTIFY_TOKEN_URI =             "https://accounts.spotify.com/api/token"
-SPOTIFY_GET_PLAYLIST_URI =      "https://api.spotify.com/v1/playlists" # Can get ANY Playlist
-SPOTIFY_GET_USER_PLAYLISTS_URI= "https://api.spotify.com/v1/me/playlists" # Gets ALL playlists of current user
-SPOTIFY_USER_PROFILE_URI =      "https://api.spotify.com/v1/me"
-SPOTIFY_ARTIST_BASE_URI =       "https://api.spotify.com/v1/artists/" # ends with their id
-SPOTIFY_ITEM_SEARCH_URI =       "https://api.spotify.com/v1/search"
+# The base uris can be overridden (env vars or CLI) to point the app at a local stand-in (see fake_spotify_server.py)
+SPOTIFY_API_BASE_URI =          os.environ.get("SPOTIFY_API_BASE_URI", "https://api.spotify.com")
+SPOTIFY_ACCOUNTS_BASE_URI =     os.environ.get("SPOTIFY_ACCOUNTS_BASE_URI", "https://accounts.spotify.com")
+SPOTIFY_AUTH_BASE_URL =         f"{SPOTIFY_ACCOUNTS_BASE_URI}/authorize?"
+SPOTIFY_TOKEN_URI =             f"{SPOTIFY_ACCOUNTS_BASE_URI}/api/token"
+SPOTIFY_GET_PLAYLIST_URI =      f"{SPOTIFY_API_BASE_URI}/v1/playlists" # Can get ANY Playlist
+SPOTIFY_GET_USER_PLAYLISTS_URI= f"{SPOTIFY_API_BASE_URI}/v1/me/playlists" # Gets ALL playlists of current user
+SPOTIFY_USER_PROFILE_URI =      f"{SPOTIFY_API_BASE_URI}/v1/me"
+SPOTIFY_ARTIST_BASE_URI =       f"{SPOTIFY_API_BASE_URI}/v1/artists/" # ends with their id
+SPOTIFY_GET_SEVERAL_ARTISTS_URI=f"{SPOTIFY_API_BASE_URI}/v1/artists" # takes ?ids=<comma seperated ids>
+SPOTIFY_ITEM_SEARCH_URI =       f"{SPOTIFY_API_BASE_URI}/v1/search"
 # https://developer.spotify.com/documentation/web-api/reference/#/operations/get-recently-played
-SPOTIFY_GET_RECENT_PLAYED_URI = "https://api.spotify.com/v1/me/player/recently-played"
+SPOTIFY_GET_RECENT_PLAYED_URI = f"{SPOTIFY_API_BASE_URI}/v1/me/player/recently-played"
 
-# API Header formats. NOTE: FILL IN "Authorization" before using them
+# API Header formats. NOTE: treat these as templates - copy them and fill in "Authorization" per request
 # Used to obtain/refresh authorizationn
 SPOTIFY_GET_AUTH_HEADER_FORMAT =    {   "Content-Type": "application/x-www-form-urlencoded",
                         # auth = 'Basic ' + base64-encode(client_id:client_secret)
@@ -48,6 +55,90 @@ SPOTIFY_AUTHORIZED_HEADER_FORMAT = {    "Content-Type": "application/json",
                                         "Authorization": None,
 }
 
+# Spotify "fields" projections. Limits responses to what Analyzer / the song list actually read
+# https://developer.spotify.com/documentation/web-api/reference/#/operations/get-playlists-tracks
+SPOTIFY_PLAYLIST_TRACKS_FIELDS =    "items(track(id,name,type,album(name),artists(id,name))),total,limit,next"
+SPOTIFY_PLAYLIST_FIELDS =           f"name,snapshot_id,tracks({SPOTIFY_PLAYLIST_TRACKS_FIELDS})"
+SPOTIFY_PLAYLIST_HEADER_FIELDS =    "name,snapshot_id,tracks(total)" # used to check if a playlist changed
+
+# API Paging / batching limits (hard coded into the api)
+SPOTIFY_MAX_ARTISTS_PER_REQUEST =   50
+SPOTIFY_MAX_PLAYLISTS_PER_REQUEST = 50
+SPOTIFY_MAX_PLAYLIST_TRACKS_PER_REQUEST = 100
+DEFAULT_MAX_PAGINATION_WORKERS =    8     # pages of 1 paged result requested at once (1 = one at a time)
+
+# In memory cache of playlist tracks keyed by (playlist_id, snapshot_id)
+PLAYLIST_CACHE_MAX_TRACKS =         100000 # across every cached playlist
+PLAYLIST_CACHE_MAX_HEADERS =        10000  # playlist headers kept for ETag revalidation
+
+# Persistent (on disk) cache of slow changing spotify responses
+RESPONSE_CACHE_ENABLED =                    True
+RESPONSE_CACHE_ARTIST_ENDPOINT =            "artist"
+RESPONSE_CACHE_SEARCH_ENDPOINT =            "search"
+RESPONSE_CACHE_TTL_SEC = {  RESPONSE_CACHE_ARTIST_ENDPOINT: 7 * 24 * 60 * 60, # artist genres rarely change
+                            RESPONSE_CACHE_SEARCH_ENDPOINT: 24 * 60 * 60,
+}
+RESPONSE_CACHE_STALE_WHILE_REVALIDATE_SEC = 7 * 24 * 60 * 60 # serve stale entries this long while refreshing
+RESPONSE_CACHE_MAX_SIZE_BYTES =             64 * 1024 * 1024
+RESPONSE_CACHE_EVICT_BATCH_SIZE =           100
+
+# HTTP connection pooling for requests sent to spotify
+SPOTIFY_SESSION_POOL_CONNECTIONS =  4     # number of hosts to keep a pool for
+SPOTIFY_SESSION_POOL_MAXSIZE =      16    # keep-alive connections per host
+SPOTIFY_SESSION_POOL_BLOCK =        True  # wait for a free connection instead of opening extra ones
+SPOTIFY_REQUEST_TIMEOUT_SEC =       30
+
+# Outbound rate limiting. Spotify's limit is per app, so it is shared by every user of the deployment
+SPOTIFY_RATE_LIMIT_REQUESTS_PER_SEC =       25    # token bucket refill rate
+SPOTIFY_RATE_LIMIT_BURST_SIZE =             50    # token bucket size
+SPOTIFY_RATE_LIMIT_MAX_CONCURRENCY =        16    # most requests in flight at once (halved on every 429)
+SPOTIFY_RATE_LIMIT_MAX_RETRIES =            5     # times a 429'd request is re-queued
+SPOTIFY_RATE_LIMIT_MAX_RETRY_AFTER_SEC =    60    # longer Retry-After's are returned to the caller instead
+SPOTIFY_DEFAULT_RETRY_AFTER_SEC =           1     # used when a 429 does not include Retry-After
+
+# Record / replay of spotify traffic (see traffic_cassette.py)
+CASSETTE_REDACTED_VALUE = "REDACTED"
+# request params + response json keys that hold secrets and are never written to a cassette
+CASSETTE_REDACTED_KEYS = {"access_token", "refresh_token", "code", "client_secret"}
+CASSETTE_KEPT_RESPONSE_HEADERS = ["Content-Type", "ETag", "Retry-After"]
+CASSETTE_RECORD_BATCH_SIZE = 50 # recorded requests are appended to the cassette file this many at a time
+
+# Where DataManager keeps the users and the artist -> genres map
+STORAGE_BACKEND_JSON = "json"
+STORAGE_BACKEND_SQLITE = "sqlite"
+DEFAULT_STORAGE_BACKEND = STORAGE_BACKEND_JSON
+SQLITE_STORAGE_BATCH_SIZE = 500     # rows per statement when looking up many artists / genres at once
+# The json backend appends genre map updates to <map name> + this suffix, folded into the map in the background
+ARTIST_GENRE_JOURNAL_SUFFIX = ".journal.ndjson"
+ARTIST_GENRE_JOURNAL_COMPACT_THRESHOLD_BYTES = 1024 * 1024
+# Read only, memory-mapped copy of the genre map that Analyzer looks artists up in (see genre_index.py)
+ARTIST_GENRE_INDEX_FILENAME_FORMAT = "artist_genre_index.{backend_name}.bin"
+ARTIST_GENRE_INDEX_REBUILD_THRESHOLD = 5000     # artists added since the index was built before rebuilding it
+# The json backend keeps each playlist's last analysis (see playlist_analysis_state.py) in this data sub directory
+PLAYLIST_ANALYSIS_DIR_NAME = "playlist_analysis"
+
+# Finished playlist analyses (chart data), shared by every user (see analysis_result_cache.py)
+ANALYSIS_RESULT_CACHE_MAX_MEMORY_BYTES = 32 * 1024 * 1024
+ANALYSIS_RESULT_CACHE_MAX_SPILL_BYTES = 256 * 1024 * 1024   # only used with --analysis-cache-spill
+ANALYSIS_RESULT_CACHE_EVICT_BATCH_SIZE = 100
+
+# Whole library analysis (every playlist of a user at once)
+LIBRARY_ANALYSIS_MAX_PLAYLIST_WORKERS = 4   # playlists streamed at once
+LIBRARY_ANALYSIS_MAX_QUEUED_PAGES = 16      # pages of tracks waiting to be counted, bounds the memory used
+LIBRARY_ANALYSIS_QUEUE_POLL_SEC = 0.5       # how often a blocked playlist stream checks if it should stop
+
+# Background refresh of active users' access tokens (see token_refresh_scheduler.py)
+TOKEN_REFRESH_AHEAD_SEC = 5 * 60                    # refresh this long before the token expires
+TOKEN_REFRESH_MAX_JITTER_SEC = 60                   # + up to this much earlier, random per token
+TOKEN_REFRESH_ACTIVE_USER_WINDOW_SEC = 60 * 60      # users seen within this long are kept refreshed
+TOKEN_REFRESH_MAX_WORKERS = 4                       # most refreshes in flight at once
+TOKEN_REFRESH_RETRY_AFTER_SEC = 30                  # wait after a failed refresh
+TOKEN_REFRESH_MIN_INTERVAL_SEC = 60                 # least time between two refreshes of the same user
+TOKEN_REFRESH_MAX_SLEEP_SEC = 30                    # longest the scheduler sleeps before looking again
+
+# How often (at most) the users file is checked for changes made outside of this process
+USER_STORE_RELOAD_CHECK_INTERVAL_SEC = 1
+
 # Used when requesting an access token to get these scopes as well
 SPOTIFY_SCOPES_LIST = ["user-read-recently-played"]
 
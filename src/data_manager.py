@@ -2,17 +2,28 @@
 import json
 import pathlib
 import io
-from typing import Dict, Optional
-from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Tuple
 import os
 import sys
+import threading
 
 #------------------------------Project Imports-----------------------------#
 from utils import Utils
+from storage_backend import StorageBackend, JsonStorageBackend
+from sqlite_storage_backend import SqliteStorageBackend
+from genre_index import ArtistGenreLookup
+from token_expiry_index import TokenExpiryIndex
 import constants
 
 class DataManager():
-    def __init__(self) -> None:
+    # Where the users and genre map are kept. Shared by every DataManager so they are only loaded once
+    _storage_backend = None
+    _storage_backend_lock = threading.Lock()
+
+    def __init__(self, storage_backend_name : Optional[str] = None) -> None:
+        """:param `storage_backend_name` `constants.STORAGE_BACKEND_JSON` or `constants.STORAGE_BACKEND_SQLITE`.
+            None keeps using the backend already in use (json if there is none yet).
+            Raises ValueError if a different backend is already in use"""
         self._default_auth_filename = constants.DEFAULT_AUTH_FILENAME
         self._expected_auth_filename = constants.EXPECTED_AUTH_FILENAME
         self._expected_user_data_filename = constants.EXPECTED_USER_DATA_FILENAME
@@ -22,6 +33,8 @@ class DataManager():
         self.expected_auth_path = Utils.get_data_dir_path() / self._expected_auth_filename
         self.expected_user_data_path = Utils.get_data_dir_path() / self._expected_user_data_filename
         self.expected_artist_genre_path = Utils.get_data_dir_path() / self._expected_artist_genre_filename
+        self.storage_db_path = Utils.get_data_dir_path() / constants.STORAGE_DB_FILENAME
+        self.playlist_analysis_dir = Utils.get_data_dir_path() / constants.PLAYLIST_ANALYSIS_DIR_NAME
 
         if not self._check_if_auth_file_exists():
             sys.exit()
@@ -29,38 +42,46 @@ class DataManager():
         if not self._check_if_auth_file_valid():
             sys.exit()
 
+        # Validated once here. Construct one DataManager per process and pass it around (User, UserManager, ...)
+        self._auth_info = self._read_from_json_file(self.expected_auth_path)
+
         self._create_json_file_if_not_exist(self.expected_user_data_path)
         self._create_json_file_if_not_exist(self.expected_artist_genre_path)
 
+        self._storage_backend = self._get_shared_storage_backend(storage_backend_name)
+
+        # Opened on first use, see `get_artist_genre_lookup`
+        self._artist_genre_lookup = None
+        self._artist_genre_lookup_lock = threading.Lock()
+
+        # When every user's token expires, so validity checks never read the users from the storage backend.
+        # Rebuilt whenever the users are changed outside of this DataManager, see `_sync_token_expiry_index`
+        self._token_expiry_index = TokenExpiryIndex()
+        self._token_expiry_index_lock = threading.Lock()
+        self._sync_token_expiry_index()
+
     def get_auth_info(self) -> dict:
-        with open(str(self.expected_auth_path)) as auth_file:
-            return json.load(auth_file)
+        """:return The app's client_id / client_secret, as read at startup"""
+        return dict(self._auth_info)
 
-    def save_users_access_token(self, access_token: int, user_id: int, valid_until: datetime, refresh_token : str) -> bool:
+    def save_users_access_token(self, access_token: int, user_id: int, valid_until: float, refresh_token : str) -> bool:
         """Stores the access token for the given user id within the user json.
         If the user already exists, replaces their old access_token value
 
         Args:
             access_token (int): the access token after authentication for this user
             user_id (int): User ID ACCORDING to spotify
+            valid_until (float): When the access token expires, epoch sec (see `Utils.calc_end_time`)
             refresh_token (str): The refresh token given by spotify on user auth to make refreshing easier
 
         Returns:
             bool: True on success
         """
-        # Read in the current json
-        data_json = {}
-        with open(pathlib.Path(self.expected_user_data_path), 'r') as user_file:
-            data_json = json.load(user_file)
-
-        data_json[user_id] = {'access_token': access_token,
-                              'valid_until': valid_until,
-                              'refresh_token': refresh_token}
-
-        # replace the data
-        with open(pathlib.Path(self.expected_user_data_path), 'w') as user_file:
-            json.dump(data_json, user_file, indent=2)
-
+        with self._token_expiry_index_lock:
+            self._storage_backend.save_user(user_id, {'access_token': access_token,
+                                                 'valid_until': valid_until,
+                                                 'refresh_token': refresh_token})
+            self._token_expiry_index.set_expiry(user_id, valid_until)
         return True
 
     def get_users_access_token(self, user_id) -> Optional[str]:
@@ -82,71 +103,71 @@ class DataManager():
 
     def remove_users_refresh_token(self, user_id) -> bool:
         """Removes a users refresh token. useful on logout"""
-        # Read in the current json
-        data_json = {}
-        with open(pathlib.Path(self.expected_user_data_path), 'r') as user_file:
-            data_json = json.load(user_file)
-
-        if user_id in data_json:
-            data_json[user_id]['refresh_token'] = None
-
-        # replace the data
-        with open(pathlib.Path(self.expected_user_data_path), 'w') as user_file:
-            json.dump(data_json, user_file, indent=2)
-
+        self._storage_backend.update_user(user_id, {'refresh_token': None})
         return True
 
     def is_token_valid(self, user_id) -> bool:
         """Given a user'is id, determines if their token is invalid.
-        :Return True if expired, False otherwise."""
-        user_dict = self._get_user_dict(user_id)
-        if user_dict is not None:
-            token_expire_time_formatted = user_dict['valid_until']
-            time_frmt_str = constants.TIME_FORMAT_STR
-            expire_time = datetime.strptime(token_expire_time_formatted, time_frmt_str)
-
-            present = datetime.now()
-            if present > expire_time:
-                return False
-            else:
-                return True
-        else:
-            return False
+        :Return True if the token is still valid, False if expired or the user does not exist."""
+        self._sync_token_expiry_index()
+        return self._token_expiry_index.is_valid(user_id)
+
+    def get_token_expiry(self, user_id) -> Optional[float]:
+        """:return When the user's access token expires (epoch sec), None if the user does not exist"""
+        self._sync_token_expiry_index()
+        return self._token_expiry_index.get_expiry(user_id)
+
+    def get_users_expiring_before(self, deadline : float) -> List[Tuple[str, float]]:
+        """:return [(user_id, expires_at)] of every user whose token expires before `deadline` (epoch sec),
+        soonest first. Includes users whose token already expired"""
+        self._sync_token_expiry_index()
+        return self._token_expiry_index.get_expiring_before(deadline)
 
     def does_user_exist(self, user_id) ->bool:
         """True if user exists, false otherwise"""
-        data = None
-        with open(pathlib.Path(self.expected_user_data_path), 'r') as user_file:
-            data = dict(json.load(user_file))
-        return user_id in data
+        return self._storage_backend.has_user(user_id)
 
     def remove_user_login_info(self, user_id) -> None:
         """Call when a user logs out to remove all of their auth info
         \n`:precondition` The user exists
         \n`:postcondition` All information relating to the user is deleted"""
-        # Read in the current json
-        data_json = {}
-        with open(pathlib.Path(self.expected_user_data_path), 'r') as user_file:
-            data_json = json.load(user_file)
-
-        if user_id in data_json:
-            del data_json[user_id]
-
-        # replace the data
-        self._write_to_json_file(self.expected_user_data_path, data_json)
-
+        with self._token_expiry_index_lock:
+            self._storage_backend.remove_user(user_id)
+            self._token_expiry_index.remove(user_id)
         return True
 
     def get_artist_genre_mappings(self) -> Dict:
         """:return The Existing map of artist_name -> List[genres] saved locally"""
-        mapping_dict = {}
-        with open(pathlib.Path(self.expected_artist_genre_path), 'r') as artist_to_genre_map_file:
-            mapping_dict = json.load(artist_to_genre_map_file)
-        return mapping_dict
+        return self._storage_backend.get_artist_genre_mappings()
+
+    def get_artist_genre_lookup(self) -> Mapping:
+        """:return A read only artist_name -> List[genres] mapping backed by a memory-mapped GenreIndex.
+        Looking up a few artists does not load the whole map, unlike `get_artist_genre_mappings`"""
+        with self._artist_genre_lookup_lock:
+            if self._artist_genre_lookup is None:
+                index_filename = constants.ARTIST_GENRE_INDEX_FILENAME_FORMAT.format(
+                    backend_name=self._storage_backend.name)
+                self._artist_genre_lookup = ArtistGenreLookup(
+                    Utils.get_data_dir_path() / index_filename,
+                    self._storage_backend.get_artist_genre_mappings,
+                    self._storage_backend.get_artist_genre_last_modified())
+            return self._artist_genre_lookup
 
     def update_artist_genre_mappings(self, new_mappings : dict) -> bool:
         """Given a dictionary of artist_name -> List[genres], adds these new mapping to the map file"""
-        self._update_json_file(self.expected_artist_genre_path, new_mappings)
+        self._storage_backend.update_artist_genre_mappings(new_mappings)
+        with self._artist_genre_lookup_lock:
+            artist_genre_lookup = self._artist_genre_lookup
+        if artist_genre_lookup is not None:
+            artist_genre_lookup.add_mappings(new_mappings)
+
+    def get_playlist_analysis_state(self, playlist_id : str) -> Optional[Dict]:
+        """:return The playlist's last analysis state (see `PlaylistAnalysisState.to_dict`), None if never saved"""
+        return self._storage_backend.get_playlist_analysis_state(playlist_id)
+
+    def save_playlist_analysis_state(self, playlist_id : str, state_dict : Dict) -> None:
+        """Replaces the playlist's saved analysis state with `state_dict` (see `PlaylistAnalysisState.to_dict`)"""
+        self._storage_backend.save_playlist_analysis_state(playlist_id, state_dict)
 
     def _check_if_auth_file_exists(self) -> bool:
         """Ensures the non-default auth file was created properly.
@@ -154,7 +175,7 @@ class DataManager():
         if not pathlib.Path(self.expected_auth_path).is_file():
             print(f"Expected authorization data file not found at {self.expected_auth_path}")
             print("Please see the /README.md for details about it's creation")
-            False
+            return False
         else:
             return True
 
@@ -189,13 +210,57 @@ class DataManager():
             with io.open(full_path, 'w') as new_file:
                 new_file.write(json.dumps({}))
 
+    def _sync_token_expiry_index(self) -> None:
+        """Rebuilds the token expiry index from the storage backend if the users were changed by someone else
+        (another process / by hand) since it was built. Expiries saved in the old
+        %m/%d/%Y %H:%M:%S format are converted to epoch timestamps and saved back once"""
+        if self._storage_backend.get_users_version() == self._token_expiry_index.get_source_version():
+            return
+
+        with self._token_expiry_index_lock:
+            users_version = self._storage_backend.get_users_version()
+            if users_version == self._token_expiry_index.get_source_version():
+                return
+
+            expiry_by_user = {}
+            for user_id, user_dict in self._storage_backend.get_all_users().items():
+                valid_until = Utils.parse_end_time(user_dict.get('valid_until'))
+                if valid_until is None:
+                    continue
+                if not isinstance(user_dict.get('valid_until'), (int, float)):
+                    self._storage_backend.update_user(user_id, {'valid_until': valid_until})
+                expiry_by_user[user_id] = valid_until
+            self._token_expiry_index.replace_all(expiry_by_user, users_version)
+
     def _get_user_dict(self, user_id) -> dict:
-        res = None
-        with open(pathlib.Path(self.expected_user_data_path), 'r') as user_file:
-            data_json = dict(json.load(user_file))
-            if user_id in data_json:
-                res = dict(data_json[user_id])
-        return res
+        """:return A copy of the user's info (served from memory), None if they do not exist"""
+        return self._storage_backend.get_user(user_id)
+
+    def _get_shared_storage_backend(self, storage_backend_name : Optional[str]) -> StorageBackend:
+        """:return The backend shared by every DataManager, created on first use.
+        \nIt is never replaced: every DataManager (and the token expiry index / genre lookup each one keeps)
+        would otherwise be left on the old one"""
+        with DataManager._storage_backend_lock:
+            current_backend = DataManager._storage_backend
+            if current_backend is None:
+                DataManager._storage_backend = self._create_storage_backend(
+                    storage_backend_name if storage_backend_name is not None else constants.DEFAULT_STORAGE_BACKEND)
+            elif storage_backend_name is not None and storage_backend_name != current_backend.name:
+                raise ValueError(f"The {current_backend.name} storage backend is already in use, "
+                                 f"can not switch to {storage_backend_name}")
+            return DataManager._storage_backend
+
+    def _create_storage_backend(self, storage_backend_name : str) -> StorageBackend:
+        if storage_backend_name == constants.STORAGE_BACKEND_JSON:
+            return JsonStorageBackend(self.expected_user_data_path, self.expected_artist_genre_path,
+                                      self.playlist_analysis_dir)
+        elif storage_backend_name == constants.STORAGE_BACKEND_SQLITE:
+            storage_backend = SqliteStorageBackend(self.storage_db_path)
+            # The first time sqlite is used, bring over everything saved by the json backend
+            storage_backend.migrate_from_json(self.expected_user_data_path, self.expected_artist_genre_path)
+            return storage_backend
+        else:
+            raise ValueError(f"Unknown storage backend {storage_backend_name}")
 
     def _write_to_json_file(self, path_to_json : str, dict_to_write : dict) -> None:
         """Given a json file's path and the FULL data to `overwrite` it with, write it to the file
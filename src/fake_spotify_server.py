@@ -0,0 +1,418 @@
+"""
+    @file Local stand-in for the spotify web api. Serves synthetic libraries so Scraper / Analyzer / WebApp
+    can be exercised (and benchmarked) without talking to api.spotify.com.
+    \nServes the endpoints in constants.py: authorize, token, me, me/playlists, playlists/{id} (+ /tracks) with
+    paging / fields / ETags, artists (single + several) and search.
+    \nExample: `python fake_spotify_server.py --port 8900 --num-playlists 40 --tracks-per-playlist 2000 --latency-ms 30`
+    \nThen point the app at it: `python main.py --spotify-api-base-uri http://127.0.0.1:8900
+    --spotify-accounts-base-uri http://127.0.0.1:8900` (or the `SPOTIFY_API_BASE_URI` / `SPOTIFY_ACCOUNTS_BASE_URI`
+    environment variables)
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode
+
+class SyntheticLibrary():
+    def __init__(self,
+                 num_playlists : int = 20,
+                 tracks_per_playlist : int = 500,
+                 num_artists : int = 2000,
+                 num_albums : int = 5000,
+                 num_genres : int = 300,
+                 user_id : str = "fake_user",
+                 seed : int = 0) -> None:
+        """A deterministic, generated spotify library. The same arguments always generate the same library
+        \n:param `tracks_per_playlist` The average number of tracks in each playlist. Sizes vary by +-50%"""
+        self._random = random.Random(seed)
+        self.user_id = user_id
+
+        self.genres = [f"genre {idx}" for idx in range(num_genres)]
+
+        self.artists = {}
+        for idx in range(num_artists):
+            artist_id = self._make_id("artist", idx)
+            num_artist_genres = self._random.randint(0, 4)
+            self.artists[artist_id] = {
+                "id": artist_id,
+                "name": f"Artist {idx}",
+                "genres": self._random.sample(self.genres, num_artist_genres),
+                "type": "artist",
+                "popularity": self._random.randint(0, 100),
+                "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+                "available_markets": [],
+            }
+        artist_ids = list(self.artists.keys())
+
+        self.albums = []
+        for idx in range(num_albums):
+            self.albums.append({
+                "id": self._make_id("album", idx),
+                "name": f"Album {idx}",
+                "artist_id": self._random.choice(artist_ids),
+            })
+
+        self.playlists = {}
+        self._next_track_idx = 0
+        for idx in range(num_playlists):
+            playlist_id = self._make_id("playlist", idx)
+            num_tracks = max(1, int(tracks_per_playlist * self._random.uniform(0.5, 1.5)))
+            self.playlists[playlist_id] = {
+                "id": playlist_id,
+                "name": f"Playlist {idx}",
+                "description": f"Generated playlist number {idx}",
+                "owner": {"id": user_id},
+                "tracks": [self._make_track() for _ in range(num_tracks)],
+                "version": 0,
+            }
+
+    def _make_id(self, kind : str, idx : int) -> str:
+        """:return a stable 22 character id, similar to spotify's base62 ids"""
+        return hashlib.sha1(f"{kind}:{idx}".encode()).hexdigest()[:22]
+
+    def _make_track(self) -> Dict:
+        track_idx = self._next_track_idx
+        self._next_track_idx += 1
+        album = self._random.choice(self.albums)
+        artist_ids = [album["artist_id"]]
+        if self._random.random() < 0.2:
+            artist_ids.append(self._random.choice(list(self.artists.keys())))
+        return {"id": self._make_id("track", track_idx),
+                "name": f"Track {track_idx}",
+                "album_id": album["id"],
+                "album_name": album["name"],
+                "artist_ids": artist_ids}
+
+    def add_tracks(self, playlist_id : str, num_tracks : int) -> None:
+        """Used to simulate a playlist changing. Changes the playlist's snapshot id"""
+        playlist = self.playlists[playlist_id]
+        playlist["tracks"].extend(self._make_track() for _ in range(num_tracks))
+        playlist["version"] += 1
+
+    def get_snapshot_id(self, playlist_id : str) -> str:
+        playlist = self.playlists[playlist_id]
+        return self._make_id(f"snapshot:{playlist_id}", playlist["version"])
+
+    def build_artist_ref(self, artist_id : str) -> Dict:
+        artist = self.artists[artist_id]
+        return {"id": artist_id,
+                "name": artist["name"],
+                "type": "artist",
+                "href": f"/v1/artists/{artist_id}",
+                "external_urls": artist["external_urls"]}
+
+    def build_track(self, raw_track : Dict) -> Dict:
+        """:return The full track object, padded the same way spotify pads them (markets, images, ids)"""
+        markets = ["US", "CA", "MX", "GB", "DE", "FR", "SE", "JP", "BR", "AU"] * 18
+        return {"added_at": "2022-01-01T00:00:00Z",
+                "is_local": False,
+                "track": {
+                    "id": raw_track["id"],
+                    "name": raw_track["name"],
+                    "type": "track",
+                    "duration_ms": 200000,
+                    "available_markets": markets,
+                    "external_ids": {"isrc": "USFAKE" + raw_track["id"][:6]},
+                    "artists": [self.build_artist_ref(artist_id) for artist_id in raw_track["artist_ids"]],
+                    "album": {
+                        "id": raw_track["album_id"],
+                        "name": raw_track["album_name"],
+                        "available_markets": markets,
+                        "images": [{"url": "https://i.scdn.co/image/fake", "height": 640, "width": 640}] * 3,
+                        "artists": [self.build_artist_ref(raw_track["artist_ids"][0])],
+                    },
+                }}
+
+
+class FakeSpotifyServer():
+    def __init__(self,
+                 library : SyntheticLibrary,
+                 host : str = "127.0.0.1",
+                 port : int = 0,
+                 latency_ms : float = 0,
+                 rate_limit_prob : float = 0,
+                 retry_after_sec : int = 1,
+                 error_prob : float = 0,
+                 seed : int = 0) -> None:
+        """Serves `library` over http using the same paths / paging as the spotify web api
+        \n:param `port` 0 picks a free port, see `base_uri` once started
+        \n:param `latency_ms` Delay added to every response
+        \n:param `rate_limit_prob` Chance (0-1) of answering with a 429 + Retry-After
+        \n:param `error_prob` Chance (0-1) of answering with a 500"""
+        self.library = library
+        self.latency_ms = latency_ms
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after_sec = retry_after_sec
+        self.error_prob = error_prob
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+        self.request_counts = {}
+        self._count_lock = threading.Lock()
+
+        handler = self._make_handler()
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_uri(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSpotifyServer":
+        """Serve on a background thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def get_total_requests(self) -> int:
+        with self._count_lock:
+            return sum(self.request_counts.values())
+
+    def _count_request(self, route : str) -> None:
+        with self._count_lock:
+            self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+    def _roll(self, prob : float) -> bool:
+        if prob <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < prob
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server._handle(self, "GET")
+
+            def do_POST(self) -> None:
+                server._handle(self, "POST")
+
+        return Handler
+
+    def _handle(self, handler : BaseHTTPRequestHandler, method : str) -> None:
+        parsed_url = urlparse(handler.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed_url.query).items()}
+        if method == "POST":
+            content_len = int(handler.headers.get("Content-Length", 0) or 0)
+            if content_len > 0:
+                body = handler.rfile.read(content_len).decode()
+                params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+        route, status, body, headers = self._route(method, parsed_url.path, params, handler.headers)
+        self._count_request(route)
+
+        if status != 200 or body is None:
+            pass
+        elif self._roll(self.rate_limit_prob):
+            status, body, headers = 429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, \
+                                    {"Retry-After": str(self.retry_after_sec)}
+        elif self._roll(self.error_prob):
+            status, body, headers = 500, {"error": {"status": 500, "message": "Server error"}}, {}
+
+        raw_body = b"" if body is None else json.dumps(body).encode()
+        handler.send_response(status)
+        if body is not None:
+            handler.send_header("Content-Type", "application/json; charset=utf-8")
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.send_header("Content-Length", str(len(raw_body)))
+        handler.end_headers()
+        handler.wfile.write(raw_body)
+
+    def _route(self, method : str, path : str, params : Dict, req_headers) -> Tuple[str, int, Optional[Dict], Dict]:
+        """:return (route_name, status, json_body, extra_headers)"""
+        if method == "GET" and path == "/authorize":
+            # Skip the login page, act like the user accepted right away
+            redirect_params = urlencode({"code": "fake_auth_code", "state": params.get("state", "")})
+            return ("authorize", 302, None, {"Location": f"{params.get('redirect_uri', '')}?{redirect_params}"})
+
+        if method == "POST" and path == "/api/token":
+            return ("token", 200, {"access_token": "fake_access_token_" + str(time.time()),
+                                   "token_type": "Bearer",
+                                   "expires_in": 3600,
+                                   "refresh_token": "fake_refresh_token",
+                                   "scope": "user-read-recently-played"}, {})
+
+        if not str(req_headers.get("Authorization", "")).startswith("Bearer "):
+            return ("unauthorized", 401, {"error": {"status": 401, "message": "No token provided"}}, {})
+
+        if path == "/v1/me":
+            return ("me", 200, {"id": self.library.user_id, "display_name": self.library.user_id}, {})
+
+        if path == "/v1/me/playlists":
+            return ("me/playlists",) + self._user_playlists(params)
+
+        match = re.fullmatch(r"/v1/playlists/([^/]+)/?", path)
+        if match is not None:
+            return ("playlist",) + self._playlist(match.group(1), params, req_headers)
+
+        match = re.fullmatch(r"/v1/playlists/([^/]+)/tracks", path)
+        if match is not None:
+            return ("playlist/tracks",) + self._playlist_tracks(match.group(1), params)
+
+        if path == "/v1/artists":
+            ids = [artist_id for artist_id in params.get("ids", "").split(",") if artist_id != ""]
+            if len(ids) > 50:
+                return ("artists", 400, {"error": {"status": 400, "message": "Too many ids requested"}}, {})
+            return ("artists", 200, {"artists": [self.library.artists.get(artist_id) for artist_id in ids]}, {})
+
+        match = re.fullmatch(r"/v1/artists/([^/]+)", path)
+        if match is not None:
+            artist = self.library.artists.get(match.group(1))
+            if artist is None:
+                return ("artist", 404, {"error": {"status": 404, "message": "non existing id"}}, {})
+            return ("artist", 200, artist, {})
+
+        if path == "/v1/search":
+            query = params.get("q", "").lower()
+            items = [artist for artist in self.library.artists.values() if query in artist["name"].lower()]
+            limit = int(params.get("limit", 20))
+            return ("search", 200, {"artists": {"items": items[:limit], "total": len(items)}}, {})
+
+        return ("not_found", 404, {"error": {"status": 404, "message": "Service not found"}}, {})
+
+    def _page(self, items : List, params : Dict, default_limit : int, max_limit : int, next_base : str) -> Dict:
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", default_limit)), max_limit)
+        page_items = items[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(items):
+            next_params = {key: value for key, value in params.items() if key not in ("offset", "limit")}
+            next_params.update({"offset": offset + limit, "limit": limit})
+            next_url = f"{self.base_uri}{next_base}?{urlencode(next_params)}"
+        return {"items": page_items, "total": len(items), "limit": limit, "offset": offset, "next": next_url}
+
+    def _user_playlists(self, params : Dict) -> Tuple[int, Dict, Dict]:
+        playlist_headers = [{"id": playlist["id"],
+                             "name": playlist["name"],
+                             "description": playlist["description"],
+                             "owner": playlist["owner"],
+                             "snapshot_id": self.library.get_snapshot_id(playlist["id"]),
+                             "tracks": {"total": len(playlist["tracks"])}}
+                            for playlist in self.library.playlists.values()]
+        return (200, self._page(playlist_headers, params, 20, 50, "/v1/me/playlists"), {})
+
+    def _playlist(self, playlist_id : str, params : Dict, req_headers) -> Tuple[int, Optional[Dict], Dict]:
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return (404, {"error": {"status": 404, "message": "Not found."}}, {})
+
+        snapshot_id = self.library.get_snapshot_id(playlist_id)
+        etag = '"' + hashlib.sha1(f"{snapshot_id}:{params.get('fields', '')}".encode()).hexdigest() + '"'
+        if req_headers.get("If-None-Match") == etag:
+            return (304, None, {"ETag": etag})
+
+        # Only build the first page of tracks when the fields asked for them (header-only requests are common)
+        wants_tracks = "fields" not in params or "items" in params["fields"]
+        first_tracks = [self.library.build_track(track) for track in playlist["tracks"][:100]] if wants_tracks else []
+        tracks_page = {"items": first_tracks,
+                       "total": len(playlist["tracks"]),
+                       "limit": 100,
+                       "offset": 0,
+                       "next": None}
+        if tracks_page["total"] > 100:
+            tracks_page["next"] = f"{self.base_uri}/v1/playlists/{playlist_id}/tracks?offset=100&limit=100"
+        body = {"id": playlist_id,
+                "name": playlist["name"],
+                "description": playlist["description"],
+                "owner": playlist["owner"],
+                "snapshot_id": snapshot_id,
+                "tracks": tracks_page}
+        return (200, apply_fields_filter(body, params.get("fields")), {"ETag": etag})
+
+    def _playlist_tracks(self, playlist_id : str, params : Dict) -> Tuple[int, Dict, Dict]:
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return (404, {"error": {"status": 404, "message": "Not found."}}, {})
+        page = self._page(playlist["tracks"], params, 100, 100, f"/v1/playlists/{playlist_id}/tracks")
+        page["items"] = [self.library.build_track(track) for track in page["items"]]
+        return (200, apply_fields_filter(page, params.get("fields")), {})
+
+
+def _parse_fields(fields : str) -> Dict:
+    """Parses spotify's `fields` syntax (i.e. `name,tracks(total,items(track(name)))`) into a nested dict"""
+    tree = {}
+    stack = [tree]
+    token = ""
+    for char in fields + ",":
+        if char in ",()":
+            cur_node = stack[-1]
+            if token != "":
+                for part in token.split(".")[:-1]:
+                    cur_node = cur_node.setdefault(part, {})
+                cur_node = cur_node.setdefault(token.split(".")[-1], {})
+            token = ""
+            if char == "(":
+                stack.append(cur_node)
+            elif char == ")":
+                stack.pop()
+        else:
+            token += char.strip()
+    return tree
+
+
+def _project(value, tree : Dict):
+    if len(tree) == 0:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+
+def apply_fields_filter(body : Dict, fields : Optional[str]) -> Dict:
+    """:return `body` limited to `fields`, the same way spotify applies the `fields` query param"""
+    if fields is None or fields == "":
+        return body
+    return _project(body, _parse_fields(fields))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the spotify web api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8900)
+    parser.add_argument("--num-playlists", type=int, default=20)
+    parser.add_argument("--tracks-per-playlist", type=int, default=500)
+    parser.add_argument("--num-artists", type=int, default=2000)
+    parser.add_argument("--num-albums", type=int, default=5000)
+    parser.add_argument("--num-genres", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-prob", type=float, default=0)
+    parser.add_argument("--retry-after-sec", type=int, default=1)
+    parser.add_argument("--error-prob", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake_library = SyntheticLibrary(args.num_playlists, args.tracks_per_playlist, args.num_artists,
+                                    args.num_albums, args.num_genres, seed=args.seed)
+    fake_server = FakeSpotifyServer(fake_library, args.host, args.port, args.latency_ms,
+                                    args.rate_limit_prob, args.retry_after_sec, args.error_prob, args.seed)
+    print(f"Fake spotify api serving on {fake_server.base_uri}")
+    fake_server.serve_forever()
@@ -0,0 +1,279 @@
+"""
+    @file Responsible for a compact, memory-mapped index of artist_name -> genres.
+    \nEvery genre string is stored once and artists point at them with packed integer ids, so the map costs a
+    fraction of the dict of lists it replaces. The file is mmap'd and searched in place, so looking up the artists
+    of one playlist never loads / parses the whole map
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import array
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import threading
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class GenreIndex(Mapping):
+    """Read only view of an index file written by `GenreIndex.write`.
+    \nLayout (native byte order, recorded in the header):
+    \n  header | genre name offsets | artist name offsets | artist genre offsets | genre ids | genre names | artist names
+    \nArtist names are sorted (utf-8 bytes) so an artist is found with a binary search"""
+    _MAGIC = b"AGIX"
+    _VERSION = 1
+    # magic, version, byte order (0 little / 1 big), genre id width in bytes, num genres, num artists
+    _HEADER_FORMAT = "<4sHBBII"
+    _HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+    def __init__(self, index_path : pathlib.Path) -> None:
+        """Opens (mmaps) the index. Raises ValueError if it is not a valid index written on this kind of machine"""
+        self._index_path = pathlib.Path(index_path)
+        with open(self._index_path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, byte_order, id_width, self._num_genres, self._num_artists = \
+                struct.unpack_from(self._HEADER_FORMAT, self._mmap, 0)
+            if magic != self._MAGIC or version != self._VERSION:
+                raise ValueError(f"{self._index_path} is not a genre index")
+            if byte_order != self._get_byte_order():
+                raise ValueError(f"{self._index_path} was written with a different byte order")
+
+            view = memoryview(self._mmap)
+            offset = self._HEADER_SIZE
+            self._genre_name_offsets, offset = self._cast_section(view, offset, "I", self._num_genres + 1)
+            self._artist_name_offsets, offset = self._cast_section(view, offset, "I", self._num_artists + 1)
+            self._artist_genre_offsets, offset = self._cast_section(view, offset, "I", self._num_artists + 1)
+            self._genre_ids, offset = self._cast_section(view, offset, "H" if id_width == 2 else "I",
+                                                         self._artist_genre_offsets[self._num_artists])
+            self._genre_names_start = offset
+            self._artist_names_start = offset + self._genre_name_offsets[self._num_genres]
+        except BaseException:
+            self.close()
+            raise
+
+        # genre id -> decoded name, filled in as genres are looked up so each genre string exists once
+        self._genre_names = [None] * self._num_genres
+
+    @classmethod
+    def write(cls, index_path : pathlib.Path, mapping_dict : Dict[str, List[str]]) -> None:
+        """Writes `mapping_dict` as an index. Written to a temp file and renamed, so readers never see half of it.
+        \nArtists mapped to None (failed lookups saved by older versions) are left out, so they are requested again"""
+        genre_ids = {}
+        for genres in mapping_dict.values():
+            for genre in genres or []:
+                genre_ids.setdefault(genre, len(genre_ids))
+
+        id_typecode = "H" if len(genre_ids) <= 0xFFFF else "I"
+        encoded_genres = [genre.encode("utf-8") for genre in genre_ids.keys()]
+        sorted_artists = sorted((artist.encode("utf-8"), genres) for artist, genres in mapping_dict.items()
+                                if genres is not None)
+
+        genre_name_offsets = cls._get_offsets(len(name) for name in encoded_genres)
+        artist_name_offsets = cls._get_offsets(len(name) for name, _ in sorted_artists)
+        artist_genre_offsets = cls._get_offsets(len(genres) for _, genres in sorted_artists)
+        artist_genre_ids = array.array(id_typecode, (genre_ids[genre] for _, genres in sorted_artists
+                                                     for genre in genres))
+
+        temp_path = pathlib.Path(index_path).with_name(pathlib.Path(index_path).name + ".tmp")
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(struct.pack(cls._HEADER_FORMAT, cls._MAGIC, cls._VERSION, cls._get_byte_order(),
+                                         artist_genre_ids.itemsize, len(encoded_genres), len(sorted_artists)))
+            for section in (genre_name_offsets, artist_name_offsets, artist_genre_offsets, artist_genre_ids):
+                index_file.write(section.tobytes())
+                # keep the next section aligned for its integers
+                index_file.write(b"\0" * (-index_file.tell() % 4))
+            index_file.write(b"".join(encoded_genres))
+            index_file.write(b"".join(name for name, _ in sorted_artists))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temp_path, index_path)
+
+    def close(self) -> None:
+        for section_name in ("_genre_name_offsets", "_artist_name_offsets", "_artist_genre_offsets", "_genre_ids"):
+            section = getattr(self, section_name, None)
+            if section is not None:
+                section.release()
+                setattr(self, section_name, None)
+        self._mmap.close()
+
+    def __getitem__(self, artist_name : str) -> List[str]:
+        artist_index = self._find_artist(artist_name)
+        if artist_index is None:
+            raise KeyError(artist_name)
+        start = self._artist_genre_offsets[artist_index]
+        end = self._artist_genre_offsets[artist_index + 1]
+        return [self._get_genre_name(genre_id) for genre_id in self._genre_ids[start:end]]
+
+    def __contains__(self, artist_name : object) -> bool:
+        return isinstance(artist_name, str) and self._find_artist(artist_name) is not None
+
+    def __len__(self) -> int:
+        return self._num_artists
+
+    def __iter__(self) -> Iterator[str]:
+        for artist_index in range(self._num_artists):
+            yield self._get_artist_name_bytes(artist_index).decode("utf-8")
+
+    def _find_artist(self, artist_name : str) -> Optional[int]:
+        """:return The artist's position in the sorted artist table, None if not in the index"""
+        key = artist_name.encode("utf-8")
+        low, high = 0, self._num_artists
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_artist_name_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._num_artists and self._get_artist_name_bytes(low) == key:
+            return low
+        return None
+
+    def _get_artist_name_bytes(self, artist_index : int) -> bytes:
+        start = self._artist_names_start + self._artist_name_offsets[artist_index]
+        end = self._artist_names_start + self._artist_name_offsets[artist_index + 1]
+        return self._mmap[start:end]
+
+    def _get_genre_name(self, genre_id : int) -> str:
+        genre_name = self._genre_names[genre_id]
+        if genre_name is None:
+            start = self._genre_names_start + self._genre_name_offsets[genre_id]
+            end = self._genre_names_start + self._genre_name_offsets[genre_id + 1]
+            genre_name = sys.intern(self._mmap[start:end].decode("utf-8"))
+            self._genre_names[genre_id] = genre_name
+        return genre_name
+
+    @classmethod
+    def _cast_section(cls, view : memoryview, offset : int, typecode : str, num_items : int):
+        """:return (the section as a memoryview of ints, the offset of the next (aligned) section)"""
+        end = offset + num_items * struct.calcsize(typecode)
+        return view[offset:end].cast(typecode), end + (-end % 4)
+
+    @classmethod
+    def _get_offsets(cls, lengths) -> array.array:
+        """:return The running offsets (starting at 0) of items with these lengths. One more than the items"""
+        offsets = array.array("I", [0])
+        for length in lengths:
+            offsets.append(offsets[-1] + length)
+        return offsets
+
+    @classmethod
+    def _get_byte_order(cls) -> int:
+        return 0 if sys.byteorder == "little" else 1
+
+
+class ArtistGenreLookup(Mapping):
+    def __init__(self, index_path : pathlib.Path,
+                 get_all_mappings : Callable[[], Dict[str, List[str]]],
+                 source_mtime : float,
+                 rebuild_threshold : int = constants.ARTIST_GENRE_INDEX_REBUILD_THRESHOLD,
+                 is_verbose : bool = False) -> None:
+        """Thread safe artist_name -> genres lookup: the GenreIndex + the mappings added since it was built.
+        \nThe index is only opened (and if needed built) on the first lookup.
+        \n:param `get_all_mappings` Returns the full map from the storage backend. Used to (re)build the index
+        \n:param `source_mtime` When the storage backend's map last changed. An older index file is rebuilt
+        \n:param `rebuild_threshold` Once this many artists were added since the index was built,
+            it is rebuilt in the background"""
+        self._index_path = pathlib.Path(index_path)
+        self._get_all_mappings = get_all_mappings
+        self._source_mtime = source_mtime
+        self._rebuild_threshold = rebuild_threshold
+        self._is_verbose = is_verbose
+
+        self._lock = threading.RLock()
+        self._index = None
+        self._is_rebuilding = False
+
+        # Added since the index was built. While a rebuild runs, new additions go to a fresh overlay
+        # and the frozen one is only dropped once the new index (which includes it) is swapped in
+        self._overlay = {}
+        self._frozen_overlay = {}
+
+    def add_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        """Call after the storage backend saved `new_mappings`, so lookups see them right away"""
+        with self._lock:
+            self._overlay.update(new_mappings)
+            should_rebuild = (self._index is not None and not self._is_rebuilding
+                              and len(self._overlay) >= self._rebuild_threshold)
+            if should_rebuild:
+                self._is_rebuilding = True
+                self._frozen_overlay = self._overlay
+                self._overlay = {}
+
+        if should_rebuild:
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def __getitem__(self, artist_name : str) -> List[str]:
+        with self._lock:
+            if artist_name in self._overlay:
+                return self._overlay[artist_name]
+            if artist_name in self._frozen_overlay:
+                return self._frozen_overlay[artist_name]
+            return self._get_index()[artist_name]
+
+    def __contains__(self, artist_name : object) -> bool:
+        with self._lock:
+            return (artist_name in self._overlay or artist_name in self._frozen_overlay
+                    or artist_name in self._get_index())
+
+    def __len__(self) -> int:
+        with self._lock:
+            index = self._get_index()
+            overlay_keys = self._overlay.keys() | self._frozen_overlay.keys()
+            return len(index) + sum(1 for artist_name in overlay_keys if artist_name not in index)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            overlay_keys = self._overlay.keys() | self._frozen_overlay.keys()
+            artist_names = list(overlay_keys) + [artist_name for artist_name in self._get_index()
+                                                 if artist_name not in overlay_keys]
+        return iter(artist_names)
+
+    def _get_index(self) -> GenreIndex:
+        """:return The opened index. Built from the storage backend first if missing, stale or unreadable
+        \n:pre the lock is held"""
+        if self._index is None:
+            is_fresh = self._index_path.is_file() and os.path.getmtime(self._index_path) >= self._source_mtime
+            if is_fresh:
+                try:
+                    self._index = GenreIndex(self._index_path)
+                except (ValueError, OSError, struct.error) as err:
+                    print(f"ERROR: rebuilding the unreadable genre index {self._index_path}: {err}")
+
+            if self._index is None:
+                if self._is_verbose:
+                    print(f"Building the genre index {self._index_path}")
+                GenreIndex.write(self._index_path, self._get_all_mappings())
+                self._index = GenreIndex(self._index_path)
+                self._overlay.clear()
+        return self._index
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            # The backend already has everything in the frozen overlay, so the new index includes it
+            temp_index_path = self._index_path.with_name(self._index_path.name + ".rebuild")
+            GenreIndex.write(temp_index_path, self._get_all_mappings())
+
+            with self._lock:
+                # Close before replacing, some platforms can not replace a file that is still mapped
+                self._index.close()
+                self._index = None
+                os.replace(temp_index_path, self._index_path)
+                self._index = GenreIndex(self._index_path)
+                self._frozen_overlay = {}
+
+            if self._is_verbose:
+                print(f"Rebuilt the genre index {self._index_path}")
+        except Exception as err:
+            print(f"ERROR: failed to rebuild the genre index {self._index_path}: {err}")
+            with self._lock:
+                self._overlay = {**self._frozen_overlay, **self._overlay}
+                self._frozen_overlay = {}
+        finally:
+            with self._lock:
+                self._is_rebuilding = False
@@ -1,10 +1,13 @@
 #------------------------------STANDARD DEPENDENCIES-----------------------------#
 from argparse import *
+import atexit
 import webbrowser
 
 #------------------------------Project Imports-----------------------------#
 from cli_parser import CLIParser
+from utils import Utils
 from scraper import Scraper
+from traffic_cassette import TrafficCassette
 from data_manager import DataManager
 from web_app import WebApp
 
@@ -15,13 +18,37 @@ class Main():
             args (dict): Values after parsing the CLI inputs for this program
         """
         self.args = cli_args
-        self.data_parser = DataManager()
+        Utils.set_spotify_base_uris(cli_args["spotify_api_base_uri"], cli_args["spotify_accounts_base_uri"])
+        self.data_parser = DataManager(cli_args["storage_backend"])
+
+        Scraper.configure_session(pool_connections=cli_args["pool_connections"],
+                                  pool_maxsize=cli_args["pool_maxsize"])
+        self._configure_traffic_cassette(cli_args)
 
         self.app = WebApp(cli_args['port'],
                           cli_args['debugMode'],
                           self.data_parser,
                           cli_args['verbose'],
-                          cli_args["redirect_localhost"])
+                          cli_args["redirect_localhost"],
+                          cli_args["pagination_workers"],
+                          cli_args["analysis_cache_spill"])
+
+    def _configure_traffic_cassette(self, cli_args: dict) -> None:
+        """Sets up recording / replaying of spotify traffic if asked for by the cli"""
+        if cli_args["replay_cassette"] is not None:
+            traffic_cassette = TrafficCassette(cli_args["replay_cassette"],
+                                               TrafficCassette.REPLAY_MODE,
+                                               replay_timing_scale=cli_args["replay_timing_scale"],
+                                               is_verbose=cli_args["verbose"])
+        elif cli_args["record_cassette"] is not None:
+            traffic_cassette = TrafficCassette(cli_args["record_cassette"],
+                                               TrafficCassette.RECORD_MODE,
+                                               is_verbose=cli_args["verbose"])
+            # The app runs until it is killed, so the cassette is written on the way out
+            atexit.register(traffic_cassette.save)
+        else:
+            return
+        Scraper.configure_traffic_cassette(traffic_cassette)
 
 
 if __name__ == "__main__":
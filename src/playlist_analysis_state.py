@@ -0,0 +1,171 @@
+"""
+    @file Responsible for the running artist / album / genre counts of one analyzed playlist.
+    \nThe state remembers which tracks were counted (a multiset of track keys), so when the playlist's
+    snapshot_id changes only the added / removed tracks are applied to the counts
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class PlaylistAnalysisState():
+    # Bumped whenever the saved format changes. Older states are ignored (and rebuilt from scratch)
+    _VERSION = 1
+
+    def __init__(self, playlist_id : str) -> None:
+        """The counts of a playlist that has not been analyzed yet (everything empty). Not thread safe"""
+        self.playlist_id = playlist_id
+        self.snapshot_id = None
+
+        # track key -> how many times it is in the playlist
+        self._track_counts = {}
+        # track key -> (lead artist name, lead artist spotify id, album name)
+        self._track_info = {}
+
+        self._artist_counts = {}
+        self._album_counts = {}
+        self._genre_counts = {}
+        # artist name -> the genres counted for them. Artists whose genres are unknown are left out
+        self._artist_genres = {}
+
+    @classmethod
+    def from_dict(cls, state_dict : Dict) -> Optional["PlaylistAnalysisState"]:
+        """:return The state saved by `to_dict`, None if it was saved in an older format"""
+        if state_dict.get("version") != cls._VERSION:
+            return None
+        state = cls(state_dict["playlist_id"])
+        state.snapshot_id = state_dict["snapshot_id"]
+        state._track_counts = state_dict["track_counts"]
+        state._track_info = {track_key: tuple(track_info)
+                             for track_key, track_info in state_dict["track_info"].items()}
+        state._artist_counts = state_dict["artist_counts"]
+        state._album_counts = state_dict["album_counts"]
+        state._genre_counts = state_dict["genre_counts"]
+        state._artist_genres = state_dict["artist_genres"]
+        return state
+
+    def to_dict(self) -> Dict:
+        """:return The state as a json serializable dict"""
+        return {"version": self._VERSION,
+                "playlist_id": self.playlist_id,
+                "snapshot_id": self.snapshot_id,
+                "track_counts": self._track_counts,
+                "track_info": self._track_info,
+                "artist_counts": self._artist_counts,
+                "album_counts": self._album_counts,
+                "genre_counts": self._genre_counts,
+                "artist_genres": self._artist_genres}
+
+    @classmethod
+    def get_track_key(cls, raw_track : Dict) -> str:
+        """:return What identifies a track in the multiset. Local files have no id, so they go by their names"""
+        if raw_track["id"] is not None:
+            return raw_track["id"]
+        return "local:{}:{}:{}".format(raw_track["name"], raw_track["album"]["name"], raw_track["artists"][0]["name"])
+
+    @classmethod
+    def count_tracks(cls, raw_track_pages : Iterable[List[Dict]]
+                     ) -> Tuple[Dict[str, int], Dict[str, Tuple[str, Optional[str], str]]]:
+        """:param `raw_track_pages` Iterable of lists of raw track dicts from the API call itself
+        \n:return (track key -> count, track key -> (lead artist name, lead artist spotify id, album name))"""
+        track_counts = {}
+        track_info = {}
+        for raw_track_list in raw_track_pages:
+            for raw_track in raw_track_list:
+                track_key = cls.get_track_key(raw_track)
+                num_tracks = track_counts.get(track_key)
+                if num_tracks is None:
+                    lead_artist_dict = raw_track["artists"][0]
+                    track_info[track_key] = (lead_artist_dict["name"], lead_artist_dict["id"],
+                                             raw_track["album"]["name"])
+                    num_tracks = 0
+                track_counts[track_key] = num_tracks + 1
+            # Done with this page, don't keep it alive while the next one downloads
+            del raw_track_list
+        return (track_counts, track_info)
+
+    def update(self, snapshot_id : str,
+               track_counts : Dict[str, int],
+               track_info : Dict[str, Tuple[str, Optional[str], str]],
+               get_artist_genres : Callable[[Dict[str, Optional[str]]], Mapping[str, List[str]]]) -> int:
+        """Brings the counts up to date with the playlist's current tracks (from `count_tracks`).
+        \nOnly the tracks that were added / removed since the last update touch the counts.
+        \n:param `get_artist_genres` Given {artist name -> spotify id (None for local files)} of artists new to
+            the playlist, returns the genres of the ones it could find
+        \n:return How many tracks were added + removed"""
+        # track key -> change in count
+        track_deltas = {}
+        for track_key, num_tracks in track_counts.items():
+            delta = num_tracks - self._track_counts.get(track_key, 0)
+            if delta != 0:
+                track_deltas[track_key] = delta
+        for track_key, num_tracks in self._track_counts.items():
+            if track_key not in track_counts:
+                track_deltas[track_key] = -num_tracks
+
+        artist_deltas = {}
+        new_artist_ids = {}
+        for track_key, delta in track_deltas.items():
+            cur_track_info = track_info[track_key] if track_key in track_info else self._track_info[track_key]
+            artist_name, artist_id, album_name = cur_track_info
+
+            artist_deltas[artist_name] = artist_deltas.get(artist_name, 0) + delta
+            if delta > 0 and artist_name not in self._artist_genres:
+                new_artist_ids[artist_name] = artist_id
+
+            album_name = str(album_name)
+            if album_name == "" or album_name == " ":
+                album_name = constants.DEFAULT_NO_ALBUM_NAME
+            self._add_to_count(self._album_counts, album_name, delta)
+
+            num_tracks = self._track_counts.get(track_key, 0) + delta
+            if num_tracks > 0:
+                self._track_counts[track_key] = num_tracks
+                self._track_info[track_key] = cur_track_info
+            else:
+                del self._track_counts[track_key]
+                del self._track_info[track_key]
+
+        found_artist_genres = {}
+        if len(new_artist_ids) > 0:
+            found_artist_genres = {artist_name: list(artist_genres)
+                                   for artist_name, artist_genres in get_artist_genres(new_artist_ids).items()
+                                   if artist_name in new_artist_ids and artist_genres is not None}
+        self._artist_genres.update(found_artist_genres)
+
+        for artist_name, delta in artist_deltas.items():
+            previous_num_tracks = self._artist_counts.get(artist_name, 0)
+            self._add_to_count(self._artist_counts, artist_name, delta)
+
+            artist_genres = self._artist_genres.get(artist_name)
+            if artist_genres is None:
+                continue
+            # The tracks an artist already had were never counted for a genre if their genres were just found
+            genre_delta = previous_num_tracks + delta if artist_name in found_artist_genres else delta
+            for genre in artist_genres:
+                if genre == "" or genre == " ":
+                    genre = constants.DEFAULT_NO_GENRE_NAME
+                self._add_to_count(self._genre_counts, genre, genre_delta)
+            if artist_name not in self._artist_counts:
+                del self._artist_genres[artist_name]
+
+        self.snapshot_id = snapshot_id
+        return sum(abs(delta) for delta in track_deltas.values())
+
+    def get_chart_data(self) -> Tuple[Dict[str, int], Dict[str, int], Dict[str, int]]:
+        """:return Copies of (artist counts, album counts, genre counts). Keys are not escaped for json"""
+        return (dict(self._artist_counts), dict(self._album_counts), dict(self._genre_counts))
+
+    def get_num_tracks(self) -> int:
+        return sum(self._track_counts.values())
+
+    @classmethod
+    def _add_to_count(cls, counts : Dict[str, int], key : str, delta : int) -> None:
+        """Adds `delta` to `counts[key]`, dropping the key once its count reaches 0"""
+        num = counts.get(key, 0) + delta
+        if num > 0:
+            counts[key] = num
+        else:
+            counts.pop(key, None)
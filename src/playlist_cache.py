@@ -0,0 +1,79 @@
+"""
+    @file Responsible for keeping the tracks of recently requested playlists in memory.
+    \nEntries are keyed by (playlist_id, snapshot_id). Spotify changes a playlist's snapshot_id every time
+    the playlist changes, so an entry can be served for as long as its snapshot is still the current one
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class PlaylistCache():
+    def __init__(self,
+                 max_num_tracks : int = constants.PLAYLIST_CACHE_MAX_TRACKS,
+                 max_num_headers : int = constants.PLAYLIST_CACHE_MAX_HEADERS) -> None:
+        """Thread safe LRU cache of playlist tracks, shared by every user.
+        \n:param `max_num_tracks` The most tracks kept across all playlists. Least recently used playlists are
+            dropped first. Playlists bigger than this are never cached
+        \n:param `max_num_headers` The most playlist headers (used for ETag revalidation) kept"""
+        self._max_num_tracks = max_num_tracks
+        self._max_num_headers = max_num_headers
+        self._lock = threading.Lock()
+
+        # (playlist_id, snapshot_id) -> (tracks, playlist_name, total_num_tracks)
+        self._playlist_tracks = OrderedDict()
+        self._num_tracks_cached = 0
+
+        # playlist_id -> (etag, playlist header json)
+        self._playlist_headers = OrderedDict()
+
+    def get_tracks(self, playlist_id : str, snapshot_id : str) -> Optional[Tuple[List, str, int]]:
+        """:return (tracks, playlist_name, total_num_tracks) if this snapshot is cached, None otherwise.
+        \nThe list is a copy, but the track dicts are shared so do not modify them"""
+        key = (playlist_id, snapshot_id)
+        with self._lock:
+            if key not in self._playlist_tracks:
+                return None
+            self._playlist_tracks.move_to_end(key)
+            tracks, playlist_name, total_num_tracks = self._playlist_tracks[key]
+            return (list(tracks), playlist_name, total_num_tracks)
+
+    def save_tracks(self, playlist_id : str, snapshot_id : str,
+                    tracks : List, playlist_name : str, total_num_tracks : int) -> None:
+        """Caches the tracks of this snapshot. Replaces any older snapshot of the same playlist"""
+        if snapshot_id is None or len(tracks) > self._max_num_tracks:
+            return
+
+        with self._lock:
+            for key in [key for key in self._playlist_tracks.keys() if key[0] == playlist_id]:
+                self._remove(key)
+
+            self._playlist_tracks[(playlist_id, snapshot_id)] = (list(tracks), playlist_name, total_num_tracks)
+            self._num_tracks_cached += len(tracks)
+
+            while self._num_tracks_cached > self._max_num_tracks:
+                self._remove(next(iter(self._playlist_tracks)))
+
+    def get_header(self, playlist_id : str) -> Optional[Tuple[str, Dict]]:
+        """:return (etag, playlist header json) from the last time the header was requested, None if never"""
+        with self._lock:
+            if playlist_id not in self._playlist_headers:
+                return None
+            self._playlist_headers.move_to_end(playlist_id)
+            return self._playlist_headers[playlist_id]
+
+    def save_header(self, playlist_id : str, etag : str, playlist_header : Dict) -> None:
+        with self._lock:
+            self._playlist_headers[playlist_id] = (etag, playlist_header)
+            self._playlist_headers.move_to_end(playlist_id)
+            while len(self._playlist_headers) > self._max_num_headers:
+                self._playlist_headers.popitem(last=False)
+
+    def _remove(self, key : Tuple[str, str]) -> None:
+        """:pre the lock is held"""
+        tracks = self._playlist_tracks.pop(key)[0]
+        self._num_tracks_cached -= len(tracks)
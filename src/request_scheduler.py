@@ -0,0 +1,167 @@
+"""
+    @file Responsible for pacing every outbound spotify request.
+    \nSpotify's rate limit is per app, so every user of a deployment shares one budget.
+    \nAll of Scraper's requests are sent through one RequestScheduler to stay inside it
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import requests
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class RequestScheduler():
+    def __init__(self,
+                 requests_per_sec : float = constants.SPOTIFY_RATE_LIMIT_REQUESTS_PER_SEC,
+                 burst_size : int = constants.SPOTIFY_RATE_LIMIT_BURST_SIZE,
+                 max_concurrency : int = constants.SPOTIFY_RATE_LIMIT_MAX_CONCURRENCY,
+                 max_retries : int = constants.SPOTIFY_RATE_LIMIT_MAX_RETRIES,
+                 max_retry_after_sec : float = constants.SPOTIFY_RATE_LIMIT_MAX_RETRY_AFTER_SEC,
+                 is_verbose : bool = False) -> None:
+        """Token bucket + adaptive concurrency limit that every request waits on before being sent.
+        \n:param `requests_per_sec` How fast the token bucket refills
+        \n:param `burst_size` How many tokens the bucket can hold (i.e. requests sent back to back)
+        \n:param `max_concurrency` The most requests in flight at once. Halved on every 429, grows back by 1 at a time
+        \n:param `max_retries` How many times a request that got a 429 is re-queued before giving up
+        \n:param `max_retry_after_sec` Retry-After values longer than this are returned to the caller instead of waited on
+        """
+        self._requests_per_sec = requests_per_sec
+        self._burst_size = burst_size
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._max_retry_after_sec = max_retry_after_sec
+        self._is_verbose = is_verbose
+
+        self._condition = threading.Condition()
+        self._tokens = float(burst_size)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._concurrency_limit = max_concurrency
+        self._successes_since_increase = 0
+        self._num_in_flight = 0
+
+        # monitoring
+        self._num_waiting = 0
+        self._num_sent = 0
+        self._num_rate_limited = 0
+        self._num_completed = 0
+        self._total_wait_sec = 0.0
+        self._max_wait_sec = 0.0
+
+    def submit(self, send_func : Callable[[], requests.Response]) -> requests.Response:
+        """Blocks until the request may be sent, sends it and returns its response.
+        \n:param `send_func` Sends the request. Called again (after waiting) each time spotify answers with a 429
+        \n:return The response. It is only a 429 once retries run out or spotify asks to wait too long"""
+        wait_sec = 0.0
+        num_attempts = 0
+        try:
+            while True:
+                wait_sec += self._acquire()
+                num_attempts += 1
+
+                try:
+                    res = send_func()
+                except BaseException:
+                    self._release()
+                    raise
+
+                if res.status_code != 429:
+                    self._release(was_success=True)
+                    return res
+
+                retry_after_sec = self._get_retry_after_sec(res)
+                self._release(retry_after_sec=retry_after_sec)
+
+                if num_attempts > self._max_retries or retry_after_sec > self._max_retry_after_sec:
+                    print(f"ERROR: spotify rate limit hit, giving up on {res.url} after {num_attempts} attempts")
+                    return res
+
+                if self._is_verbose:
+                    print(f"Spotify rate limit hit, waiting {retry_after_sec} sec before retrying {res.url}")
+        finally:
+            with self._condition:
+                self._num_completed += 1
+                self._total_wait_sec += wait_sec
+                self._max_wait_sec = max(self._max_wait_sec, wait_sec)
+
+    def get_stats(self) -> Dict:
+        """:return The current state of the scheduler, used for monitoring"""
+        with self._condition:
+            now = time.monotonic()
+            avg_wait_sec = self._total_wait_sec / self._num_completed if self._num_completed > 0 else 0.0
+            return {"queue_depth": self._num_waiting,
+                    "in_flight": self._num_in_flight,
+                    "concurrency_limit": self._concurrency_limit,
+                    "tokens_available": round(self._tokens, 2),
+                    "paused_for_sec": round(max(0.0, self._paused_until - now), 3),
+                    "num_sent": self._num_sent,
+                    "num_rate_limited": self._num_rate_limited,
+                    "num_completed": self._num_completed,
+                    "avg_wait_sec": round(avg_wait_sec, 4),
+                    "max_wait_sec": round(self._max_wait_sec, 4),
+                    "total_wait_sec": round(self._total_wait_sec, 4)}
+
+    def _acquire(self) -> float:
+        """Waits until a request may be sent: not paused by a Retry-After, under the concurrency limit
+        and a token is available.
+        \n:return How long it waited in sec"""
+        start_time = time.monotonic()
+        with self._condition:
+            self._num_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill_tokens(now)
+
+                    if now < self._paused_until:
+                        self._condition.wait(self._paused_until - now)
+                    elif self._num_in_flight >= self._concurrency_limit:
+                        self._condition.wait()
+                    elif self._tokens < 1:
+                        self._condition.wait((1 - self._tokens) / self._requests_per_sec)
+                    else:
+                        self._tokens -= 1
+                        self._num_in_flight += 1
+                        self._num_sent += 1
+                        break
+            finally:
+                self._num_waiting -= 1
+        return time.monotonic() - start_time
+
+    def _release(self, was_success : bool = False, retry_after_sec : Optional[float] = None) -> None:
+        """Frees the slot of a finished request and adapts the concurrency limit to how it went
+        \n:param `retry_after_sec` Set when the request was rate limited"""
+        with self._condition:
+            self._num_in_flight -= 1
+
+            if retry_after_sec is not None:
+                # Multiplicative decrease + stop everyone until spotify says it is ok again
+                self._num_rate_limited += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after_sec)
+                self._concurrency_limit = max(1, self._concurrency_limit // 2)
+                self._successes_since_increase = 0
+            elif was_success and self._concurrency_limit < self._max_concurrency:
+                # Additive increase: grow by 1 after a full "window" of successes at the current limit
+                self._successes_since_increase += 1
+                if self._successes_since_increase >= self._concurrency_limit:
+                    self._concurrency_limit += 1
+                    self._successes_since_increase = 0
+
+            self._condition.notify_all()
+
+    def _refill_tokens(self, now : float) -> None:
+        elapsed_sec = now - self._last_refill
+        self._tokens = min(float(self._burst_size), self._tokens + elapsed_sec * self._requests_per_sec)
+        self._last_refill = now
+
+    def _get_retry_after_sec(self, res : requests.Response) -> float:
+        """:return How long spotify asked to wait. Retry-After is given in seconds"""
+        try:
+            return max(0.0, float(res.headers.get("Retry-After", constants.SPOTIFY_DEFAULT_RETRY_AFTER_SEC)))
+        except ValueError:
+            return float(constants.SPOTIFY_DEFAULT_RETRY_AFTER_SEC)
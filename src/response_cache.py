@@ -0,0 +1,197 @@
+"""
+    @file Responsible for persisting slow-changing spotify responses (artists, searches) in the data dir.
+    \nBacked by sqlite so it survives restarts, can be shared by every thread and evicts in LRU order
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class ResponseCache():
+    def __init__(self,
+                 db_path : pathlib.Path,
+                 endpoint_ttl_sec : Dict[str, float] = constants.RESPONSE_CACHE_TTL_SEC,
+                 max_size_bytes : int = constants.RESPONSE_CACHE_MAX_SIZE_BYTES,
+                 stale_while_revalidate_sec : float = constants.RESPONSE_CACHE_STALE_WHILE_REVALIDATE_SEC,
+                 is_verbose : bool = False) -> None:
+        """Persistent cache of json responses keyed by the normalized url + params.
+        \n:param `endpoint_ttl_sec` Maps an endpoint name (i.e. "artist", "search") to how long its responses stay fresh
+        \n:param `max_size_bytes` Once the stored bodies are bigger than this, the least recently used are dropped
+        \n:param `stale_while_revalidate_sec` How long past its ttl an entry may still be served while it is
+            refreshed in the background. 0 to always wait for the refresh"""
+        self._endpoint_ttl_sec = endpoint_ttl_sec
+        self._max_size_bytes = max_size_bytes
+        self._stale_while_revalidate_sec = stale_while_revalidate_sec
+        self._is_verbose = is_verbose
+
+        self._lock = threading.Lock()
+        self._keys_being_revalidated = set()
+
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                cache_key   TEXT PRIMARY KEY,
+                                endpoint    TEXT NOT NULL,
+                                body        TEXT NOT NULL,
+                                size_bytes  INTEGER NOT NULL,
+                                stored_at   REAL NOT NULL,
+                                last_access REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._total_size_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses"
+                                                    ).fetchone()[0]
+
+    @classmethod
+    def make_key(cls, url : str, params : Optional[Dict] = None) -> str:
+        """:return The url + params in a normalized form (lower case scheme/host, no trailing /, sorted params)
+        so the same request always has the same key"""
+        split_url = urlsplit(url)
+        query_params = parse_qsl(split_url.query)
+        if params is not None:
+            query_params.extend((str(key), str(value)) for key, value in params.items())
+
+        path = split_url.path.rstrip("/")
+        query = urlencode(sorted(query_params))
+        return urlunsplit((split_url.scheme.lower(), split_url.netloc.lower(), path, query, ""))
+
+    def get(self, endpoint : str, url : str, params : Optional[Dict] = None) -> Tuple[Optional[Dict], bool]:
+        """:return (body, is_stale). body is None when not cached or too old to even be served stale"""
+        cache_key = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, stored_at FROM responses WHERE cache_key = ?",
+                                     (cache_key,)).fetchone()
+            if row is None:
+                return (None, False)
+
+            age_sec = now - row[1]
+            ttl_sec = self._endpoint_ttl_sec.get(endpoint, 0)
+            if age_sec > ttl_sec + self._stale_while_revalidate_sec:
+                return (None, False)
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+        return (json.loads(row[0]), age_sec > ttl_sec)
+
+    def put(self, endpoint : str, url : str, body : Dict, params : Optional[Dict] = None) -> None:
+        self.put_many(endpoint, [(self.make_key(url, params), body)])
+
+    def put_many(self, endpoint : str, key_body_pairs : List[Tuple[str, Dict]]) -> None:
+        """Stores several responses of the same endpoint in one transaction
+        \n:param `key_body_pairs` List of (cache_key, body). Make the keys with `make_key`"""
+        if len(key_body_pairs) == 0:
+            return
+
+        now = time.time()
+        rows = []
+        for cache_key, body in key_body_pairs:
+            raw_body = json.dumps(body)
+            rows.append((cache_key, endpoint, raw_body, len(raw_body), now, now))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    old_row = self._conn.execute("SELECT size_bytes FROM responses WHERE cache_key = ?",
+                                                 (row[0],)).fetchone()
+                    self._conn.execute("""INSERT OR REPLACE INTO responses
+                                          (cache_key, endpoint, body, size_bytes, stored_at, last_access)
+                                          VALUES (?, ?, ?, ?, ?, ?)""", row)
+                    self._total_size_bytes += row[3] - (0 if old_row is None else old_row[0])
+                self._evict_if_needed()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._total_size_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses"
+                                                            ).fetchone()[0]
+                raise
+
+    def get_or_fetch(self, endpoint : str, url : str, params : Optional[Dict],
+                     fetch_func : Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Serves the cached body when fresh. When stale (but within stale-while-revalidate) serves it
+        and refreshes it in the background. Otherwise calls `fetch_func` and caches what it returns.
+        \n:param `fetch_func` Requests the body from spotify. Returns None on failure (failures are not cached)"""
+        body, is_stale = self.get(endpoint, url, params)
+        if body is not None:
+            if is_stale:
+                self._revalidate_in_background(endpoint, url, params, fetch_func)
+            return body
+
+        body = fetch_func()
+        if body is not None:
+            self.put(endpoint, url, body, params)
+        return body
+
+    def _revalidate_in_background(self, endpoint : str, url : str, params : Optional[Dict],
+                                  fetch_func : Callable[[], Optional[Dict]]) -> None:
+        """Refreshes one entry on a background thread. Only one refresh per entry at a time"""
+        cache_key = self.make_key(url, params)
+        with self._lock:
+            if cache_key in self._keys_being_revalidated:
+                return
+            self._keys_being_revalidated.add(cache_key)
+
+        def revalidate() -> None:
+            try:
+                body = fetch_func()
+                if body is not None:
+                    self.put(endpoint, url, body, params)
+            except Exception as err:
+                if self._is_verbose:
+                    print(f"ERROR: failed to revalidate {cache_key}: {err}")
+            finally:
+                with self._lock:
+                    self._keys_being_revalidated.discard(cache_key)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def revalidate_many_in_background(self, url_by_item : Dict[str, str],
+                                      revalidate_func : Callable[[List[str]], object]) -> None:
+        """Same as `_revalidate_in_background`, for entries that are refreshed together (i.e. one batched request).
+        Entries already being refreshed are left out
+        \n:param `url_by_item` What to refresh (i.e. an artist id) -> the url it is cached under
+        \n:param `revalidate_func` Given the items to refresh, refreshes them and puts them in the cache"""
+        cache_key_by_item = {item: self.make_key(url) for item, url in url_by_item.items()}
+        with self._lock:
+            cache_key_by_item = {item: cache_key for item, cache_key in cache_key_by_item.items()
+                                 if cache_key not in self._keys_being_revalidated}
+            self._keys_being_revalidated.update(cache_key_by_item.values())
+        if len(cache_key_by_item) == 0:
+            return
+
+        def revalidate() -> None:
+            try:
+                revalidate_func(list(cache_key_by_item.keys()))
+            except Exception as err:
+                if self._is_verbose:
+                    print(f"ERROR: failed to revalidate {len(cache_key_by_item)} entries: {err}")
+            finally:
+                with self._lock:
+                    self._keys_being_revalidated.difference_update(cache_key_by_item.values())
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def _evict_if_needed(self) -> None:
+        """Drops the least recently used entries until under the size limit
+        \n:pre the lock is held"""
+        while self._total_size_bytes > self._max_size_bytes:
+            rows = self._conn.execute("SELECT cache_key, size_bytes FROM responses ORDER BY last_access LIMIT ?",
+                                      (constants.RESPONSE_CACHE_EVICT_BATCH_SIZE,)).fetchall()
+            if len(rows) == 0:
+                self._total_size_bytes = 0
+                break
+
+            keys_to_evict = []
+            for cache_key, size_bytes in rows:
+                if self._total_size_bytes <= self._max_size_bytes:
+                    break
+                keys_to_evict.append((cache_key,))
+                self._total_size_bytes -= size_bytes
+            self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", keys_to_evict)
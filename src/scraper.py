@@ -1,20 +1,62 @@
 #------------------------------STANDARD DEPENDENCIES-----------------------------#
 import requests
-from typing import List, Optional, Dict, Tuple
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
+from typing import List, Optional, Dict, Tuple, Iterator, Callable
 from flask import url_for
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import itertools
+import queue
 import base64
 import random
+import threading
 
 
 #------------------------------Project Imports-----------------------------#
 from utils import Utils
+from request_scheduler import RequestScheduler
+from playlist_cache import PlaylistCache
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from traffic_cassette import TrafficCassette
 import constants
 
 class Scraper():
-    def __init__(self, is_verbose: bool) -> None:
+    # One keep-alive session shared by every Scraper (and the classmethods used by Analyzer / forms)
+    # so repeated Spotify calls reuse pooled connections instead of paying a new TCP+TLS handshake
+    _session = None
+    _session_lock = threading.Lock()
+    _pool_connections = constants.SPOTIFY_SESSION_POOL_CONNECTIONS
+    _pool_maxsize = constants.SPOTIFY_SESSION_POOL_MAXSIZE
+    _pool_block = constants.SPOTIFY_SESSION_POOL_BLOCK
+
+    # Every request waits its turn here, so the whole process stays inside spotify's (per app) rate limit
+    _scheduler = RequestScheduler()
+
+    # Identical GETs that are in flight at the same time (i.e. several users analyzing overlapping playlists)
+    # wait on one outbound request instead of each spending the shared rate limit
+    _single_flight = SingleFlight()
+
+    # Tracks of recently requested playlists, shared by every user. Served while the snapshot_id is unchanged
+    _playlist_cache = PlaylistCache()
+
+    # Persistent (data dir) cache of slow changing responses - artists and searches. Opened on first use
+    _response_cache = None
+    _response_cache_lock = threading.Lock()
+    _is_response_cache_enabled = constants.RESPONSE_CACHE_ENABLED
+
+    # When set, every request is recorded to (or replayed from) a cassette file instead of only going to spotify
+    _traffic_cassette = None
+
+    def __init__(self, is_verbose: bool,
+                 max_pagination_workers : int = constants.DEFAULT_MAX_PAGINATION_WORKERS) -> None:
         """Class responsible for sending requests to Spotify API's and building up the data files as needed
+        \n:param `max_pagination_workers` How many pages of a paged result may be requested at once.
+            1 requests them one at a time
         """
         self._is_verbose = is_verbose
+        self._max_pagination_workers = max_pagination_workers
 
         # list of all currently valid states
         self._valid_auth_state_list = []
@@ -55,21 +97,13 @@ class Scraper():
                   "code": user_auth_code,
                   "redirect_uri": auth_redirect_uri}
 
-        # header param must be base64 encoded with client_id:client_secret (<base64 encoded client_id:client_secret>)
-        encoded_str = f"{client_id}:{client_secret}".encode('ascii')
-        encoded_auth_bytes = base64.b64encode(encoded_str)
-        encoded_auth_str = encoded_auth_bytes.decode()
-
-        header_auth_str = 'Basic ' + encoded_auth_str
-
-        header = constants.SPOTIFY_GET_AUTH_HEADER_FORMAT
-        header["Authorization"] = header_auth_str
+        header = self._build_client_auth_header(client_id, client_secret)
 
         get_access_token_uri = constants.SPOTIFY_TOKEN_URI
 
         # Send the request and get a response
-        req = requests.post(get_access_token_uri,
-                            params=params, headers=header)
+        req = self._send_request("POST", get_access_token_uri,
+                                 params=params, headers=header)
         access_token_res_dict = req.json()
 
         # Make sure the request is successful
@@ -94,17 +128,10 @@ class Scraper():
                   "refresh_token": refresh_token,
                     }
 
-        # header param must be base64 encoded with client_id:client_secret (<base64 encoded client_id:client_secret>)
-        encoded_str = f"{client_id}:{client_secret}".encode('ascii')
-        encoded_auth_bytes = base64.b64encode(encoded_str)
-        encoded_auth_str = encoded_auth_bytes.decode()
-
-        header_auth_str = 'Basic ' + encoded_auth_str
-        header = constants.SPOTIFY_GET_AUTH_HEADER_FORMAT
-        header["Authorization"] = header_auth_str
+        header = self._build_client_auth_header(client_id, client_secret)
 
-        req = requests.post(refresh_uri,
-                            params=params, headers=header)
+        req = self._send_request("POST", refresh_uri,
+                                 params=params, headers=header)
         refresh_access_token_res = req.json()
 
         # Make sure the request is successful
@@ -120,110 +147,414 @@ class Scraper():
     def get_user_id(self, access_token) -> str:
         """Given an access token, get the user's id
         \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/get-current-users-profile """
-        header = constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT
-        header["Authorization"] = "Bearer " + access_token
-        get_req = requests.get(constants.SPOTIFY_USER_PROFILE_URI, headers=header)
+        header = self._build_authorized_header(access_token)
+        get_req = self._send_request("GET", constants.SPOTIFY_USER_PROFILE_URI, headers=header)
         raw_res = get_req.json()
         return str(raw_res['id'])
 
 
-    def get_users_playlists(self, access_token) -> List:
-        """Given the current authenticated user, get their playlists"""
+    def get_users_playlists(self, access_token, max_workers : Optional[int] = None) -> List:
+        """Given the current authenticated user, get their playlists
+        \n:param `max_workers` How many pages to request at once. Defaults to the value given on construction"""
         # https://developer.spotify.com/documentation/web-api/reference/#/operations/get-a-list-of-current-users-playlists
+        max_workers = self._max_pagination_workers if max_workers is None else max_workers
 
         # represents everything after 'items':
         playlists = {}
 
         # hard coded into the api
-        max_num_playlists = 50
-        total_num_received = 0
+        max_num_playlists = constants.SPOTIFY_MAX_PLAYLISTS_PER_REQUEST
 
         params = {'limit': max_num_playlists,
                   'offset': 0}
-        header = constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT
-        header["Authorization"] = "Bearer " + access_token
+        header = self._build_authorized_header(access_token)
 
         # Get the id's of the playlists owned by the user
-        get_playlist_ids_res = requests.get(constants.SPOTIFY_GET_USER_PLAYLISTS_URI,
-                                            params=params,
-                                            headers=header).json()
-
-        # Keep requesting the max number of playlists until all have been found. keep adding to dict
-        while total_num_received < get_playlist_ids_res['total']:
-            num_new_playlists = 0
-            for new_playlist in get_playlist_ids_res['items']:
+        get_playlist_ids_res = self._send_request("GET",
+                                                  constants.SPOTIFY_GET_USER_PLAYLISTS_URI,
+                                                  params=params,
+                                                  headers=header).json()
+
+        # The first page says how many there are in total, so the offsets of every other page are known
+        total_num_playlists = get_playlist_ids_res['total']
+        remaining_offsets = list(range(max_num_playlists, total_num_playlists, max_num_playlists))
+
+        playlist_pages = [get_playlist_ids_res]
+        playlist_pages.extend(self._get_pages_concurrently(constants.SPOTIFY_GET_USER_PLAYLISTS_URI,
+                                                           header,
+                                                           remaining_offsets,
+                                                           max_num_playlists,
+                                                           max_workers))
+
+        # keep adding to dict
+        for playlist_page in playlist_pages:
+            for new_playlist in playlist_page['items']:
                 playlists[new_playlist['id']] = new_playlist
-                num_new_playlists += 1
-
-            # adjust the offset in the params
-            total_num_received += num_new_playlists
-            params['offset'] = total_num_received
-
-            get_playlist_ids_res = requests.get(
-                constants.SPOTIFY_GET_USER_PLAYLISTS_URI,
-                params=params,
-                headers=header).json()
         return playlists
 
-    def get_songs_from_playlist(self, playlist_id: str, access_token : str
+    def get_playlist_header(self, playlist_id : str, access_token : str) -> Dict:
+        """Gets just the playlist's name, snapshot_id and track total. Revalidated with If-None-Match,
+        so an unchanged playlist costs one tiny request (and no json body)
+        \n:return Dict of {"name", "snapshot_id", "tracks": {"total"}}
+        \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/get-playlist"""
+        header = self._build_authorized_header(access_token)
+        cached_etag_header = self._playlist_cache.get_header(playlist_id)
+        if cached_etag_header is not None:
+            header["If-None-Match"] = cached_etag_header[0]
+
+        params = {"fields": constants.SPOTIFY_PLAYLIST_HEADER_FIELDS}
+        res = self._send_request("GET", f"{constants.SPOTIFY_GET_PLAYLIST_URI}/{playlist_id}/",
+                                 params=params, headers=header)
+
+        if res.status_code == 304 and cached_etag_header is not None:
+            return cached_etag_header[1]
+
+        playlist_header = res.json()
+        etag = res.headers.get("ETag")
+        if etag is not None and res.status_code == 200:
+            self._playlist_cache.save_header(playlist_id, etag, playlist_header)
+        return playlist_header
+
+    def get_songs_from_playlist(self, playlist_id: str, access_token : str,
+                                max_workers : Optional[int] = None,
+                                is_lean : bool = True,
+                                use_cache : bool = True
                                 ) -> Tuple[List, str, str]:
         """Given a playlist id, grabs all of the songs from the playlist
+        \n:param `max_workers` How many pages to request at once. Defaults to the value given on construction.
+            1 requests them one at a time. Both ways return the exact same tracks in the same order
+        \n:param `is_lean` True to only request the track fields Analyzer uses (id, name, album name, artists).
+            False gets the full track objects
+        \n:param `use_cache` True to check the playlist's snapshot_id first and reuse the cached tracks when
+            the playlist has not changed. Only lean tracks are cached
         \n:return Tuple of (unprocessed list of tracks, playlist_name, total_num_tracks)
         \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/get-playlist
         \n:docs for return "tracks" - https://developer.spotify.com/documentation/web-api/reference/#/operations/get-track
         """
-
+        use_cache &= is_lean
+        if use_cache:
+            cached_tracks = self._get_cached_songs_from_playlist(playlist_id, access_token)
+            if cached_tracks is not None:
+                return cached_tracks
+
+        track_pages, playlist_name, total_num_tracks, snapshot_id = self._start_playlist_track_stream(
+                                                                        playlist_id, access_token,
+                                                                        max_workers, is_lean)
         tracks_in_playlist = []
-        playlist_name = None
-
-        base_playlist_url = constants.SPOTIFY_GET_PLAYLIST_URI
+        for track_list in track_pages:
+            tracks_in_playlist.extend(track_list)
 
-        next_url = f"{base_playlist_url}/{playlist_id}/"
-        header = constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT
-        header["Authorization"] = "Bearer " + access_token
-
-        # Keep grabbing tracks from the playlist until return says there are no more
-        while next_url is not None:
-            req = requests.get(next_url, headers=header).json()
-
-            # The first request will be larger than subsequent ones
-            # Following ones are JUST the vlaues after "tracks" key
-            track_list = []
-            res_top_level = req
-            if "tracks" in req:
-                res_top_level = req["tracks"]
-                total_num_tracks = res_top_level['total']
-                playlist_name = req["name"]
-
-            next_url = res_top_level["next"]
-            track_list = res_top_level["items"]
+        if use_cache:
+            self._playlist_cache.save_tracks(playlist_id, snapshot_id,
+                                             tracks_in_playlist, playlist_name, total_num_tracks)
+        return (tracks_in_playlist, playlist_name, total_num_tracks)
 
+    def stream_songs_from_playlist(self, playlist_id: str, access_token : str,
+                                   max_workers : Optional[int] = None,
+                                   use_cache : bool = True,
+                                   snapshot_id : Optional[str] = None
+                                   ) -> Tuple[Iterator[List], str, int]:
+        """Same as `get_songs_from_playlist`, but the tracks are given back one page at a time as they arrive
+        so they can be processed while later pages are still downloading.
+        \nOnly the first page has been requested when this returns. A streamed playlist is not added to the cache
+        (that would keep every page in memory), but a cached one is streamed from memory
+        \n:param `snapshot_id` The playlist's current snapshot_id if the caller already has it (i.e. from
+            `get_playlist_header`), so it is not requested again to check the cache
+        \n:return Tuple of (iterator of lists of unprocessed tracks, playlist_name, total_num_tracks)"""
+        if use_cache:
+            cached_tracks = self._get_cached_songs_from_playlist(playlist_id, access_token, snapshot_id)
+            if cached_tracks is not None:
+                tracks_in_playlist, playlist_name, total_num_tracks = cached_tracks
+                page_limit = constants.SPOTIFY_MAX_PLAYLIST_TRACKS_PER_REQUEST
+                track_pages = (tracks_in_playlist[page_start:page_start + page_limit]
+                               for page_start in range(0, len(tracks_in_playlist), page_limit))
+                return (track_pages, playlist_name, total_num_tracks)
+
+        track_pages, playlist_name, total_num_tracks, _ = self._start_playlist_track_stream(playlist_id,
+                                                                                          access_token,
+                                                                                          max_workers,
+                                                                                          is_lean=True)
+        return (track_pages, playlist_name, total_num_tracks)
+
+    def stream_songs_from_playlists(self, playlist_snapshot_ids : Dict[str, Optional[str]], access_token : str,
+                                    max_playlist_workers : int = constants.LIBRARY_ANALYSIS_MAX_PLAYLIST_WORKERS,
+                                    max_queued_pages : int = constants.LIBRARY_ANALYSIS_MAX_QUEUED_PAGES
+                                    ) -> Iterator[List]:
+        """Streams the tracks of several playlists at once (see `stream_songs_from_playlist`).
+        Pages are given back in the order they arrive, so pages of different playlists are mixed.
+        \nAt most `max_queued_pages` pages wait to be used, so memory stays bounded no matter how big the playlists.
+        A playlist that fails is skipped (and printed), the others keep going
+        \n:param `playlist_snapshot_ids` playlist_id -> its current snapshot_id (i.e. from `get_users_playlists`),
+            so the cache can be checked without requesting every playlist's header. None if not known
+        \n:param `max_playlist_workers` How many playlists are streamed at once
+        \n:return iterator of lists of unprocessed tracks"""
+        if len(playlist_snapshot_ids) == 0:
+            return
+
+        # Each worker puts its playlist's pages, then None once it is done
+        page_queue = queue.Queue(maxsize=max_queued_pages)
+        is_stopped = threading.Event()
+
+        def put_page(item) -> bool:
+            """:return False if the caller stopped using the pages"""
+            while not is_stopped.is_set():
+                try:
+                    page_queue.put(item, timeout=constants.LIBRARY_ANALYSIS_QUEUE_POLL_SEC)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def stream_playlist(playlist_id : str) -> None:
+            try:
+                track_pages, _, _ = self.stream_songs_from_playlist(
+                    playlist_id, access_token, snapshot_id=playlist_snapshot_ids[playlist_id])
+                for track_list in track_pages:
+                    if not put_page(track_list):
+                        return
+            except Exception as err:
+                if not is_stopped.is_set():
+                    print(f"ERROR: skipping playlist {playlist_id}, failed to get its tracks: {err}")
+            finally:
+                put_page(None)
+
+        executor = ThreadPoolExecutor(max_workers=min(max_playlist_workers, len(playlist_snapshot_ids)),
+                                      thread_name_prefix="playlist_stream")
+        for playlist_id in playlist_snapshot_ids:
+            executor.submit(stream_playlist, playlist_id)
+
+        try:
+            num_playlists_left = len(playlist_snapshot_ids)
+            while num_playlists_left > 0:
+                track_list = page_queue.get()
+                if track_list is None:
+                    num_playlists_left -= 1
+                    continue
+                yield track_list
+        finally:
+            # only matters when the caller stops early
+            is_stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_cached_songs_from_playlist(self, playlist_id : str, access_token : str,
+                                        snapshot_id : Optional[str] = None
+                                        ) -> Optional[Tuple[List, str, int]]:
+        """Checks the playlist's current snapshot_id against the cache
+        \n:param `snapshot_id` The current snapshot_id if already known. None requests the playlist's header
+        \n:return The cached (tracks, playlist_name, total_num_tracks), None if not cached / out of date"""
+        if snapshot_id is None:
+            snapshot_id = self.get_playlist_header(playlist_id, access_token).get("snapshot_id")
+        cached_tracks = self._playlist_cache.get_tracks(playlist_id, snapshot_id)
+        if cached_tracks is not None and self._is_verbose:
+            print(f"Using the cached tracks of playlist {playlist_id} (snapshot {snapshot_id})")
+        return cached_tracks
+
+    def _start_playlist_track_stream(self, playlist_id: str, access_token : str,
+                                     max_workers : Optional[int], is_lean : bool
+                                     ) -> Tuple[Iterator[List], str, int, Optional[str]]:
+        """Requests the first page of the playlist, the rest are requested as the returned iterator is used
+        \n:return Tuple of (iterator of lists of unprocessed tracks, playlist_name, total_num_tracks, snapshot_id)"""
+        max_workers = self._max_pagination_workers if max_workers is None else max_workers
 
+        base_playlist_url = constants.SPOTIFY_GET_PLAYLIST_URI
+        header = self._build_authorized_header(access_token)
+        playlist_params = {"fields": constants.SPOTIFY_PLAYLIST_FIELDS} if is_lean else None
+        tracks_params = {"fields": constants.SPOTIFY_PLAYLIST_TRACKS_FIELDS} if is_lean else None
+
+        # The first request will be larger than subsequent ones
+        # It has the playlist info and the first page of values within "tracks"
+        req = self._send_request("GET", f"{base_playlist_url}/{playlist_id}/",
+                                 params=playlist_params, headers=header).json()
+        res_top_level = req["tracks"]
+        total_num_tracks = res_top_level['total']
+        playlist_name = req["name"]
+
+        # The total is known after the 1st request, so every remaining offset is too
+        # Note: after 1st request, response is ONLY values within "tracks"
+        page_limit = res_top_level["limit"]
+        remaining_offsets = [] if res_top_level["next"] is None else list(range(page_limit,
+                                                                               total_num_tracks,
+                                                                               page_limit))
+        tracks_url = f"{base_playlist_url}/{playlist_id}/tracks"
+
+        def iter_track_pages() -> Iterator[List]:
             # see https://developer.spotify.com/documentation/web-api/reference/#/operations/get-track
             # for description of what each track looks like
-            # Note: after 1st request, response is ONLY values within "tracks"
-            for track in track_list:
-                tracks_in_playlist.append(track["track"])
-
-        return (tracks_in_playlist, playlist_name, total_num_tracks)
+            yield self._get_tracks_from_items(playlist_id, res_top_level["items"])
+            for page_res in self._iter_pages_concurrently(tracks_url,
+                                                          header,
+                                                          remaining_offsets,
+                                                          page_limit,
+                                                          max_workers,
+                                                          tracks_params):
+                yield self._get_tracks_from_items(playlist_id, page_res["items"])
+
+        return (iter_track_pages(), playlist_name, total_num_tracks, req.get("snapshot_id"))
+
+    def _get_tracks_from_items(self, playlist_id : str, playlist_items : List[Dict]) -> List[Dict]:
+        """:param `playlist_items` The "items" of a page of the playlist's tracks
+        \n:return The tracks of the items. Items that are not tracks (podcast episodes), tracks that are no longer
+            available (null) and tracks without an artist are skipped, nothing can be analyzed about them"""
+        tracks = []
+        for item in playlist_items:
+            track = item.get("track")
+            if track is None or track.get("type", "track") != "track" or len(track.get("artists") or []) == 0:
+                if self._is_verbose:
+                    print(f"Skipping an item of playlist {playlist_id} that is not a track: {track}")
+                continue
+            tracks.append(track)
+        return tracks
+
+    def _get_pages_concurrently(self,
+                                url : str,
+                                header : Dict,
+                                offsets : List[int],
+                                page_limit : int,
+                                max_workers : int,
+                                params : Optional[Dict] = None) -> List[Dict]:
+        """Requests one page of a paged spotify endpoint per offset using a bounded pool of workers
+        \n:param `offsets` The offset of every page to request
+        \n:param `page_limit` The number of items per page
+        \n:param `max_workers` How many pages to request at once. 1 requests them one at a time
+        \n:param `params` Any other query params to send with every page
+        \n:return The json of every page, in the same order as `offsets`"""
+        return list(self._iter_pages_concurrently(url, header, offsets, page_limit, max_workers, params))
+
+    def _iter_pages_concurrently(self,
+                                 url : str,
+                                 header : Dict,
+                                 offsets : List[int],
+                                 page_limit : int,
+                                 max_workers : int,
+                                 params : Optional[Dict] = None) -> Iterator[Dict]:
+        """Same as `_get_pages_concurrently`, but each page is given back as soon as it (and every page before it)
+        has arrived. At most 2 * `max_workers` pages are requested ahead of the one being used"""
+        if len(offsets) == 0:
+            return
+
+        base_params = {} if params is None else params
+
+        def get_page(offset : int) -> Dict:
+            page_params = dict(base_params)
+            page_params.update({"offset": offset, "limit": page_limit})
+            return self._send_request("GET", url, params=page_params, headers=header).json()
+
+        # Keep grabbing pages one at a time
+        if max_workers <= 1:
+            for offset in offsets:
+                yield get_page(offset)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(offsets)))
+        offsets_to_request = iter(offsets)
+        pending_pages = deque(executor.submit(get_page, offset)
+                              for offset in itertools.islice(offsets_to_request, 2 * max_workers))
+        try:
+            while len(pending_pages) > 0:
+                # the futures are kept in offset order, so waiting on the oldest keeps the pages in order
+                page_res = pending_pages.popleft().result()
+                next_offset = next(offsets_to_request, None)
+                if next_offset is not None:
+                    pending_pages.append(executor.submit(get_page, next_offset))
+                yield page_res
+        finally:
+            # only matters when the caller stops early
+            for pending_page in pending_pages:
+                pending_page.cancel()
+            executor.shutdown(wait=False)
 
     @classmethod
     def get_artist_info(cls, artist_url : str, access_token : str) -> Optional[List[str]]:
         """Given the spotify url to request, returns info about the artist
         \n: return List of genres
         \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/get-an-artist """
-        header = constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT
-        header["Authorization"] = "Bearer " + access_token
-        raw_artist_res = requests.get(artist_url, headers=header)
-
-        if (
-            raw_artist_res.status_code != 204 and
-            raw_artist_res.headers["content-type"].strip().startswith("application/json")
-        ):
-            artist_req = raw_artist_res.json()
-            return artist_req["genres"]
-        else:
-            return None
+        header = cls._build_authorized_header(access_token)
+
+        def request_artist() -> Optional[Dict]:
+            raw_artist_res = cls._send_request("GET", artist_url, headers=header)
+            if (
+                raw_artist_res.status_code == 200 and
+                raw_artist_res.headers["content-type"].strip().startswith("application/json")
+            ):
+                return raw_artist_res.json()
+            else:
+                return None
+
+        artist_req = cls._get_cached_response(constants.RESPONSE_CACHE_ARTIST_ENDPOINT, artist_url, None,
+                                              request_artist)
+        return None if artist_req is None else artist_req["genres"]
+
+    @classmethod
+    def get_several_artists_info(cls, artist_ids : List[str], access_token : str) -> Dict[str, List[str]]:
+        """Given a list of artist ids, gets the info of all of them in as few requests as possible.
+        Artists in the response cache are not requested again
+        \n: return Dict of artist_id -> List of genres. Artists that could not be found are left out
+        \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/get-multiple-artists """
+        artist_id_to_genres = {}
+        header = cls._build_authorized_header(access_token)
+        response_cache = cls._get_response_cache()
+        artist_endpoint = constants.RESPONSE_CACHE_ARTIST_ENDPOINT
+
+        # remove duplicates but keep the order
+        unique_artist_ids = list(dict.fromkeys(artist_ids))
+
+        # Each artist is cached under its own url, the same one get_artist_info uses
+        ids_to_request = []
+        stale_ids = []
+        for artist_id in unique_artist_ids:
+            cached_artist, is_stale = (None, False) if response_cache is None else \
+                response_cache.get(artist_endpoint, constants.SPOTIFY_ARTIST_BASE_URI + artist_id)
+            if cached_artist is None:
+                ids_to_request.append(artist_id)
+                continue
+            artist_id_to_genres[artist_id] = cached_artist["genres"]
+            if is_stale:
+                stale_ids.append(artist_id)
+
+        for artist_dict in cls._request_several_artists(ids_to_request, header):
+            artist_id_to_genres[artist_dict["id"]] = artist_dict["genres"]
+
+        if len(stale_ids) > 0:
+            # stale-while-revalidate: already answered with the stale genres, refresh them for next time.
+            # Artists already being refreshed (by an earlier call) are not requested again
+            response_cache.revalidate_many_in_background(
+                {artist_id: constants.SPOTIFY_ARTIST_BASE_URI + artist_id for artist_id in stale_ids},
+                lambda artist_ids_to_refresh: cls._request_several_artists(artist_ids_to_refresh, header))
+        return artist_id_to_genres
+
+    @classmethod
+    def _request_several_artists(cls, artist_ids : List[str], header : Dict) -> List[Dict]:
+        """Requests the artists in batches and adds them to the response cache
+        \n:return The artist dicts spotify found"""
+        found_artists = []
+
+        # hard coded into the api
+        max_ids_per_request = constants.SPOTIFY_MAX_ARTISTS_PER_REQUEST
+
+        for batch_start in range(0, len(artist_ids), max_ids_per_request):
+            batch_ids = artist_ids[batch_start:batch_start + max_ids_per_request]
+            params = {"ids": ",".join(batch_ids)}
+            raw_artists_res = cls._send_request("GET",
+                                                constants.SPOTIFY_GET_SEVERAL_ARTISTS_URI,
+                                                params=params,
+                                                headers=header)
+            if (
+                raw_artists_res.status_code != 200 or
+                not raw_artists_res.headers.get("content-type", "").strip().startswith("application/json")
+            ):
+                continue
+
+            # spotify returns null in place of any id it does not know
+            found_artists.extend(artist_dict for artist_dict in raw_artists_res.json().get("artists", [])
+                                 if artist_dict is not None)
+
+        response_cache = cls._get_response_cache()
+        if response_cache is not None:
+            response_cache.put_many(constants.RESPONSE_CACHE_ARTIST_ENDPOINT,
+                                    [(response_cache.make_key(constants.SPOTIFY_ARTIST_BASE_URI + artist_dict["id"]),
+                                      artist_dict)
+                                     for artist_dict in found_artists])
+        return found_artists
 
     @classmethod
     def check_if_artist_exists(cls, artist_name : str, access_token : str) -> Optional[Dict]:
@@ -234,29 +565,190 @@ class Scraper():
         \n:docs https://developer.spotify.com/documentation/web-api/reference/#/operations/search """
         res = None
         url = constants.SPOTIFY_ITEM_SEARCH_URI
-        header = constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT
-        header["Authorization"] = "Bearer " + access_token
+        header = cls._build_authorized_header(access_token)
 
         params = {
             "q": artist_name,
             "type": "artist"
         }
 
-        raw_req = requests.get(url,
-                               params=params,
-                               headers=header)
-        if (
-            raw_req.status_code != 204 and
-            raw_req.headers["content-type"].strip().startswith("application/json")
-        ):
-            item_search_res = raw_req.json()
-            if "artists" in item_search_res:
-                # If the artist exists, items will be populated
-                items = item_search_res["artists"]["items"]
-
-                # check for an exact match (ignore capitalization)
-                for item in items:
-                    if str(item["name"]).lower() == str(artist_name).lower():
-                        res = item
-                        break
+        def request_search() -> Optional[Dict]:
+            raw_req = cls._send_request("GET",
+                                        url,
+                                        params=params,
+                                        headers=header)
+            if (
+                raw_req.status_code == 200 and
+                raw_req.headers["content-type"].strip().startswith("application/json")
+            ):
+                return raw_req.json()
+            else:
+                return None
+
+        item_search_res = cls._get_cached_response(constants.RESPONSE_CACHE_SEARCH_ENDPOINT, url, params,
+                                                   request_search)
+        if item_search_res is not None and "artists" in item_search_res:
+            # If the artist exists, items will be populated
+            items = item_search_res["artists"]["items"]
+
+            # check for an exact match (ignore capitalization)
+            for item in items:
+                if str(item["name"]).lower() == str(artist_name).lower():
+                    res = item
+                    break
         return res
+
+    @classmethod
+    def configure_response_cache(cls, response_cache : Optional[ResponseCache]) -> None:
+        """Replaces the persistent cache used for artist / search responses. None turns the cache off"""
+        with cls._response_cache_lock:
+            cls._response_cache = response_cache
+            cls._is_response_cache_enabled = response_cache is not None
+
+    @classmethod
+    def _get_response_cache(cls) -> Optional[ResponseCache]:
+        """:return The persistent response cache (opened on first use), None if it is turned off"""
+        with cls._response_cache_lock:
+            if cls._response_cache is None and cls._is_response_cache_enabled:
+                cache_path = Utils.get_data_dir_path() / constants.RESPONSE_CACHE_FILENAME
+                cls._response_cache = ResponseCache(cache_path)
+            return cls._response_cache
+
+    @classmethod
+    def _get_cached_response(cls, endpoint : str, url : str, params : Optional[Dict],
+                             request_func : Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """:param `request_func` Requests the json from spotify, None on failure
+        \n:return The json from the response cache if it has it, otherwise from `request_func`"""
+        response_cache = cls._get_response_cache()
+        if response_cache is None:
+            return request_func()
+        return response_cache.get_or_fetch(endpoint, url, params, request_func)
+
+    @classmethod
+    def configure_session(cls,
+                          pool_connections : int = constants.SPOTIFY_SESSION_POOL_CONNECTIONS,
+                          pool_maxsize : int = constants.SPOTIFY_SESSION_POOL_MAXSIZE,
+                          pool_block : bool = constants.SPOTIFY_SESSION_POOL_BLOCK) -> None:
+        """Sets the limits of the shared connection pool. The next request builds a session with them.
+        \n:param `pool_connections` The number of per-host pools to keep (i.e. api + accounts hosts)
+        \n:param `pool_maxsize` The max number of keep-alive connections per host
+        \n:param `pool_block` True to make callers wait for a free connection once a host hits `pool_maxsize`"""
+        with cls._session_lock:
+            old_session = cls._session
+            cls._pool_connections = pool_connections
+            cls._pool_maxsize = pool_maxsize
+            cls._pool_block = pool_block
+            cls._session = None
+
+        if old_session is not None:
+            old_session.close()
+
+    @classmethod
+    def configure_scheduler(cls, scheduler : RequestScheduler) -> None:
+        """Replaces the scheduler every request is sent through (i.e. to change the rate limits)"""
+        cls._scheduler = scheduler
+
+    @classmethod
+    def get_scheduler_stats(cls) -> Dict:
+        """:return The queue depth, wait times, etc. of the outbound request scheduler"""
+        return cls._scheduler.get_stats()
+
+    @classmethod
+    def get_request_stats(cls) -> Dict:
+        """:return The stats of the outbound scheduler and of how many requests were coalesced"""
+        stats = {"scheduler": cls._scheduler.get_stats(),
+                 "coalescing": cls._single_flight.get_stats()}
+        if cls._traffic_cassette is not None:
+            stats["cassette"] = cls._traffic_cassette.get_stats()
+        return stats
+
+    @classmethod
+    def configure_traffic_cassette(cls, traffic_cassette : Optional[TrafficCassette]) -> None:
+        """Records every request to / replays every request from this cassette. None talks to spotify directly"""
+        cls._traffic_cassette = traffic_cassette
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """:return The process-wide pooled session, creating it on first use"""
+        with cls._session_lock:
+            if cls._session is None:
+                cls._session = cls._create_session()
+            return cls._session
+
+    @classmethod
+    def _create_session(cls) -> requests.Session:
+        """Builds a keep-alive session whose pools are shared by every thread.
+        \nNOTE: headers are never set on the session itself, they are built per request"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=cls._pool_connections,
+                              pool_maxsize=cls._pool_maxsize,
+                              pool_block=cls._pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        # The session is shared between users, so never keep cookies from one user's response for the next
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    @classmethod
+    def _send_request(cls, method : str, url : str,
+                      params : Optional[Dict] = None,
+                      headers : Optional[Dict] = None) -> requests.Response:
+        """Every call to spotify goes through here so they all share the pooled session and rate limit.
+        \nWhen spotify answers with a 429 the request is queued again until Retry-After has passed.
+        \nGETs identical to one already in flight share its response instead of being sent again
+        \nWith a traffic cassette configured, requests are recorded to it or replayed from it
+        \n:param `method` The HTTP method (i.e. "GET" or "POST")
+        \n:return The raw response. NOTE: may be shared with other callers, do not modify it"""
+        session = cls.get_session()
+        traffic_cassette = cls._traffic_cassette
+
+        def send_over_network() -> requests.Response:
+            return session.request(method, url,
+                                   params=params,
+                                   headers=headers,
+                                   timeout=constants.SPOTIFY_REQUEST_TIMEOUT_SEC)
+
+        def send() -> requests.Response:
+            if traffic_cassette is None:
+                return cls._scheduler.submit(send_over_network)
+            if traffic_cassette.mode == TrafficCassette.REPLAY_MODE:
+                # Replayed responses cost no quota, so they skip the rate limit
+                return traffic_cassette.send(method, url, params, send_over_network)
+            return cls._scheduler.submit(lambda: traffic_cassette.send(method, url, params, send_over_network))
+
+        if method != "GET":
+            return send()
+        return cls._single_flight.do(cls._make_request_key(method, url, params, headers), send)
+
+    @classmethod
+    def _make_request_key(cls, method : str, url : str, params : Optional[Dict], headers : Optional[Dict]) -> Tuple:
+        """:return The key that identifies identical requests for coalescing.
+        \nThe bearer token is part of the key (a user's playlists are only shared with that user),
+        except for public catalog data (artists, search) which is the same no matter who asks"""
+        normalized_url = ResponseCache.make_key(url, params)
+        is_public_catalog = normalized_url.startswith((ResponseCache.make_key(constants.SPOTIFY_GET_SEVERAL_ARTISTS_URI),
+                                                       ResponseCache.make_key(constants.SPOTIFY_ITEM_SEARCH_URI)))
+        header_items = tuple(sorted((key, value) for key, value in (headers or {}).items()
+                                    if not (is_public_catalog and key == "Authorization")))
+        return (method, normalized_url, header_items)
+
+    @classmethod
+    def _build_authorized_header(cls, access_token : str) -> Dict:
+        """:return A new header dict for requests made on behalf of an authorized user.
+        \nBuilt per request so concurrent users never share / overwrite each other's bearer token"""
+        header = dict(constants.SPOTIFY_AUTHORIZED_HEADER_FORMAT)
+        header["Authorization"] = "Bearer " + access_token
+        return header
+
+    @classmethod
+    def _build_client_auth_header(cls, client_id : str, client_secret : str) -> Dict:
+        """:return A new header dict used to obtain/refresh an access token"""
+        # header param must be base64 encoded with client_id:client_secret (<base64 encoded client_id:client_secret>)
+        encoded_str = f"{client_id}:{client_secret}".encode('ascii')
+        encoded_auth_bytes = base64.b64encode(encoded_str)
+        encoded_auth_str = encoded_auth_bytes.decode()
+
+        header = dict(constants.SPOTIFY_GET_AUTH_HEADER_FORMAT)
+        header["Authorization"] = 'Basic ' + encoded_auth_str
+        return header
@@ -0,0 +1,62 @@
+"""
+    @file Responsible for collapsing identical concurrent calls into one.
+    \nWhile a call for a key is in flight, every other caller asking for the same key waits for it and shares its result
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+class _InFlightCall():
+    def __init__(self) -> None:
+        self.done_event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    def __init__(self) -> None:
+        """Thread safe. Results are only shared between calls that overlap in time, nothing is cached after"""
+        self._lock = threading.Lock()
+        self._in_flight_calls = {}
+
+        # monitoring
+        self._num_calls = 0
+        self._num_shared = 0
+
+    def do(self, key : Hashable, func : Callable[[], Any]) -> Any:
+        """Runs `func`, unless a call with the same key is already running. Then waits for it and returns its result
+        \n:return The result of `func` (or the in flight call). Raises what it raised"""
+        with self._lock:
+            self._num_calls += 1
+            in_flight_call = self._in_flight_calls.get(key)
+            is_leader = in_flight_call is None
+            if is_leader:
+                in_flight_call = _InFlightCall()
+                self._in_flight_calls[key] = in_flight_call
+            else:
+                self._num_shared += 1
+
+        if not is_leader:
+            in_flight_call.done_event.wait()
+            if in_flight_call.error is not None:
+                raise in_flight_call.error
+            return in_flight_call.result
+
+        try:
+            in_flight_call.result = func()
+            return in_flight_call.result
+        except BaseException as err:
+            in_flight_call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight_calls[key]
+            in_flight_call.done_event.set()
+
+    def get_stats(self) -> Dict:
+        """:return How many calls were made and how many of them shared another call's result"""
+        with self._lock:
+            return {"num_calls": self._num_calls,
+                    "num_shared": self._num_shared,
+                    "num_in_flight": len(self._in_flight_calls)}
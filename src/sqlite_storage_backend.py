@@ -0,0 +1,227 @@
+"""
+    @file Responsible for keeping the users, the artist -> genres map and playlist analyses in one sqlite database.
+    \nUpdates only touch the rows that changed instead of rewriting a whole json file,
+    and WAL mode lets readers keep going while a write is in progress
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+#------------------------------Project Imports-----------------------------#
+from storage_backend import StorageBackend
+from artist_genre_journal import ArtistGenreJournal
+import constants
+
+class SqliteStorageBackend(StorageBackend):
+    name = constants.STORAGE_BACKEND_SQLITE
+
+    _USER_COLUMNS = ("access_token", "valid_until", "refresh_token")
+    _MIGRATED_FROM_JSON_KEY = "migrated_from_json"
+    _ARTIST_GENRES_UPDATED_AT_KEY = "artist_genres_updated_at"
+
+    def __init__(self, db_path : pathlib.Path,
+                 batch_size : int = constants.SQLITE_STORAGE_BATCH_SIZE,
+                 is_verbose : bool = False) -> None:
+        """:param `db_path` The database file. Created (with its tables) if it does not exist
+        \n:param `batch_size` How many rows are sent to sqlite per statement when upserting / looking up many"""
+        self._batch_size = batch_size
+        self._is_verbose = is_verbose
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id         TEXT PRIMARY KEY,
+                access_token    TEXT,
+                valid_until     REAL,
+                refresh_token   TEXT);
+            CREATE TABLE IF NOT EXISTS artists (
+                artist_id       INTEGER PRIMARY KEY,
+                name            TEXT NOT NULL UNIQUE);
+            CREATE TABLE IF NOT EXISTS genres (
+                genre_id        INTEGER PRIMARY KEY,
+                name            TEXT NOT NULL UNIQUE);
+            CREATE TABLE IF NOT EXISTS artist_genres (
+                artist_id       INTEGER NOT NULL REFERENCES artists (artist_id) ON DELETE CASCADE,
+                position        INTEGER NOT NULL,
+                genre_id        INTEGER NOT NULL REFERENCES genres (genre_id),
+                PRIMARY KEY (artist_id, position));
+            CREATE INDEX IF NOT EXISTS artist_genres_genre_id ON artist_genres (genre_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key             TEXT PRIMARY KEY,
+                value           TEXT);
+            CREATE TABLE IF NOT EXISTS playlist_analyses (
+                playlist_id     TEXT PRIMARY KEY,
+                state           TEXT NOT NULL);""")
+
+    def get_user(self, user_id : str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT access_token, valid_until, refresh_token FROM users WHERE user_id = ?",
+                                     (user_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self._USER_COLUMNS, row))
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, access_token, valid_until, refresh_token FROM users").fetchall()
+        return {row[0]: dict(zip(self._USER_COLUMNS, row[1:])) for row in rows}
+
+    def has_user(self, user_id : str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def save_user(self, user_id : str, user_dict : Dict) -> None:
+        with self._lock:
+            self._upsert_users({user_id: user_dict})
+
+    def update_user(self, user_id : str, updates : Dict) -> bool:
+        columns = [column for column in self._USER_COLUMNS if column in updates]
+        with self._lock:
+            if len(columns) == 0:
+                return self._conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+            set_str = ", ".join(f"{column} = ?" for column in columns)
+            cursor = self._conn.execute(f"UPDATE users SET {set_str} WHERE user_id = ?",
+                                        [updates[column] for column in columns] + [user_id])
+            return cursor.rowcount > 0
+
+    def remove_user(self, user_id : str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    def get_users_version(self) -> int:
+        # Only changes when another connection commits (to any table), so it can change without the users changing
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_artist_genre_mappings(self) -> Dict[str, List[str]]:
+        with self._lock:
+            rows = self._conn.execute("""SELECT artists.name, genres.name FROM artists
+                                         LEFT JOIN artist_genres ON artist_genres.artist_id = artists.artist_id
+                                         LEFT JOIN genres ON genres.genre_id = artist_genres.genre_id
+                                         ORDER BY artists.artist_id, artist_genres.position""").fetchall()
+
+        mapping_dict = {}
+        for artist_name, genre_name in rows:
+            genres = mapping_dict.setdefault(artist_name, [])
+            if genre_name is not None:
+                genres.append(genre_name)
+        return mapping_dict
+
+    def update_artist_genre_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        if len(new_mappings) == 0:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._upsert_artist_genres(new_mappings)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_artist_genre_last_modified(self) -> float:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?",
+                                     (self._ARTIST_GENRES_UPDATED_AT_KEY,)).fetchone()
+        return float(row[0]) if row is not None else 0.0
+
+    def get_playlist_analysis_state(self, playlist_id : str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM playlist_analyses WHERE playlist_id = ?",
+                                     (playlist_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save_playlist_analysis_state(self, playlist_id : str, state_dict : Dict) -> None:
+        state_json = json.dumps(state_dict, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO playlist_analyses (playlist_id, state) VALUES (?, ?)",
+                               (playlist_id, state_json))
+
+    def migrate_from_json(self, user_data_path : pathlib.Path, artist_genre_path : pathlib.Path) -> bool:
+        """One-shot import of the json files used by the json backend. Does nothing once it has run.
+        \nThe json files are left alone, so switching back to the json backend still works
+        \n:return True if the files were imported by this call"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?",
+                                  (self._MIGRATED_FROM_JSON_KEY,)).fetchone() is not None:
+                return False
+
+            users = self._read_json_file(user_data_path)
+            # The json backend's map is its snapshot + journal
+            mapping_dict = ArtistGenreJournal(artist_genre_path).get_mappings()
+
+            self._conn.execute("BEGIN")
+            try:
+                self._upsert_users(users)
+                self._upsert_artist_genres(mapping_dict)
+                self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                   (self._MIGRATED_FROM_JSON_KEY, json.dumps([str(user_data_path),
+                                                                              str(artist_genre_path)])))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if self._is_verbose:
+            print(f"Migrated {len(users)} users and {len(mapping_dict)} artists from json to sqlite")
+        return True
+
+    def _upsert_users(self, users : Dict[str, Dict]) -> None:
+        """:pre the lock is held"""
+        rows = [(user_id,) + tuple(user_dict.get(column) for column in self._USER_COLUMNS)
+                for user_id, user_dict in users.items()]
+        self._conn.executemany("""INSERT INTO users (user_id, access_token, valid_until, refresh_token)
+                                  VALUES (?, ?, ?, ?)
+                                  ON CONFLICT (user_id) DO UPDATE SET
+                                    access_token = excluded.access_token,
+                                    valid_until = excluded.valid_until,
+                                    refresh_token = excluded.refresh_token""", rows)
+
+    def _upsert_artist_genres(self, new_mappings : Dict[str, List[str]]) -> None:
+        """Replaces the genres of every artist in `new_mappings`, a batch of rows per statement
+        \n:pre the lock is held and a transaction is open"""
+        # Failed lookups saved as None by older versions are left out, so those artists are requested again
+        new_mappings = {artist_name: genres for artist_name, genres in new_mappings.items() if genres is not None}
+        artist_names = list(new_mappings.keys())
+        genre_names = list({genre for genres in new_mappings.values() for genre in genres})
+
+        self._conn.executemany("INSERT OR IGNORE INTO artists (name) VALUES (?)", ((name,) for name in artist_names))
+        self._conn.executemany("INSERT OR IGNORE INTO genres (name) VALUES (?)", ((name,) for name in genre_names))
+        artist_ids = self._get_ids("artists", "artist_id", artist_names)
+        genre_ids = self._get_ids("genres", "genre_id", genre_names)
+
+        self._conn.executemany("DELETE FROM artist_genres WHERE artist_id = ?",
+                               ((artist_ids[name],) for name in artist_names))
+        self._conn.executemany("INSERT INTO artist_genres (artist_id, position, genre_id) VALUES (?, ?, ?)",
+                               ((artist_ids[artist_name], position, genre_ids[genre])
+                                for artist_name, genres in new_mappings.items()
+                                for position, genre in enumerate(genres)))
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                           (self._ARTIST_GENRES_UPDATED_AT_KEY, str(time.time())))
+
+    def _get_ids(self, table : str, id_column : str, names : List[str]) -> Dict[str, int]:
+        """:return name -> id of the given rows, looked up `batch_size` names at a time
+        \n:pre the lock is held"""
+        ids = {}
+        for batch_start in range(0, len(names), self._batch_size):
+            batch = names[batch_start:batch_start + self._batch_size]
+            placeholders = ", ".join("?" * len(batch))
+            ids.update(self._conn.execute(f"SELECT name, {id_column} FROM {table} WHERE name IN ({placeholders})",
+                                          batch).fetchall())
+        return ids
+
+    def _read_json_file(self, path : pathlib.Path) -> Dict:
+        """:return The json file's contents, empty if it does not exist"""
+        if not pathlib.Path(path).is_file():
+            return {}
+        with open(path, 'r') as json_file:
+            return dict(json.load(json_file))
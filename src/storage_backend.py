@@ -0,0 +1,158 @@
+"""
+    @file Responsible for where DataManager keeps the users, the artist -> genres map and playlist analyses.
+    \nStorageBackend is what every backend implements. JsonStorageBackend keeps the original json files
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import os
+from abc import ABC, abstractmethod
+import pathlib
+import threading
+from typing import Dict, List, Optional
+
+#------------------------------Project Imports-----------------------------#
+from user_store import UserStore
+from artist_genre_journal import ArtistGenreJournal
+import constants
+
+class StorageBackend(ABC):
+    """Everything DataManager needs to persist. Implementations must be thread safe"""
+    name = None
+
+    @abstractmethod
+    def get_user(self, user_id : str) -> Optional[Dict]:
+        """:return A copy of the user's {"access_token", "valid_until", "refresh_token"}, None if they do not exist.
+        \n`valid_until` is when the access token expires, in epoch sec"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_users(self) -> Dict[str, Dict]:
+        """:return user_id -> a copy of their info, for every user"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def has_user(self, user_id : str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_user(self, user_id : str, user_dict : Dict) -> None:
+        """Adds / replaces the user's info"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user(self, user_id : str, updates : Dict) -> bool:
+        """Changes some of the user's info
+        \n:return True if the user exists"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_user(self, user_id : str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_users_version(self) -> int:
+        """:return A number that changes whenever the users were changed by someone else (another process / by hand).
+        Changes made through this backend do not change it"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_artist_genre_mappings(self) -> Dict[str, List[str]]:
+        """:return The full map of artist_name -> List[genres]"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_artist_genre_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        """Adds / replaces the genres of every artist in `new_mappings`"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_artist_genre_last_modified(self) -> float:
+        """:return When the genre map last changed (unix timestamp), used to tell if a GenreIndex is stale"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_playlist_analysis_state(self, playlist_id : str) -> Optional[Dict]:
+        """:return The playlist's last saved analysis state (see `PlaylistAnalysisState.to_dict`), None if none"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_playlist_analysis_state(self, playlist_id : str, state_dict : Dict) -> None:
+        """Replaces the playlist's saved analysis state"""
+        raise NotImplementedError
+
+
+class JsonStorageBackend(StorageBackend):
+    name = constants.STORAGE_BACKEND_JSON
+
+    def __init__(self, user_data_path : pathlib.Path, artist_genre_path : pathlib.Path,
+                 playlist_analysis_dir : pathlib.Path) -> None:
+        """Keeps the users in `user_data_path` and the genre map in `artist_genre_path` (both json).
+        \nThe users are served from memory. Genre map updates are appended to a journal next to the map, which is
+        only read back when the whole map is asked for (see UserStore, ArtistGenreJournal)
+        \n:param `playlist_analysis_dir` Each playlist's analysis state is a <playlist_id>.json in here.
+            Created on first save"""
+        self._user_store = UserStore(user_data_path)
+        self._artist_genre_journal = ArtistGenreJournal(artist_genre_path)
+        self._playlist_analysis_dir = pathlib.Path(playlist_analysis_dir)
+        self._playlist_analysis_lock = threading.Lock()
+
+    def get_user(self, user_id : str) -> Optional[Dict]:
+        return self._user_store.get_user(user_id)
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        return self._user_store.get_all_users()
+
+    def has_user(self, user_id : str) -> bool:
+        return self._user_store.has_user(user_id)
+
+    def save_user(self, user_id : str, user_dict : Dict) -> None:
+        self._user_store.save_user(user_id, user_dict)
+
+    def update_user(self, user_id : str, updates : Dict) -> bool:
+        return self._user_store.update_user(user_id, updates)
+
+    def remove_user(self, user_id : str) -> None:
+        self._user_store.remove_user(user_id)
+
+    def get_users_version(self) -> int:
+        return self._user_store.get_version()
+
+    def get_artist_genre_mappings(self) -> Dict[str, List[str]]:
+        return self._artist_genre_journal.get_mappings()
+
+    def update_artist_genre_mappings(self, new_mappings : Dict[str, List[str]]) -> None:
+        self._artist_genre_journal.update_mappings(new_mappings)
+
+    def get_artist_genre_last_modified(self) -> float:
+        return self._artist_genre_journal.get_last_modified()
+
+    def get_playlist_analysis_state(self, playlist_id : str) -> Optional[Dict]:
+        state_path = self._get_playlist_analysis_path(playlist_id)
+        if state_path is None or not state_path.is_file():
+            return None
+        try:
+            with open(state_path, 'r') as state_file:
+                return dict(json.load(state_file))
+        except ValueError as err:
+            print(f"ERROR: ignoring the unreadable playlist analysis {state_path}: {err}")
+            return None
+
+    def save_playlist_analysis_state(self, playlist_id : str, state_dict : Dict) -> None:
+        state_path = self._get_playlist_analysis_path(playlist_id)
+        if state_path is None:
+            return
+        with self._playlist_analysis_lock:
+            self._playlist_analysis_dir.mkdir(parents=True, exist_ok=True)
+            # Written to a temp file then renamed, so a reader never sees half of it
+            temp_path = state_path.with_name(state_path.name + ".tmp")
+            with open(temp_path, 'w') as temp_file:
+                json.dump(state_dict, temp_file, separators=(",", ":"))
+            os.replace(temp_path, state_path)
+
+    def _get_playlist_analysis_path(self, playlist_id : str) -> Optional[pathlib.Path]:
+        """:return Where the playlist's analysis state is kept. None if the id can not be a file name
+        (spotify ids are alphanumeric)"""
+        if not playlist_id.isalnum():
+            return None
+        return self._playlist_analysis_dir / f"{playlist_id}.json"
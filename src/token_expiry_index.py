@@ -0,0 +1,80 @@
+"""
+    @file Responsible for knowing when every user's access token expires.
+    \nExpiries are kept as epoch timestamps in a dict (for O(1) validity checks) and a sorted list
+    (to cheaply list the users whose tokens expire soonest)
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+class TokenExpiryIndex():
+    def __init__(self) -> None:
+        """Thread safe index of user_id -> when their access token expires (epoch sec)"""
+        self._lock = threading.Lock()
+        self._expiry_by_user = {}
+        # (expiry, user_id) sorted by expiry
+        self._sorted_expiries = []
+        # What the expiries were built from, see `replace_all`
+        self._source_version = None
+
+    def set_expiry(self, user_id : str, expires_at : float) -> None:
+        with self._lock:
+            self._remove(user_id)
+            self._expiry_by_user[user_id] = expires_at
+            bisect.insort(self._sorted_expiries, (expires_at, user_id))
+
+    def remove(self, user_id : str) -> None:
+        with self._lock:
+            self._remove(user_id)
+
+    def replace_all(self, expiry_by_user : Dict[str, float], source_version : Optional[int] = None) -> None:
+        """Replaces every expiry at once (i.e. after the users were reloaded)
+        \n:param `source_version` The version of the users the expiries were read from, see `get_source_version`"""
+        sorted_expiries = sorted((expires_at, user_id) for user_id, expires_at in expiry_by_user.items())
+        with self._lock:
+            self._expiry_by_user = dict(expiry_by_user)
+            self._sorted_expiries = sorted_expiries
+            self._source_version = source_version
+
+    def get_source_version(self) -> Optional[int]:
+        """:return The `source_version` given to the last `replace_all`, None if it was never called"""
+        return self._source_version
+
+    def get_expiry(self, user_id : str) -> Optional[float]:
+        """:return When the user's token expires (epoch sec), None if the user is not indexed"""
+        return self._expiry_by_user.get(user_id)
+
+    def is_valid(self, user_id : str, now : Optional[float] = None) -> bool:
+        """:return True if the user's token has not expired yet"""
+        expires_at = self._expiry_by_user.get(user_id)
+        return expires_at is not None and (time.time() if now is None else now) < expires_at
+
+    def get_expiring_before(self, deadline : float) -> List[Tuple[str, float]]:
+        """:return [(user_id, expires_at)] of every token expiring before `deadline`, soonest first.
+        Includes tokens that already expired"""
+        with self._lock:
+            end = bisect.bisect_left(self._sorted_expiries, (deadline,))
+            return [(user_id, expires_at) for expires_at, user_id in self._sorted_expiries[:end]]
+
+    def get_next_expiry(self) -> Optional[Tuple[str, float]]:
+        """:return (user_id, expires_at) of the token that expires soonest, None if there are no users"""
+        with self._lock:
+            if len(self._sorted_expiries) == 0:
+                return None
+            expires_at, user_id = self._sorted_expiries[0]
+            return (user_id, expires_at)
+
+    def __len__(self) -> int:
+        return len(self._expiry_by_user)
+
+    def _remove(self, user_id : str) -> None:
+        """:pre the lock is held"""
+        expires_at = self._expiry_by_user.pop(user_id, None)
+        if expires_at is None:
+            return
+        position = bisect.bisect_left(self._sorted_expiries, (expires_at, user_id))
+        if position < len(self._sorted_expiries) and self._sorted_expiries[position] == (expires_at, user_id):
+            del self._sorted_expiries[position]
@@ -0,0 +1,180 @@
+"""
+    @file Responsible for refreshing active users' access tokens shortly before they expire.
+    \nWithout it, the first request after a token expires is bounced through /refresh_access_token,
+    which blocks on spotify and costs the browser two extra round trips
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+#------------------------------Project Imports-----------------------------#
+from data_manager import DataManager
+import constants
+
+class TokenRefreshScheduler():
+    def __init__(self, data_manager : DataManager,
+                 refresh_user_func : Callable[[str], bool],
+                 refresh_ahead_sec : float = constants.TOKEN_REFRESH_AHEAD_SEC,
+                 max_jitter_sec : float = constants.TOKEN_REFRESH_MAX_JITTER_SEC,
+                 active_user_window_sec : float = constants.TOKEN_REFRESH_ACTIVE_USER_WINDOW_SEC,
+                 max_workers : int = constants.TOKEN_REFRESH_MAX_WORKERS,
+                 retry_after_sec : float = constants.TOKEN_REFRESH_RETRY_AFTER_SEC,
+                 is_verbose : bool = False) -> None:
+        """Background thread that refreshes the tokens of recently active users before they expire.
+        \n:param `refresh_user_func` Given a user id, refreshes and saves their access token.
+            Returns True on success (i.e. `WebApp.refresh_users_access_token`)
+        \n:param `refresh_ahead_sec` How long before expiry a token is refreshed
+        \n:param `max_jitter_sec` Each refresh happens up to this much earlier (random per token), so tokens
+            issued at the same time are not all refreshed at the same time
+        \n:param `active_user_window_sec` Only users seen within this long are refreshed. The rest go through
+            the regular refresh redirect if they ever come back
+        \n:param `max_workers` The most refreshes sent at once
+        \n:param `retry_after_sec` How long to wait before retrying a failed refresh"""
+        self._data_manager = data_manager
+        self._refresh_user_func = refresh_user_func
+        self._refresh_ahead_sec = refresh_ahead_sec
+        self._max_jitter_sec = max_jitter_sec
+        self._active_user_window_sec = active_user_window_sec
+        self._retry_after_sec = retry_after_sec
+        self._is_verbose = is_verbose
+
+        self._condition = threading.Condition()
+        self._is_stopped = False
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="token_refresh")
+
+        self._last_active_by_user = {}
+        # (user_id, expires_at) -> jitter, so a token's refresh time is picked once
+        self._jitter_by_token = {}
+        # user_id -> the earliest their token may be refreshed again (after a failure / a refresh)
+        self._not_before_by_user = {}
+        self._users_being_refreshed = set()
+
+        # monitoring
+        self._num_refreshed = 0
+        self._num_failed = 0
+
+    def start(self) -> "TokenRefreshScheduler":
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="token_refresh_scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def mark_active(self, user_id : str) -> None:
+        """Call whenever a user makes a request, so their token is kept fresh while they are around"""
+        now = time.time()
+        with self._condition:
+            was_active = self._is_active(user_id, now)
+            self._last_active_by_user[user_id] = now
+            if not was_active:
+                # Their token may be due sooner than whatever the thread is sleeping until
+                self._condition.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            now = time.time()
+            return {"num_active_users": sum(1 for user_id in self._last_active_by_user
+                                            if self._is_active(user_id, now)),
+                    "num_being_refreshed": len(self._users_being_refreshed),
+                    "num_refreshed": self._num_refreshed,
+                    "num_failed": self._num_failed}
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._is_stopped:
+                    return
+                now = time.time()
+                due_user_ids, next_refresh_at = self._collect_due_users(now)
+                self._users_being_refreshed.update(due_user_ids)
+
+            for user_id in due_user_ids:
+                self._executor.submit(self._refresh_user, user_id)
+
+            with self._condition:
+                if self._is_stopped:
+                    return
+                sleep_sec = constants.TOKEN_REFRESH_MAX_SLEEP_SEC if next_refresh_at is None \
+                    else min(constants.TOKEN_REFRESH_MAX_SLEEP_SEC, max(0.0, next_refresh_at - time.time()))
+                self._condition.wait(sleep_sec)
+
+    def _collect_due_users(self, now : float) -> Tuple[list, Optional[float]]:
+        """:return (the users to refresh now, when the next refresh is due (None if nothing is))
+        \n:pre the condition is held"""
+        self._forget_inactive_users(now)
+
+        due_user_ids = []
+        next_refresh_at = None
+        lookahead_deadline = (now + self._refresh_ahead_sec + self._max_jitter_sec
+                              + constants.TOKEN_REFRESH_MAX_SLEEP_SEC)
+        for user_id, expires_at in self._data_manager.get_users_expiring_before(lookahead_deadline):
+            if not self._is_active(user_id, now) or user_id in self._users_being_refreshed:
+                continue
+
+            jitter_key = (user_id, expires_at)
+            if jitter_key not in self._jitter_by_token:
+                self._jitter_by_token[jitter_key] = random.uniform(0, self._max_jitter_sec)
+            refresh_at = max(expires_at - self._refresh_ahead_sec - self._jitter_by_token[jitter_key],
+                             self._not_before_by_user.get(user_id, 0.0))
+
+            if refresh_at <= now:
+                due_user_ids.append(user_id)
+            elif next_refresh_at is None or refresh_at < next_refresh_at:
+                next_refresh_at = refresh_at
+        return (due_user_ids, next_refresh_at)
+
+    def _refresh_user(self, user_id : str) -> None:
+        is_success = False
+        is_logged_out = False
+        try:
+            # No refresh token means they logged out
+            if self._data_manager.get_users_refresh_token(user_id) is None:
+                is_logged_out = True
+                return
+
+            is_success = self._refresh_user_func(user_id)
+        except Exception as err:
+            print(f"ERROR: failed to refresh the access token of {user_id}: {err}")
+        finally:
+            with self._condition:
+                self._users_being_refreshed.discard(user_id)
+                if is_logged_out:
+                    self._last_active_by_user.pop(user_id, None)
+                elif is_success:
+                    self._num_refreshed += 1
+                    # Guards against a token that is already due again (i.e. spotify gave a very short expiry)
+                    self._not_before_by_user[user_id] = time.time() + constants.TOKEN_REFRESH_MIN_INTERVAL_SEC
+                else:
+                    self._num_failed += 1
+                    self._not_before_by_user[user_id] = time.time() + self._retry_after_sec
+                self._condition.notify_all()
+
+        if self._is_verbose and not is_logged_out:
+            print(f"{'Refreshed' if is_success else 'Failed to refresh'} {user_id}'s access token in the background")
+
+    def _is_active(self, user_id : str, now : float) -> bool:
+        """:pre the condition is held"""
+        last_active = self._last_active_by_user.get(user_id)
+        return last_active is not None and now - last_active <= self._active_user_window_sec
+
+    def _forget_inactive_users(self, now : float) -> None:
+        """Drops the bookkeeping of users that went inactive and of tokens that were replaced
+        \n:pre the condition is held"""
+        for user_id in [user_id for user_id in self._last_active_by_user if not self._is_active(user_id, now)]:
+            del self._last_active_by_user[user_id]
+            self._not_before_by_user.pop(user_id, None)
+
+        for jitter_key in [jitter_key for jitter_key in self._jitter_by_token
+                           if self._data_manager.get_token_expiry(jitter_key[0]) != jitter_key[1]]:
+            del self._jitter_by_token[jitter_key]
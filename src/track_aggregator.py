@@ -0,0 +1,101 @@
+"""
+    @file Responsible for counting tracks by artist / album / genre in bulk.
+    \nEach page of tracks is reduced to integer id columns (one id per track) in one pass. The columns are
+    counted with Counter (in C) and ids are only turned back into names once, at the end
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import array
+from collections import Counter
+from typing import Dict, List, Mapping, Optional
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class TrackAggregator():
+    def __init__(self) -> None:
+        """Accumulates pages of raw tracks (from the get-playlist-items API). Not thread safe"""
+        # name -> id, in the order the names were first seen
+        self._artist_ids = {}
+        self._album_ids = {}
+        # id -> the lead artist's spotify id (None for local files)
+        self._artist_spotify_ids = []
+
+        # one entry per track
+        self._artist_id_column = array.array("I")
+        self._album_id_column = array.array("I")
+
+    def add_tracks(self, raw_track_list : List[Dict]) -> None:
+        """Adds one page of raw tracks to the columns. Only the lead artist of each track is counted"""
+        artist_ids = self._artist_ids
+        album_ids = self._album_ids
+        artist_spotify_ids = self._artist_spotify_ids
+        artist_id_column_append = self._artist_id_column.append
+        album_id_column_append = self._album_id_column.append
+
+        for raw_track in raw_track_list:
+            lead_artist_dict = raw_track["artists"][0]
+            artist_name = lead_artist_dict["name"]
+            artist_id = artist_ids.get(artist_name)
+            if artist_id is None:
+                artist_id = artist_ids[artist_name] = len(artist_ids)
+                artist_spotify_ids.append(lead_artist_dict["id"])
+            artist_id_column_append(artist_id)
+
+            album_name = raw_track["album"]["name"]
+            album_id = album_ids.get(album_name)
+            if album_id is None:
+                album_id = album_ids[album_name] = len(album_ids)
+            album_id_column_append(album_id)
+
+    def get_num_tracks(self) -> int:
+        return len(self._artist_id_column)
+
+    def get_artist_counts(self) -> Dict[str, int]:
+        """:return lead artist name -> number of tracks, in the order the artists first appeared"""
+        return self._count_column(self._artist_id_column, self._artist_ids)
+
+    def get_album_counts(self) -> Dict[str, int]:
+        """:return album name -> number of tracks, in the order the albums first appeared.
+        Albums without a name are counted as `constants.DEFAULT_NO_ALBUM_NAME`"""
+        album_counts = {}
+        for album_name, num_tracks in self._count_column(self._album_id_column, self._album_ids).items():
+            album_name = str(album_name)
+            if album_name == "" or album_name == " ":
+                album_name = constants.DEFAULT_NO_ALBUM_NAME
+            album_counts[album_name] = album_counts.get(album_name, 0) + num_tracks
+        return album_counts
+
+    def get_artist_spotify_ids(self) -> Dict[str, Optional[str]]:
+        """:return lead artist name -> their spotify id (None for local files)"""
+        return {artist_name: self._artist_spotify_ids[artist_id] for artist_name, artist_id in self._artist_ids.items()}
+
+    @classmethod
+    def count_genres(cls, artist_counts : Dict[str, int],
+                     artist_genres : Mapping[str, List[str]]) -> Dict[str, int]:
+        """:param `artist_counts` artist name -> number of tracks (i.e. from `get_artist_counts`)
+        \n:param `artist_genres` artist name -> their genres. Artists missing from it are skipped
+        \n:return genre -> number of tracks by artists of that genre, in the order the genres first appeared.
+            Empty genres are counted as `constants.DEFAULT_NO_GENRE_NAME`"""
+        # Works per (artist, genre) pair, not per track - each artist's tracks were already counted
+        genre_ids = {}
+        genre_counts = []
+        for artist_name, num_tracks in artist_counts.items():
+            genres = artist_genres.get(artist_name)
+            if genres is None:
+                continue
+            for genre in genres:
+                if genre == "" or genre == " ":
+                    genre = constants.DEFAULT_NO_GENRE_NAME
+                genre_id = genre_ids.get(genre)
+                if genre_id is None:
+                    genre_id = genre_ids[genre] = len(genre_counts)
+                    genre_counts.append(0)
+                genre_counts[genre_id] += num_tracks
+        return {genre: genre_counts[genre_id] for genre, genre_id in genre_ids.items()}
+
+    @classmethod
+    def _count_column(cls, id_column : array.array, name_ids : Dict[str, int]) -> Dict[str, int]:
+        """:return name -> how many times its id is in `id_column`, in id (first seen) order"""
+        id_counts = Counter(id_column)
+        return {name: id_counts[name_id] for name, name_id in name_ids.items()}
@@ -0,0 +1,218 @@
+"""
+    @file Responsible for recording spotify traffic to a cassette file and replaying it later.
+    \nA cassette holds the request / response pairs of a real session (tokens redacted), so the same library
+    can be analyzed again and again without spending api quota. Replays can keep the original timings or skip them
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import datetime
+import gzip
+import json
+import pathlib
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import requests
+from requests.structures import CaseInsensitiveDict
+
+#------------------------------Project Imports-----------------------------#
+from response_cache import ResponseCache
+import constants
+
+class TrafficCassette():
+    RECORD_MODE = "record"
+    REPLAY_MODE = "replay"
+
+    def __init__(self, cassette_path : pathlib.Path, mode : str,
+                 replay_timing_scale : float = 1.0,
+                 record_batch_size : int = constants.CASSETTE_RECORD_BATCH_SIZE,
+                 is_verbose : bool = False) -> None:
+        """Thread safe recorder / player of spotify traffic.
+        \n:param `cassette_path` The gzipped ndjson file. Read on construction in replay mode. In record mode it is
+            replaced, then the requests are appended to it as they finish
+        \n:param `mode` `TrafficCassette.RECORD_MODE` or `TrafficCassette.REPLAY_MODE`
+        \n:param `replay_timing_scale` Multiplies the recorded response times when replaying.
+            1 keeps the original timings, 0 replies right away
+        \n:param `record_batch_size` How many recorded requests are kept in memory before being appended to the file.
+            Call `save()` to append the rest"""
+        if mode not in (self.RECORD_MODE, self.REPLAY_MODE):
+            raise ValueError(f"Unknown cassette mode {mode}")
+
+        self._cassette_path = pathlib.Path(cassette_path)
+        self._mode = mode
+        self._replay_timing_scale = replay_timing_scale
+        self._is_verbose = is_verbose
+        self._lock = threading.Lock()
+
+        # record mode: interactions not written yet, in the order they finished
+        self._recorded_interactions = []
+        self._record_start_time = time.monotonic()
+        self._record_batch_size = record_batch_size
+        self._num_recorded = 0
+        # Held while writing, so batches are appended in the order they were recorded
+        self._write_lock = threading.Lock()
+        # Opened on the first write. Every write after the first one adds to the file instead of replacing it
+        self._cassette_file = None
+        self._did_write = False
+
+        # replay mode: request key -> interactions not served yet. The last one is kept to serve repeats
+        self._interactions_by_key = {}
+        self._num_replayed = 0
+        self._num_missed = 0
+
+        if self._mode == self.REPLAY_MODE:
+            self._load()
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def send(self, method : str, url : str, params : Optional[Dict],
+             send_func : Callable[[], requests.Response]) -> requests.Response:
+        """Sends the request through `send_func` and records it, or replays the recorded response instead
+        \n:param `send_func` Sends the request for real. Never called in replay mode"""
+        if self._mode == self.REPLAY_MODE:
+            return self._replay(method, url, params)
+
+        start_time = time.monotonic()
+        res = send_func()
+        elapsed_sec = time.monotonic() - start_time
+
+        # 429s depend on how busy the app was, not on the library, so they are not worth replaying
+        if res.status_code != 429:
+            self._record(method, url, params, res, start_time, elapsed_sec)
+        return res
+
+    def save(self) -> None:
+        """Appends the requests not written yet to the cassette file and closes it, so it is a complete gzip file.
+        Requests recorded after are appended again"""
+        if self._mode != self.RECORD_MODE:
+            return
+
+        with self._write_lock:
+            self._write_recorded()
+            if self._cassette_file is not None:
+                self._cassette_file.close()
+                self._cassette_file = None
+
+        if self._is_verbose:
+            print(f"Saved {self._num_recorded} spotify requests to {self._cassette_path}")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {"mode": self._mode,
+                    "num_recorded": self._num_recorded,
+                    "num_replayed": self._num_replayed,
+                    "num_missed": self._num_missed}
+
+    @classmethod
+    def make_key(cls, method : str, url : str, params : Optional[Dict]) -> str:
+        """:return What a request is matched on when replaying. Redacted the same way the cassette is"""
+        return method + " " + ResponseCache.make_key(url, cls._redact_dict(params))
+
+    @classmethod
+    def _redact_dict(cls, values : Optional[Dict]) -> Optional[Dict]:
+        """:return A copy of `values` with the secrets (tokens, auth codes) replaced"""
+        if values is None:
+            return None
+        return {key: (constants.CASSETTE_REDACTED_VALUE if key in constants.CASSETTE_REDACTED_KEYS else value)
+                for key, value in values.items()}
+
+    def _record(self, method : str, url : str, params : Optional[Dict], res : requests.Response,
+                start_time : float, elapsed_sec : float) -> None:
+        body = res.text
+        try:
+            raw_body = res.json()
+            if isinstance(raw_body, dict):
+                body = json.dumps(self._redact_dict(raw_body), separators=(",", ":"))
+        except ValueError:
+            pass
+
+        interaction = {"key": self.make_key(method, url, params),
+                       "status": res.status_code,
+                       "headers": {name: res.headers[name] for name in constants.CASSETTE_KEPT_RESPONSE_HEADERS
+                                   if name in res.headers},
+                       "body": body,
+                       "start_sec": round(start_time - self._record_start_time, 4),
+                       "elapsed_sec": round(elapsed_sec, 4)}
+        with self._lock:
+            self._recorded_interactions.append(interaction)
+            self._num_recorded += 1
+            is_batch_full = len(self._recorded_interactions) >= self._record_batch_size
+
+        if is_batch_full:
+            with self._write_lock:
+                self._write_recorded()
+
+    def _write_recorded(self) -> None:
+        """Appends the interactions not written yet to the cassette file (a gzip stream, flushed after each batch)
+        \n:pre the write lock is held"""
+        with self._lock:
+            interactions = self._recorded_interactions
+            self._recorded_interactions = []
+        if len(interactions) == 0:
+            return
+
+        if self._cassette_file is None:
+            self._cassette_path.parent.mkdir(parents=True, exist_ok=True)
+            # A gzip file can hold several streams back to back, reading it gives them as one
+            self._cassette_file = gzip.open(self._cassette_path, "at" if self._did_write else "wt", encoding="utf-8")
+            self._did_write = True
+        self._cassette_file.write("".join(json.dumps(interaction, separators=(",", ":")) + "\n"
+                                          for interaction in interactions))
+        self._cassette_file.flush()
+
+    def _load(self) -> None:
+        num_interactions = 0
+        with gzip.open(self._cassette_path, "rt", encoding="utf-8") as cassette_file:
+            try:
+                for line in cassette_file:
+                    if len(line.strip()) == 0 or not line.endswith("\n"):
+                        continue
+                    interaction = json.loads(line)
+                    self._interactions_by_key.setdefault(interaction["key"], deque()).append(interaction)
+                    num_interactions += 1
+            except EOFError:
+                # The recording was killed before `save()`, every batch written before that is still usable
+                print(f"ERROR: {self._cassette_path} was not saved properly, only replaying what was written")
+
+        if self._is_verbose:
+            print(f"Loaded {num_interactions} spotify requests from {self._cassette_path}")
+
+    def _replay(self, method : str, url : str, params : Optional[Dict]) -> requests.Response:
+        """:return The next recorded response of this request. Identical requests get the recorded responses
+        in order, then the last one again"""
+        key = self.make_key(method, url, params)
+        with self._lock:
+            interactions = self._interactions_by_key.get(key)
+            if interactions is None:
+                self._num_missed += 1
+                interaction = None
+            else:
+                self._num_replayed += 1
+                interaction = interactions.popleft() if len(interactions) > 1 else interactions[0]
+
+        if interaction is None:
+            print(f"ERROR: {key} is not in the cassette {self._cassette_path}")
+            return self._build_response(key, 404, {}, json.dumps({"error": {"status": 404,
+                                                                            "message": "Not in cassette"}}), 0)
+
+        elapsed_sec = interaction["elapsed_sec"] * self._replay_timing_scale
+        if elapsed_sec > 0:
+            time.sleep(elapsed_sec)
+        return self._build_response(key, interaction["status"], interaction["headers"], interaction["body"],
+                                    elapsed_sec)
+
+    def _build_response(self, key : str, status_code : int, headers : Dict, body : str,
+                        elapsed_sec : float) -> requests.Response:
+        res = requests.Response()
+        res.status_code = status_code
+        res.headers = CaseInsensitiveDict(headers)
+        res._content = body.encode("utf-8")
+        res.encoding = "utf-8"
+        res.url = key.split(" ", 1)[1]
+        res.elapsed = datetime.timedelta(seconds=elapsed_sec)
+        return res
@@ -11,17 +11,17 @@ from flask_login import UserMixin
 from data_manager import DataManager
 
 class User(UserMixin):
-    def __init__(self, userId):
+    def __init__(self, userId, data_manager: DataManager):
         """
             Custom user class that extends the expected class from LoginManager
             \n@Brief: Initializes a User with the most basic info needed
             \n@Param: userId - The user's unique id
-            \n@Param: access_token - The fully authenticated user token
+            \n@Param: data_manager - The app's shared DataManager. Users are served from memory, so no file I/O
         """
         # store the user's id for use when object is accessed (via 'current_user')
         # they can use the id for more queries
         self.id = str(userId)
-        self._data_manager = DataManager()
+        self._data_manager = data_manager
         self.access_token = self._data_manager.get_users_access_token(userId)
 
     def get_user_id(self) -> str:
@@ -18,15 +18,16 @@ from data_manager import DataManager
 from user import User
 
 class UserManager(LoginManager):
-    def __init__(self, app: Flask):
+    def __init__(self, app: Flask, data_manager: DataManager):
         """
             \n@param: app   - The flask app
+            \n@param: data_manager - The app's shared DataManager, handed to every User loaded
         """
         self.flaskApp = app
 
         # create login manager object
         LoginManager.__init__(self, self.flaskApp)
-        self._data_manager = DataManager()
+        self._data_manager = data_manager
 
         self.createLoginManager()
 
@@ -45,7 +46,7 @@ class UserManager(LoginManager):
             """
             possible_user = None
             if self._data_manager.does_user_exist(user_id):
-                possible_user = User(user_id)
+                possible_user = User(user_id, self._data_manager)
 
 
             return possible_user
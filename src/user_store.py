@@ -0,0 +1,124 @@
+"""
+    @file Responsible for keeping the users' login info (tokens, expiry) in memory.
+    \nReads are served from memory, writes go through to the json file right away.
+    \nIf the file is changed by someone else (i.e. another process / by hand) it is reloaded
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, Optional
+
+#------------------------------Project Imports-----------------------------#
+import constants
+
+class UserStore():
+    def __init__(self, user_data_path : pathlib.Path,
+                 reload_check_interval_sec : float = constants.USER_STORE_RELOAD_CHECK_INTERVAL_SEC) -> None:
+        """Thread safe, write-through store of user_id -> {"access_token", "valid_until", "refresh_token"}.
+        \n`valid_until` is when the access token expires, in epoch sec
+        \n:param `user_data_path` The json file the users are persisted in
+        \n:param `reload_check_interval_sec` How often (at most) the file's mtime is checked for outside changes.
+            0 checks on every read"""
+        self._user_data_path = pathlib.Path(user_data_path)
+        self._reload_check_interval_sec = reload_check_interval_sec
+
+        self._lock = threading.RLock()
+        self._users = {}
+        self._file_signature = None
+        self._next_reload_check = 0.0
+        # Bumped every time the users are (re)read from the file
+        self._version = 0
+        self._load()
+
+    def get_user(self, user_id : str) -> Optional[Dict]:
+        """:return A copy of the user's info, None if the user does not exist"""
+        with self._lock:
+            self._reload_if_changed()
+            user_dict = self._users.get(user_id)
+            return dict(user_dict) if user_dict is not None else None
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        """:return A copy of every user's info"""
+        with self._lock:
+            self._reload_if_changed()
+            return {user_id: dict(user_dict) for user_id, user_dict in self._users.items()}
+
+    def has_user(self, user_id : str) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            return user_id in self._users
+
+    def save_user(self, user_id : str, user_dict : Dict) -> None:
+        """Adds / replaces the user's info and persists it"""
+        with self._lock:
+            self._reload_if_changed()
+            self._users[user_id] = dict(user_dict)
+            self._save()
+
+    def update_user(self, user_id : str, updates : Dict) -> bool:
+        """Changes some of the user's info and persists it
+        \n:return True if the user exists"""
+        with self._lock:
+            self._reload_if_changed()
+            if user_id not in self._users:
+                return False
+            self._users[user_id].update(updates)
+            self._save()
+            return True
+
+    def remove_user(self, user_id : str) -> None:
+        with self._lock:
+            self._reload_if_changed()
+            if self._users.pop(user_id, None) is not None:
+                self._save()
+
+    def get_version(self) -> int:
+        """:return A number that changes every time the users are reloaded because someone else changed the file.
+        Writes made through this store do not change it"""
+        with self._lock:
+            self._reload_if_changed()
+            return self._version
+
+    def _get_file_signature(self) -> Optional[tuple]:
+        """:return What identifies the current version of the file (mtime + size). None if it does not exist"""
+        try:
+            file_stat = os.stat(self._user_data_path)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def _reload_if_changed(self) -> None:
+        """Re-reads the file if it changed since it was last read / written. The mtime is only checked
+        every `reload_check_interval_sec`, so most reads never touch the disk
+        \n:pre the lock is held"""
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self._reload_check_interval_sec
+
+        if self._get_file_signature() != self._file_signature:
+            self._load()
+
+    def _load(self) -> None:
+        """:pre the lock is held (or the store is being constructed)"""
+        file_signature = self._get_file_signature()
+        users = {}
+        if file_signature is not None:
+            with open(self._user_data_path, 'r') as user_file:
+                users = dict(json.load(user_file))
+        self._users = users
+        self._file_signature = file_signature
+        self._version += 1
+
+    def _save(self) -> None:
+        """Writes every user to a temp file and swaps it in, so readers never see a half written file
+        \n:pre the lock is held"""
+        temp_path = self._user_data_path.with_name(self._user_data_path.name + ".tmp")
+        with open(temp_path, 'w') as user_file:
+            json.dump(self._users, user_file, indent=2)
+        os.replace(temp_path, self._user_data_path)
+        self._file_signature = self._get_file_signature()
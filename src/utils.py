@@ -1,8 +1,8 @@
 #------------------------------STANDARD DEPENDENCIES-----------------------------#
 import json
 import pathlib
-from typing import Tuple, List
-from datetime import datetime, timedelta, date
+from typing import Tuple, List, Optional
+from datetime import datetime, date
 import time
 
 #------------------------------Project Imports-----------------------------#
@@ -46,6 +46,24 @@ class Utils():
     def get_spotify_accounts_base_uri(cls) -> pathlib.Path:
         return constants.SPOTIFY_ACCOUNTS_BASE_URI
 
+    @classmethod
+    def set_spotify_base_uris(cls, api_base_uri : str, accounts_base_uri : str) -> None:
+        """Points every spotify uri constant at new base uris (i.e. a local stand-in for offline benchmarking).
+        \nNOTE: call before any requests are sent"""
+        old_api_base_uri = constants.SPOTIFY_API_BASE_URI
+        old_accounts_base_uri = constants.SPOTIFY_ACCOUNTS_BASE_URI
+        api_base_uri = api_base_uri.rstrip("/")
+        accounts_base_uri = accounts_base_uri.rstrip("/")
+
+        for constant_name in dir(constants):
+            if not constant_name.startswith("SPOTIFY_") or not constant_name.endswith(("_URI", "_URL")):
+                continue
+            uri = getattr(constants, constant_name)
+            if uri.startswith(old_accounts_base_uri):
+                setattr(constants, constant_name, accounts_base_uri + uri[len(old_accounts_base_uri):])
+            elif uri.startswith(old_api_base_uri):
+                setattr(constants, constant_name, api_base_uri + uri[len(old_api_base_uri):])
+
     @classmethod
     def escape_html_special_char(cls, str_to_escape: str) -> str:
         """:return Escaped string"""
@@ -95,13 +113,25 @@ class Utils():
 
 
     @classmethod
-    def calc_end_time(cls, start_time : datetime, time_diff_sec : float) -> datetime:
+    def calc_end_time(cls, start_time : datetime, time_diff_sec : float) -> float:
         """Given a start time and time difference in seconds,
-            calculates the end datetime in %m/%d/%Y %H:%M:%S notation"""
+            calculates the end time as an epoch timestamp (sec)"""
+        return start_time.timestamp() + time_diff_sec
 
-        datetime_delta = timedelta(seconds=time_diff_sec)
-        end_time = (start_time + datetime_delta).strftime(constants.TIME_FORMAT_STR)
-        return end_time
+    @classmethod
+    def parse_end_time(cls, end_time) -> Optional[float]:
+        """:return An end time saved by any version of `calc_end_time` as an epoch timestamp.
+        \nOlder versions saved it in %m/%d/%Y %H:%M:%S (local time) notation. None if it can't be parsed"""
+        if end_time is None:
+            return None
+        try:
+            return float(end_time)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return datetime.strptime(str(end_time), constants.TIME_FORMAT_STR).timestamp()
+        except ValueError:
+            return None
 
     @classmethod
     def get_keys_with_escaped_quotes(cls, dict_to_check: dict,
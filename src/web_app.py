@@ -23,10 +23,15 @@ from backend_utils.playlist_search_table import PlaylistSearchTable, PlaylistSea
 from backend_utils.flask_utils import FlaskUtils
 import constants
 from analyzer import Analyzer
+from analysis_result_cache import AnalysisResultCache
+from token_refresh_scheduler import TokenRefreshScheduler
+from single_flight import SingleFlight
 from backend_utils.artist_search_form import ArtistSearchForm
 
 class WebApp(Scraper, UserManager, FlaskUtils):
-    def __init__(self, port: int, is_debug: bool, data_manager: DataManager, is_verbose: bool, redirect_localhost: bool):
+    def __init__(self, port: int, is_debug: bool, data_manager: DataManager, is_verbose: bool, redirect_localhost: bool,
+                 max_pagination_workers: int = constants.DEFAULT_MAX_PAGINATION_WORKERS,
+                 spill_analysis_cache: bool = False):
 
         self._title = constants.PROJECT_NAME
         self._app = Flask(self._title)
@@ -35,13 +40,29 @@ class WebApp(Scraper, UserManager, FlaskUtils):
         self._redirect_use_localhost = redirect_localhost
 
         # Create the user manager with a link to the app itself
-        UserManager.__init__(self, self._app)
+        UserManager.__init__(self, self._app, self._data_manager)
         FlaskUtils.__init__(self, self._app, port)
-        Scraper.__init__(self, self._is_verbose)
-        self.analyzer = Analyzer(self._is_verbose, self._data_manager)
+        Scraper.__init__(self, self._is_verbose, max_pagination_workers)
+        # Finished analyses are shared by every user. Spilling keeps the ones pushed out of memory in the data dir
+        spill_path = Utils.get_data_dir_path() / constants.ANALYSIS_RESULT_CACHE_SPILL_FILENAME \
+            if spill_analysis_cache else None
+        self.analyzer = Analyzer(self._is_verbose, self._data_manager,
+                                 AnalysisResultCache(spill_path=spill_path, is_verbose=self._is_verbose))
 
         self._auth_info = self._data_manager.get_auth_info()
 
+        # One refresh per user at a time, shared by every request (and the background scheduler) that needs it
+        self._token_refresh_single_flight = SingleFlight()
+
+        # Refreshes active users' tokens a few minutes before they expire, so they (almost) never get
+        # bounced through /refresh_access_token
+        self._token_refresh_scheduler = TokenRefreshScheduler(self._data_manager,
+                                                              self.refresh_users_access_token,
+                                                              is_verbose=self._is_verbose).start()
+
+        # Set once the routes exist, see `_get_valid_endpoints_whitelist`
+        self._valid_endpoints_whitelist = None
+
         # refreshes flask if html files change
         self._app.config["TEMPLATES_AUTO_RELOAD"] = True
         self._app.config['SECRET_KEY'] = self._auth_info['client_secret']
@@ -89,8 +110,16 @@ class WebApp(Scraper, UserManager, FlaskUtils):
             The decorator is a nice 1 line way of achieving the same task
             """
             def refresh_wrapper(*args, **kwargs):
+                self._token_refresh_scheduler.mark_active(current_user.get_id())
+
                 # Refresh the user if they are currently in active / have old tokens
                 if not current_user.is_active():
+                    # Renew the token within this request. Only fall back to the refresh redirect if that fails
+                    user_id = current_user.get_id()
+                    if self.refresh_users_access_token(user_id, only_if_expired=True):
+                        login_user(User(user_id, self._data_manager))
+                        return view_func(*args, **kwargs)
+
                     self.refresh_view = url_for("refresh_access_token")
                     return self.needs_refresh()
                 else:
@@ -99,10 +128,43 @@ class WebApp(Scraper, UserManager, FlaskUtils):
             refresh_wrapper.__name__ = view_func.__name__
             return refresh_wrapper
 
-    def generateRoutes(self):
-        self.public_ip = FlaskUtils.get_public_ip()
+    def refresh_users_access_token(self, user_id : str, only_if_expired : bool = False) -> bool:
+        """Refreshes the user's access token with their refresh token and saves it.
+        \nConcurrent calls for the same user wait on one refresh and share its result
+        \n:param `only_if_expired` Skip the refresh if the token is valid (i.e. another request just refreshed it)
+        \n:return True if the user has a valid token afterwards"""
+        if only_if_expired and self._data_manager.is_token_valid(user_id):
+            return True
+
+        def refresh() -> bool:
+            if only_if_expired and self._data_manager.is_token_valid(user_id):
+                return True
+
+            refresh_token = self._data_manager.get_users_refresh_token(user_id)
+            # happens when user is logged out - refresh token removed
+            if refresh_token is None:
+                return False
+
+            refresh_res = self.refresh_access_token(self._auth_info['client_id'],
+                                                    self._auth_info['client_secret'],
+                                                    refresh_token)
+            if refresh_res is None or refresh_res[0] is None or refresh_res[1] is None:
+                return False
+            new_access_token, new_valid_for_sec = refresh_res
+
+            # The user may have logged out while the refresh was in flight
+            if self._data_manager.get_users_refresh_token(user_id) != refresh_token:
+                return False
+
+            new_end_time = Utils.calc_end_time(datetime.now(), new_valid_for_sec)
+            self._data_manager.save_users_access_token(new_access_token, user_id, new_end_time, refresh_token)
+            return True
 
+        return self._token_refresh_single_flight.do(user_id, refresh)
+
+    def generateRoutes(self):
         if self._redirect_use_localhost is False:
+            self.public_ip = FlaskUtils.get_public_ip()
             self.base_route = FlaskUtils.get_app_base_url_str(self._port)
         else:
             # when local host is used, dont give a regular ip to start the route
@@ -150,46 +212,37 @@ class WebApp(Scraper, UserManager, FlaskUtils):
                 print("refreshing access token")
             user_id = current_user.get_user_id()
 
-            # user_id = current_user.get_user_id()
-            refresh_token = self._data_manager.get_users_refresh_token(user_id)
-
             # happens when user is logged out - refresh token removed
-            if refresh_token is None:
+            if self._data_manager.get_users_refresh_token(user_id) is None:
                 return redirect(url_for("post_auth", title=self._title))
 
-            new_access_token, new_valid_for_sec = self.refresh_access_token(
-                                                        self._auth_info['client_id'],
-                                                        self._auth_info['client_secret'],
-                                                        refresh_token
-                                                    )
             # If the token can be refreshed, log the user back in
-            if new_access_token is not None and new_valid_for_sec is not None:
-                new_end_time = Utils.calc_end_time(datetime.now(), new_valid_for_sec)
-
-                self._data_manager.save_users_access_token(
-                    new_access_token, user_id, new_end_time, refresh_token)
-                user = User(user_id)
+            if self.refresh_users_access_token(user_id, only_if_expired=True):
+                user = User(user_id, self._data_manager)
                 login_user(user)
+                self._token_refresh_scheduler.mark_active(user_id)
 
             # On success redirect to the page the user was originally going to
             next = flask.request.args.get('next')
-            white_list = self.get_valid_endpoints()
+            white_list = self._get_valid_endpoints_whitelist()
             is_next_url_bad = next == None or not is_safe_url(next, white_list)
 
-            found_url = False
-            for url in white_list:
-                # check if the given url is part of a while list url
-                if next.find(str(url)) != -1:
-                    found_url = True
-                    break
+            # check if the given url is part of a while list url
+            found_url = next is not None and any(url in next for url in white_list)
             is_next_url_bad = is_next_url_bad and found_url
 
-            if is_next_url_bad:
+            if next is None or is_next_url_bad:
                 return redirect(url_for('post_auth'))
             else:
                 preserve_code = 307 # used to keep state - get or post
                 return redirect(next, code=preserve_code)
 
+    def _get_valid_endpoints_whitelist(self) -> list:
+        """:return `get_valid_endpoints()`, computed once. The routes never change after startup"""
+        if self._valid_endpoints_whitelist is None:
+            self._valid_endpoints_whitelist = [str(url) for url in self.get_valid_endpoints()]
+        return self._valid_endpoints_whitelist
+
     def create_response_uri_pages(self):
         """Used to make all routes REQUIRED by spotify to receive responses"""
         @self._app.route("/redirect_after_auth", methods=["GET"], defaults={'code': None, 'state': None})
@@ -233,8 +286,9 @@ class WebApp(Scraper, UserManager, FlaskUtils):
             self._data_manager.save_users_access_token(
                 access_token, user_id, end_valid_time, refresh_token)
 
-            user = User(user_id)
+            user = User(user_id, self._data_manager)
             login_user(user)
+            self._token_refresh_scheduler.mark_active(user_id)
             return redirect(url_for("post_auth", title=self._title))
 
     def create_api_routes(self):
@@ -265,6 +319,15 @@ class WebApp(Scraper, UserManager, FlaskUtils):
                                    title=self._title,
                                    playlist_table=escaped_playlist_table)
 
+        @self._app.route("/metrics/spotify_requests", methods=["GET"])
+        @login_required
+        def spotify_request_metrics():
+            """Used to monitor outbound spotify requests (scheduler queue depth, wait times, 429's, coalescing, etc.)"""
+            request_stats = self.get_request_stats()
+            request_stats["token_refresh"] = self._token_refresh_scheduler.get_stats()
+            request_stats["analysis_result_cache"] = self.analyzer.get_result_cache_stats()
+            return jsonify(request_stats)
+
         @self._app.route("/search_artist", methods=["GET"])
         @login_required
         @self.does_need_refresh
@@ -283,13 +346,22 @@ class WebApp(Scraper, UserManager, FlaskUtils):
             token = current_user.get_access_token()
             chart_data_artist = {}
             chart_data_album = {}
-            raw_track_list, playlist_name, total_num_tracks = self.get_songs_from_playlist(playlist_id, token)
+            # The snapshot_id tells if the playlist changed since it was last analyzed
+            playlist_header = self.get_playlist_header(playlist_id, token)
+            playlist_name = playlist_header["name"]
+            total_num_tracks = playlist_header["tracks"]["total"]
 
             if self._is_verbose:
                 print(f"playlist name = {playlist_name}")
 
-            analyzed_data_tuple = self.analyzer.analyze_raw_track_list(raw_track_list,
-                                                                       current_user.get_access_token())
+            # Only the changes since the last analysis are counted. Pages are analyzed as they arrive
+            # instead of waiting for the whole playlist
+            analyzed_data_tuple = self.analyzer.analyze_playlist(
+                playlist_id,
+                playlist_header.get("snapshot_id"),
+                lambda: self.stream_songs_from_playlist(playlist_id, token,
+                                                        snapshot_id=playlist_header.get("snapshot_id"))[0],
+                current_user.get_access_token())
             chart_data_artist, chart_data_album, chart_data_genre = analyzed_data_tuple
 
             num_artists = len(list(chart_data_artist.keys()))
@@ -321,6 +393,74 @@ class WebApp(Scraper, UserManager, FlaskUtils):
                                     num_albums=num_albums,
                                     num_genres=num_genres))
 
+        # Allow both bcause defaults to post, but when redirecting with next, use get
+        @self._app.route("/analyze_library", methods=["GET", "POST"])
+        @login_required
+        @self.does_need_refresh
+        def analyze_library():
+            """Analyzes every playlist of the user as one library. Tracks in several playlists count once"""
+            token = current_user.get_access_token()
+            user_playlists_dict = self.get_users_playlists(token)
+            playlist_snapshot_ids = {playlist_id: playlist.get("snapshot_id")
+                                     for playlist_id, playlist in user_playlists_dict.items()}
+
+            if self._is_verbose:
+                print(f"Analyzing the library of {current_user.get_user_id()} ({len(playlist_snapshot_ids)} playlists)")
+
+            # Playlists are streamed at once and counted as their pages arrive
+            analyzed_data_tuple = self.analyzer.analyze_library(
+                current_user.get_user_id(),
+                playlist_snapshot_ids,
+                lambda: self.stream_songs_from_playlists(playlist_snapshot_ids, token),
+                token)
+            chart_data_artist, chart_data_album, chart_data_genre = analyzed_data_tuple
+
+            # A whole library is far too big for the query string of a redirect (the server would refuse the url),
+            # so the charts are rendered right away. The button that gets here is a GET, so nothing renders ugly
+            return self.render_playlist_analysis(f"Your Library ({len(playlist_snapshot_ids)} playlists)",
+                                                 sum(chart_data_artist.values()),
+                                                 Utils.prep_keys_for_html(chart_data_artist),
+                                                 Utils.prep_keys_for_html(chart_data_album),
+                                                 Utils.prep_keys_for_html(chart_data_genre))
+
+    def render_playlist_analysis(self, playlist : str, num_tracks : int,
+                                 input_data_artist : dict, input_data_album : dict, input_data_genre : dict) -> str:
+        """Renders the pie charts of an analyzed playlist (or library)
+        \n:param `input_data_artist` maps each artist to a count of occurences in the playlist (keys ready for html).
+            Same for `input_data_album` and `input_data_genre`
+        \n:return The rendered page"""
+        num_artists = len(input_data_artist)
+        num_albums = len(input_data_album)
+        num_genres = len(input_data_genre)
+
+        # Sort by value - have the top values in legend by largest %
+        input_data_artist = {k: v for k, v in sorted(input_data_artist.items(), key=lambda item: item[1], reverse=True)}
+        input_data_album = {k: v for k, v in sorted(input_data_album.items(), key=lambda item: item[1], reverse=True)}
+        input_data_genre = {k: v for k, v in sorted(input_data_genre.items(), key=lambda item: item[1], reverse=True)}
+
+        # First entry in dictionary MUST be the column names
+        artist_data = {'Artist': 'Percentage of Playlist'}
+        artist_data.update(input_data_artist)
+
+        album_data = {'Album': 'Percentage of Playlist'}
+        album_data.update(input_data_album)
+
+        genre_data = {'Genre': 'Percentage of Playlist'}
+        genre_data.update(input_data_genre)
+
+        # TODO: add links to the pie chart
+        # https: // stackoverflow.com/questions/6205621/how-to-add-links-in-google-chart-api
+        return render_template("playlist-pie-chart.html",
+                               title=self._title,
+                               artist_data=artist_data,
+                               album_data=album_data,
+                               genre_data=genre_data,
+                               playlist=playlist,
+                               num_tracks=num_tracks,
+                               num_artists=num_artists,
+                               num_albums=num_albums,
+                               num_genres=num_genres)
+
     def create_processed_data_pages(self):
         @self._app.route("/results/playlist_song_list", methods=["GET", "POST"])
         @login_required
@@ -372,43 +512,11 @@ class WebApp(Scraper, UserManager, FlaskUtils):
                 }"""
 
             full_data = request.args.to_dict()
-            playlist = full_data["playlist"]
-            num_tracks = full_data["num_tracks"]
-            num_artists = full_data["num_artists"]
-            num_albums = full_data["num_albums"]
-            num_genres = full_data["num_genres"]
-
-            input_data_artist = Utils.prep_dict_for_html(full_data["artist_data"])
-            input_data_album = Utils.prep_dict_for_html(full_data["album_data"])
-            input_data_genre = Utils.prep_dict_for_html(full_data["genre_data"])
-
-            # Sort by value - have the top values in legend by largest %
-            input_data_artist = {k: v for k, v in sorted(input_data_artist.items(), key=lambda item: item[1], reverse=True)}
-            input_data_album = {k: v for k, v in sorted(input_data_album.items(), key=lambda item: item[1], reverse=True)}
-            input_data_genre = {k: v for k, v in sorted(input_data_genre.items(), key=lambda item: item[1], reverse=True)}
-
-            # First entry in dictionary MUST be the column names
-            artist_data = {'Artist': 'Percentage of Playlist'}
-            artist_data.update(input_data_artist)
-
-            album_data = {'Album': 'Percentage of Playlist'}
-            album_data.update(input_data_album)
-
-            genre_data = {'Genre': 'Percentage of Playlist'}
-            genre_data.update(input_data_genre)
-
-            # TODO: add links to the pie chart
-            # https: // stackoverflow.com/questions/6205621/how-to-add-links-in-google-chart-api
-            return render_template("playlist-pie-chart.html",
-                                   title=self._title,
-                                   artist_data=artist_data,
-                                   album_data=album_data,
-                                   genre_data=genre_data,
-                                   playlist=playlist,
-                                   num_tracks=num_tracks,
-                                   num_artists=num_artists,
-                                   num_albums=num_albums,
-                                   num_genres=num_genres)
+            return self.render_playlist_analysis(full_data["playlist"],
+                                                 full_data["num_tracks"],
+                                                 Utils.prep_dict_for_html(full_data["artist_data"]),
+                                                 Utils.prep_dict_for_html(full_data["album_data"]),
+                                                 Utils.prep_dict_for_html(full_data["genre_data"]))
 
         @self._app.route("/results/search_artist", methods=["POST"])
         @login_required
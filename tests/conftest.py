@@ -0,0 +1,71 @@
+"""
+    @file Shared fixtures. The app's modules are flat files in src/, so src/ is put on the path.
+    \nTests that talk to "spotify" use the `spotify` fixture: a FakeSpotifyServer every request is pointed at
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import pathlib
+import sys
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import pytest
+
+SRC_DIR = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+#------------------------------Project Imports-----------------------------#
+import constants
+from data_manager import DataManager
+from fake_spotify_server import FakeSpotifyServer, SyntheticLibrary
+from playlist_cache import PlaylistCache
+from request_scheduler import RequestScheduler
+from scraper import Scraper
+from single_flight import SingleFlight
+from utils import Utils
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch) -> pathlib.Path:
+    """An empty data dir (with app credentials) that the DataManager and caches use instead of the real one"""
+    (tmp_path / constants.EXPECTED_AUTH_FILENAME).write_text(json.dumps({"client_id": "client_id",
+                                                                        "client_secret": "client_secret"}))
+    monkeypatch.setattr(Utils, "path_to_data_dir", tmp_path)
+    monkeypatch.setattr(DataManager, "_storage_backend", None)
+    return tmp_path
+
+
+@pytest.fixture
+def library() -> SyntheticLibrary:
+    return SyntheticLibrary(num_playlists=3, tracks_per_playlist=300, num_artists=200, num_albums=400, seed=1)
+
+
+@pytest.fixture
+def spotify(library, data_dir, monkeypatch):
+    """A FakeSpotifyServer serving `library`. Scraper's shared state is replaced so tests do not leak into each other.
+    \nThe persistent response cache is off, tests that want it configure their own"""
+    monkeypatch.setattr(Scraper, "_scheduler", RequestScheduler())
+    monkeypatch.setattr(Scraper, "_single_flight", SingleFlight())
+    monkeypatch.setattr(Scraper, "_playlist_cache", PlaylistCache())
+    monkeypatch.setattr(Scraper, "_response_cache", None)
+    monkeypatch.setattr(Scraper, "_is_response_cache_enabled", False)
+    monkeypatch.setattr(Scraper, "_traffic_cassette", None)
+
+    server = FakeSpotifyServer(library).start()
+    old_api_base_uri = constants.SPOTIFY_API_BASE_URI
+    old_accounts_base_uri = constants.SPOTIFY_ACCOUNTS_BASE_URI
+    Utils.set_spotify_base_uris(server.base_uri, server.base_uri)
+    try:
+        yield server
+    finally:
+        Utils.set_spotify_base_uris(old_api_base_uri, old_accounts_base_uri)
+        server.stop()
+
+
+@pytest.fixture
+def scraper(spotify) -> Scraper:
+    return Scraper(False)
+
+
+@pytest.fixture
+def access_token(scraper) -> str:
+    return scraper.refresh_access_token("client_id", "client_secret", "refresh_token")[0]
@@ -0,0 +1,72 @@
+"""
+    @file Analyzer against the fake spotify server: incremental playlist analysis vs analyzing from scratch
+"""
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import pytest
+
+#------------------------------Project Imports-----------------------------#
+from analyzer import Analyzer
+from data_manager import DataManager
+
+@pytest.fixture
+def analyzer(spotify) -> Analyzer:
+    return Analyzer(False, DataManager())
+
+
+def analyze_incrementally(analyzer, scraper, access_token, library, playlist_id):
+    def get_raw_track_pages():
+        return scraper.stream_songs_from_playlist(playlist_id, access_token, use_cache=False)[0]
+    return analyzer.analyze_playlist(playlist_id, library.get_snapshot_id(playlist_id),
+                                     get_raw_track_pages, access_token)
+
+
+def analyze_from_scratch(analyzer, scraper, access_token, playlist_id):
+    tracks = scraper.get_songs_from_playlist(playlist_id, access_token, use_cache=False)[0]
+    return analyzer.analyze_raw_track_list(tracks, access_token)
+
+
+def test_incremental_analysis_matches_a_full_analysis(analyzer, scraper, access_token, library):
+    playlist_id = next(iter(library.playlists))
+    playlist = library.playlists[playlist_id]
+    assert analyze_incrementally(analyzer, scraper, access_token, library, playlist_id) == \
+        analyze_from_scratch(analyzer, scraper, access_token, playlist_id)
+
+    library.add_tracks(playlist_id, 40)
+    assert analyze_incrementally(analyzer, scraper, access_token, library, playlist_id) == \
+        analyze_from_scratch(analyzer, scraper, access_token, playlist_id)
+
+    # Remove tracks from the start, the middle and the end (new snapshot, like spotify)
+    del playlist["tracks"][:10]
+    del playlist["tracks"][50:70]
+    del playlist["tracks"][-15:]
+    playlist["version"] += 1
+    assert analyze_incrementally(analyzer, scraper, access_token, library, playlist_id) == \
+        analyze_from_scratch(analyzer, scraper, access_token, playlist_id)
+
+
+def test_unchanged_playlist_is_not_requested_again(analyzer, scraper, access_token, library, spotify):
+    playlist_id = next(iter(library.playlists))
+    expected = analyze_incrementally(analyzer, scraper, access_token, library, playlist_id)
+    num_playlist_requests = spotify.request_counts.get("playlist", 0)
+
+    # A new Analyzer has an empty result cache, so the saved state is what is reused
+    assert analyze_incrementally(Analyzer(False, DataManager()), scraper, access_token, library, playlist_id) \
+        == expected
+    assert spotify.request_counts.get("playlist", 0) == num_playlist_requests
+
+
+def test_library_analysis_counts_shared_tracks_once(analyzer, scraper, access_token, library):
+    playlist_ids = list(library.playlists)
+    # The first playlist's tracks are also added to the second
+    library.playlists[playlist_ids[1]]["tracks"].extend(library.playlists[playlist_ids[0]]["tracks"])
+    library.playlists[playlist_ids[1]]["version"] += 1
+
+    playlist_snapshot_ids = {playlist_id: library.get_snapshot_id(playlist_id) for playlist_id in playlist_ids}
+    artist_counts, _, _ = analyzer.analyze_library(
+        library.user_id, playlist_snapshot_ids,
+        lambda: scraper.stream_songs_from_playlists(playlist_snapshot_ids, access_token),
+        access_token)
+
+    unique_track_ids = {raw_track["id"] for playlist in library.playlists.values() for raw_track in playlist["tracks"]}
+    assert sum(artist_counts.values()) == len(unique_track_ids)
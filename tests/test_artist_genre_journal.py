@@ -0,0 +1,66 @@
+"""
+    @file ArtistGenreJournal: appending updates, recovering from a crash mid-append and compaction
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import time
+
+#------------------------------Project Imports-----------------------------#
+from artist_genre_journal import ArtistGenreJournal
+
+def test_updates_are_replayed_on_top_of_the_snapshot(tmp_path):
+    snapshot_path = tmp_path / "artist_genre_map.json"
+    snapshot_path.write_text(json.dumps({"ABBA": ["pop"], "Zed": ["house"]}))
+
+    journal = ArtistGenreJournal(snapshot_path)
+    journal.update_mappings({"ABBA": ["pop", "europop"]})
+    journal.update_mappings({"New Artist": ["indie"]})
+
+    assert ArtistGenreJournal(snapshot_path).get_mappings() == {"ABBA": ["pop", "europop"],
+                                                                "Zed": ["house"],
+                                                                "New Artist": ["indie"]}
+
+
+def test_record_cut_short_by_a_crash_is_dropped(tmp_path):
+    snapshot_path = tmp_path / "artist_genre_map.json"
+    journal = ArtistGenreJournal(snapshot_path)
+    journal.update_mappings({"ABBA": ["pop"]})
+    with open(journal._journal_path, 'ab') as journal_file:
+        journal_file.write(b'{"Zed": ["ho')
+
+    recovered_journal = ArtistGenreJournal(snapshot_path)
+    assert recovered_journal.get_mappings() == {"ABBA": ["pop"]}
+
+    # the next record starts on its own line instead of after the partial one
+    recovered_journal.update_mappings({"Zed": ["house"]})
+    assert ArtistGenreJournal(snapshot_path).get_mappings() == {"ABBA": ["pop"], "Zed": ["house"]}
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    snapshot_path = tmp_path / "artist_genre_map.json"
+    journal = ArtistGenreJournal(snapshot_path)
+    journal.update_mappings({"ABBA": ["pop"]})
+    journal.update_mappings({"ABBA": ["europop"], "Zed": ["house"]})
+    journal.compact()
+
+    assert json.loads(snapshot_path.read_text()) == {"ABBA": ["europop"], "Zed": ["house"]}
+    assert journal._journal_path.stat().st_size == 0
+    assert journal.get_mappings() == {"ABBA": ["europop"], "Zed": ["house"]}
+
+
+def test_journal_is_compacted_once_it_passes_the_threshold(tmp_path):
+    snapshot_path = tmp_path / "artist_genre_map.json"
+    journal = ArtistGenreJournal(snapshot_path, compact_threshold_bytes=100)
+    expected_mappings = {}
+    for idx in range(10):
+        journal.update_mappings({f"Artist {idx}": ["rock"]})
+        expected_mappings[f"Artist {idx}"] = ["rock"]
+
+    # compaction runs in the background
+    for _ in range(100):
+        if snapshot_path.is_file():
+            break
+        time.sleep(0.01)
+    assert snapshot_path.is_file()
+    assert journal.get_mappings() == expected_mappings
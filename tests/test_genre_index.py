@@ -0,0 +1,59 @@
+"""
+    @file GenreIndex and the ArtistGenreLookup built on it
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import time
+
+#------------------------------Project Imports-----------------------------#
+from genre_index import ArtistGenreLookup, GenreIndex
+
+MAPPINGS = {"Beyoncé": ["pop", "r&b"],
+            "ABBA": ["pop", "europop"],
+            "Unknown Artist": [],
+            "Zed": ["electro house"]}
+
+def test_index_reads_back_what_was_written(tmp_path):
+    index_path = tmp_path / "genres.idx"
+    GenreIndex.write(index_path, MAPPINGS)
+    index = GenreIndex(index_path)
+    try:
+        assert dict(index) == MAPPINGS
+        assert "Nobody" not in index
+        assert index.get("Nobody") is None
+    finally:
+        index.close()
+
+
+def test_failed_lookups_are_left_out(tmp_path):
+    index_path = tmp_path / "genres.idx"
+    GenreIndex.write(index_path, dict(MAPPINGS, Failed=None))
+    index = GenreIndex(index_path)
+    try:
+        assert "Failed" not in index
+        assert len(index) == len(MAPPINGS)
+    finally:
+        index.close()
+
+
+def test_lookup_builds_the_index_and_sees_new_mappings(tmp_path):
+    index_path = tmp_path / "genres.idx"
+    stored_mappings = dict(MAPPINGS)
+    lookup = ArtistGenreLookup(index_path, lambda: dict(stored_mappings), time.time())
+
+    assert lookup["ABBA"] == ["pop", "europop"]
+    assert index_path.is_file()
+
+    stored_mappings["New Artist"] = ["indie"]
+    lookup.add_mappings({"New Artist": ["indie"]})
+    assert lookup["New Artist"] == ["indie"]
+    assert dict(lookup) == stored_mappings
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    index_path = tmp_path / "genres.idx"
+    GenreIndex.write(index_path, {"Old Artist": ["rock"]})
+
+    lookup = ArtistGenreLookup(index_path, lambda: dict(MAPPINGS), time.time() + 60)
+    assert "Old Artist" not in lookup
+    assert dict(lookup) == MAPPINGS
@@ -0,0 +1,91 @@
+"""
+    @file PlaylistAnalysisState: applying added / removed tracks to the counts
+"""
+
+#------------------------------Project Imports-----------------------------#
+import constants
+from playlist_analysis_state import PlaylistAnalysisState
+
+ARTIST_GENRES = {"ABBA": ["pop", "europop"], "Zed": ["house"], "Local Artist": []}
+
+def make_track(track_id, artist_name, album_name = "Album"):
+    return {"id": track_id,
+            "name": f"Track {track_id}",
+            "album": {"name": album_name},
+            "artists": [{"name": artist_name, "id": None if artist_name == "Local Artist" else artist_name.lower()}]}
+
+
+def count_from_scratch(tracks):
+    state = PlaylistAnalysisState("playlist")
+    state.update("snapshot", *PlaylistAnalysisState.count_tracks([tracks]), get_artist_genres)
+    return state.get_chart_data()
+
+
+def get_artist_genres(artist_spotify_ids):
+    return {artist_name: ARTIST_GENRES[artist_name] for artist_name in artist_spotify_ids}
+
+
+def test_deltas_give_the_same_counts_as_starting_over():
+    tracks = [make_track("1", "ABBA", "Gold"), make_track("2", "ABBA", "Gold"), make_track("3", "Zed")]
+    state = PlaylistAnalysisState("playlist")
+    assert state.update("v1", *PlaylistAnalysisState.count_tracks([tracks]), get_artist_genres) == 3
+
+    # the same track twice, a new artist, and a removed track
+    tracks = [make_track("1", "ABBA", "Gold"), make_track("1", "ABBA", "Gold"), make_track("3", "Zed"),
+              make_track(None, "Local Artist", " ")]
+    assert state.update("v2", *PlaylistAnalysisState.count_tracks([tracks]), get_artist_genres) == 3
+
+    assert state.snapshot_id == "v2"
+    assert state.get_chart_data() == count_from_scratch(tracks)
+    artist_counts, album_counts, genre_counts = state.get_chart_data()
+    assert artist_counts == {"ABBA": 2, "Zed": 1, "Local Artist": 1}
+    assert album_counts == {"Gold": 2, "Album": 1, constants.DEFAULT_NO_ALBUM_NAME: 1}
+    assert genre_counts == {"pop": 2, "europop": 2, "house": 1}
+
+
+def test_artist_removed_from_the_playlist_is_dropped():
+    state = PlaylistAnalysisState("playlist")
+    state.update("v1", *PlaylistAnalysisState.count_tracks([[make_track("1", "ABBA"), make_track("2", "Zed")]]),
+                 get_artist_genres)
+    state.update("v2", *PlaylistAnalysisState.count_tracks([[make_track("2", "Zed")]]), get_artist_genres)
+
+    assert state.get_chart_data() == ({"Zed": 1}, {"Album": 1}, {"house": 1})
+    assert state.get_num_tracks() == 1
+
+
+def test_only_new_artists_are_looked_up():
+    looked_up_artists = []
+
+    def record_lookups(artist_spotify_ids):
+        looked_up_artists.append(dict(artist_spotify_ids))
+        return get_artist_genres(artist_spotify_ids)
+
+    state = PlaylistAnalysisState("playlist")
+    state.update("v1", *PlaylistAnalysisState.count_tracks([[make_track("1", "ABBA")]]), record_lookups)
+    state.update("v2", *PlaylistAnalysisState.count_tracks([[make_track("1", "ABBA"), make_track("2", "ABBA"),
+                                                             make_track("3", "Zed")]]), record_lookups)
+
+    assert looked_up_artists == [{"ABBA": "abba"}, {"Zed": "zed"}]
+
+
+def test_artist_whose_genres_are_found_later_counts_every_track():
+    tracks = [make_track("1", "ABBA"), make_track("2", "ABBA")]
+    state = PlaylistAnalysisState("playlist")
+    # the lookup failed the first time
+    state.update("v1", *PlaylistAnalysisState.count_tracks([tracks]), lambda artist_spotify_ids: {})
+    assert state.get_chart_data()[2] == {}
+
+    tracks.append(make_track("3", "ABBA"))
+    state.update("v2", *PlaylistAnalysisState.count_tracks([tracks]), get_artist_genres)
+    assert state.get_chart_data()[2] == {"pop": 3, "europop": 3}
+
+
+def test_saved_state_is_restored():
+    state = PlaylistAnalysisState("playlist")
+    state.update("v1", *PlaylistAnalysisState.count_tracks([[make_track("1", "ABBA"), make_track("2", "Zed")]]),
+                 get_artist_genres)
+
+    restored_state = PlaylistAnalysisState.from_dict(state.to_dict())
+    assert restored_state.snapshot_id == "v1"
+    assert restored_state.get_chart_data() == state.get_chart_data()
+    assert PlaylistAnalysisState.from_dict(dict(state.to_dict(), version=0)) is None
@@ -0,0 +1,72 @@
+"""
+    @file RequestScheduler: retrying 429s and honoring Retry-After
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import time
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import requests
+
+#------------------------------Project Imports-----------------------------#
+from request_scheduler import RequestScheduler
+
+def make_response(status_code : int, retry_after_sec : str = None) -> requests.Response:
+    res = requests.Response()
+    res.status_code = status_code
+    res.url = "http://spotify.test/v1/me"
+    if retry_after_sec is not None:
+        res.headers["Retry-After"] = retry_after_sec
+    return res
+
+
+def make_send_func(responses):
+    """:return A send function that gives back `responses` in order, and the list of when it was called"""
+    responses = iter(responses)
+    send_times = []
+
+    def send_func() -> requests.Response:
+        send_times.append(time.monotonic())
+        return next(responses)
+    return send_func, send_times
+
+
+def test_rate_limited_request_is_retried():
+    scheduler = RequestScheduler(max_retries=3)
+    send_func, send_times = make_send_func([make_response(429, "0"), make_response(429, "0"), make_response(200)])
+
+    assert scheduler.submit(send_func).status_code == 200
+    assert len(send_times) == 3
+    assert scheduler.get_stats()["num_rate_limited"] == 2
+
+
+def test_retry_after_is_waited_on():
+    scheduler = RequestScheduler()
+    send_func, send_times = make_send_func([make_response(429, "0.3"), make_response(200)])
+
+    assert scheduler.submit(send_func).status_code == 200
+    assert send_times[1] - send_times[0] >= 0.3
+
+
+def test_gives_up_once_retries_run_out():
+    scheduler = RequestScheduler(max_retries=2)
+    send_func, send_times = make_send_func([make_response(429, "0")] * 5)
+
+    assert scheduler.submit(send_func).status_code == 429
+    assert len(send_times) == 3
+
+
+def test_long_retry_after_is_returned_to_the_caller():
+    scheduler = RequestScheduler(max_retry_after_sec=5)
+    send_func, send_times = make_send_func([make_response(429, "60"), make_response(200)])
+
+    assert scheduler.submit(send_func).status_code == 429
+    assert len(send_times) == 1
+
+
+def test_rate_limit_halves_the_concurrency_limit():
+    scheduler = RequestScheduler(max_concurrency=8)
+    send_func, _ = make_send_func([make_response(429, "0"), make_response(200)])
+
+    scheduler.submit(send_func)
+    assert scheduler.get_stats()["concurrency_limit"] == 4
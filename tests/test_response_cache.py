@@ -0,0 +1,94 @@
+"""
+    @file ResponseCache: ttl, stale-while-revalidate and eviction
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import threading
+import types
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import pytest
+
+#------------------------------Project Imports-----------------------------#
+import response_cache
+from response_cache import ResponseCache
+
+ENDPOINT = "artist"
+URL = "https://api.spotify.com/v1/artists/abc"
+TTL_SEC = 100
+STALE_WHILE_REVALIDATE_SEC = 50
+
+@pytest.fixture
+def clock(monkeypatch) -> types.SimpleNamespace:
+    """The cache's clock, moved forward by hand"""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock) -> ResponseCache:
+    return ResponseCache(tmp_path / "cache.sqlite3", {ENDPOINT: TTL_SEC},
+                         stale_while_revalidate_sec=STALE_WHILE_REVALIDATE_SEC)
+
+
+def test_entry_is_fresh_then_stale_then_gone(cache, clock):
+    cache.put(ENDPOINT, URL, {"genres": ["rock"]})
+    assert cache.get(ENDPOINT, URL) == ({"genres": ["rock"]}, False)
+
+    clock.now += TTL_SEC + 1
+    assert cache.get(ENDPOINT, URL) == ({"genres": ["rock"]}, True)
+
+    clock.now += STALE_WHILE_REVALIDATE_SEC
+    assert cache.get(ENDPOINT, URL) == (None, False)
+
+
+def test_same_request_has_the_same_key():
+    assert ResponseCache.make_key("HTTPS://API.spotify.com/v1/artists/", {"b": 2, "a": 1}) == \
+        ResponseCache.make_key("https://api.spotify.com/v1/artists?a=1", {"b": 2})
+
+
+def test_stale_entry_is_served_and_refreshed_in_the_background(cache, clock):
+    cache.put(ENDPOINT, URL, {"genres": ["rock"]}, None)
+    clock.now += TTL_SEC + 1
+
+    is_refreshed = threading.Event()
+
+    def fetch_func():
+        is_refreshed.set()
+        return {"genres": ["pop"]}
+
+    assert cache.get_or_fetch(ENDPOINT, URL, None, fetch_func) == {"genres": ["rock"]}
+    assert is_refreshed.wait(5)
+    # the refresh is stored right after fetch_func returns
+    for _ in range(100):
+        if cache.get(ENDPOINT, URL)[0] == {"genres": ["pop"]}:
+            break
+        threading.Event().wait(0.01)
+    assert cache.get(ENDPOINT, URL) == ({"genres": ["pop"]}, False)
+
+
+def test_missing_entry_is_fetched_and_failures_are_not_cached(cache):
+    assert cache.get_or_fetch(ENDPOINT, URL, None, lambda: None) is None
+    assert cache.get(ENDPOINT, URL) == (None, False)
+
+    assert cache.get_or_fetch(ENDPOINT, URL, None, lambda: {"genres": []}) == {"genres": []}
+    assert cache.get_or_fetch(ENDPOINT, URL, None, lambda: pytest.fail("should be cached")) == {"genres": []}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    body = {"genres": ["x" * 20]}
+    # room for 3 entries
+    cache = ResponseCache(tmp_path / "cache.sqlite3", {ENDPOINT: TTL_SEC}, max_size_bytes=3 * len(json.dumps(body)))
+    for idx in range(4):
+        clock.now += 1
+        cache.put(ENDPOINT, f"{URL}{idx}", body)
+        if idx == 2:
+            # keep the oldest one in use
+            clock.now += 1
+            cache.get(ENDPOINT, f"{URL}0")
+
+    assert cache.get(ENDPOINT, f"{URL}0")[0] == body
+    assert cache.get(ENDPOINT, f"{URL}1")[0] is None
+    assert cache.get(ENDPOINT, f"{URL}3")[0] == body
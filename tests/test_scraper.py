@@ -0,0 +1,59 @@
+"""
+    @file Scraper against the fake spotify server: paging, rate limits and recorded traffic
+"""
+
+#------------------------------Project Imports-----------------------------#
+from scraper import Scraper
+from traffic_cassette import TrafficCassette
+
+def test_parallel_and_sequential_pagination_get_the_same_tracks(scraper, access_token, library):
+    for playlist_id in library.playlists:
+        sequential = scraper.get_songs_from_playlist(playlist_id, access_token, max_workers=1, use_cache=False)
+        parallel = scraper.get_songs_from_playlist(playlist_id, access_token, max_workers=8, use_cache=False)
+
+        assert parallel == sequential
+        assert [track["id"] for track in sequential[0]] == \
+            [raw_track["id"] for raw_track in library.playlists[playlist_id]["tracks"]]
+
+
+def test_rate_limited_requests_are_retried(scraper, access_token, library, spotify):
+    playlist_id = next(iter(library.playlists))
+    expected = scraper.get_songs_from_playlist(playlist_id, access_token, use_cache=False)
+
+    spotify.rate_limit_prob = 0.3
+    spotify.retry_after_sec = 0
+    assert scraper.get_songs_from_playlist(playlist_id, access_token, max_workers=4, use_cache=False) == expected
+    assert Scraper.get_scheduler_stats()["num_rate_limited"] > 0
+
+
+def test_unchanged_playlist_is_served_from_the_cache(scraper, access_token, library, spotify):
+    playlist_id = next(iter(library.playlists))
+    expected = scraper.get_songs_from_playlist(playlist_id, access_token)
+    num_track_pages = spotify.request_counts.get("playlist/tracks", 0)
+
+    assert scraper.get_songs_from_playlist(playlist_id, access_token) == expected
+    assert spotify.request_counts.get("playlist/tracks", 0) == num_track_pages
+
+    library.add_tracks(playlist_id, 5)
+    tracks, _, total_num_tracks = scraper.get_songs_from_playlist(playlist_id, access_token)
+    assert total_num_tracks == len(expected[0]) + 5
+    assert len(tracks) == total_num_tracks
+
+
+def test_recorded_traffic_replays_the_same_results(scraper, access_token, library, spotify, tmp_path):
+    cassette_path = tmp_path / "traffic.ndjson.gz"
+    recorder = TrafficCassette(cassette_path, TrafficCassette.RECORD_MODE)
+    Scraper.configure_traffic_cassette(recorder)
+    recorded_playlists = scraper.get_users_playlists(access_token)
+    recorded_tracks = {playlist_id: scraper.get_songs_from_playlist(playlist_id, access_token, use_cache=False)
+                       for playlist_id in library.playlists}
+    recorder.save()
+
+    # Nothing can reach spotify anymore, every response has to come from the cassette
+    spotify.stop()
+    player = TrafficCassette(cassette_path, TrafficCassette.REPLAY_MODE, replay_timing_scale=0)
+    Scraper.configure_traffic_cassette(player)
+    assert scraper.get_users_playlists(access_token) == recorded_playlists
+    for playlist_id, tracks in recorded_tracks.items():
+        assert scraper.get_songs_from_playlist(playlist_id, access_token, use_cache=False) == tracks
+    assert player.get_stats()["num_missed"] == 0
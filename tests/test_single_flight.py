@@ -0,0 +1,62 @@
+"""
+    @file SingleFlight: overlapping calls with the same key share one call
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+#-----------------------------3RD PARTY DEPENDENCIES-----------------------------#
+import pytest
+
+#------------------------------Project Imports-----------------------------#
+from single_flight import SingleFlight
+
+NUM_CALLERS = 8
+
+def call_concurrently(single_flight : SingleFlight, func):
+    """Calls `func` through `single_flight` from several threads while the first call is still running
+    \n:return The futures of every call"""
+    release_event = threading.Event()
+    num_calls = []
+
+    def slow_func():
+        num_calls.append(1)
+        release_event.wait(5)
+        return func()
+
+    with ThreadPoolExecutor(max_workers=NUM_CALLERS) as executor:
+        futures = [executor.submit(single_flight.do, "key", slow_func) for _ in range(NUM_CALLERS)]
+        # wait until every caller is either running or waiting on the running call
+        while single_flight.get_stats()["num_calls"] < NUM_CALLERS:
+            threading.Event().wait(0.01)
+        release_event.set()
+    return futures, len(num_calls)
+
+
+def test_overlapping_calls_share_one_call():
+    single_flight = SingleFlight()
+    futures, num_calls = call_concurrently(single_flight, lambda: {"result": 1})
+
+    assert num_calls == 1
+    assert [future.result() for future in futures] == [{"result": 1}] * NUM_CALLERS
+    assert single_flight.get_stats() == {"num_calls": NUM_CALLERS, "num_shared": NUM_CALLERS - 1, "num_in_flight": 0}
+
+
+def test_error_is_raised_to_every_caller():
+    def fail():
+        raise ValueError("spotify is down")
+
+    futures, num_calls = call_concurrently(SingleFlight(), fail)
+    assert num_calls == 1
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_calls_that_do_not_overlap_are_not_shared():
+    single_flight = SingleFlight()
+    results = [single_flight.do("key", lambda idx=idx: idx) for idx in range(3)]
+
+    assert results == [0, 1, 2]
+    assert single_flight.get_stats()["num_shared"] == 0
@@ -0,0 +1,50 @@
+"""
+    @file TokenExpiryIndex: validity checks and soonest-first ordering
+"""
+
+#------------------------------Project Imports-----------------------------#
+from token_expiry_index import TokenExpiryIndex
+
+def test_tokens_are_valid_until_they_expire():
+    index = TokenExpiryIndex()
+    index.set_expiry("alice", 100.0)
+
+    assert index.is_valid("alice", now=99.0)
+    assert not index.is_valid("alice", now=100.0)
+    assert not index.is_valid("bob", now=0.0)
+
+
+def test_expiries_are_listed_soonest_first():
+    index = TokenExpiryIndex()
+    index.set_expiry("alice", 300.0)
+    index.set_expiry("bob", 100.0)
+    index.set_expiry("carol", 200.0)
+    # a refreshed token moves to its new place
+    index.set_expiry("bob", 400.0)
+
+    assert index.get_next_expiry() == ("carol", 200.0)
+    assert index.get_expiring_before(350.0) == [("carol", 200.0), ("alice", 300.0)]
+    assert len(index) == 3
+
+
+def test_removed_user_is_no_longer_indexed():
+    index = TokenExpiryIndex()
+    index.set_expiry("alice", 100.0)
+    index.set_expiry("bob", 100.0)
+    index.remove("alice")
+
+    assert index.get_expiry("alice") is None
+    assert index.get_expiring_before(1000.0) == [("bob", 100.0)]
+    index.remove("bob")
+    assert index.get_next_expiry() is None
+
+
+def test_replace_all_remembers_its_source_version():
+    index = TokenExpiryIndex()
+    assert index.get_source_version() is None
+
+    index.set_expiry("old user", 50.0)
+    index.replace_all({"alice": 200.0, "bob": 100.0}, source_version=7)
+    assert index.get_source_version() == 7
+    assert index.get_expiry("old user") is None
+    assert index.get_expiring_before(1000.0) == [("bob", 100.0), ("alice", 200.0)]
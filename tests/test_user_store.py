@@ -0,0 +1,70 @@
+"""
+    @file UserStore: write-through persistence and reloading changes made by other processes
+"""
+
+#------------------------------STANDARD DEPENDENCIES-----------------------------#
+import json
+import os
+
+#------------------------------Project Imports-----------------------------#
+from user_store import UserStore
+
+USER = {"access_token": "token", "valid_until": 100.0, "refresh_token": "refresh"}
+
+def write_outside_change(user_data_path, users):
+    """Changes the file like another process would, making sure the change is visible in the mtime"""
+    old_mtime_ns = os.stat(user_data_path).st_mtime_ns
+    user_data_path.write_text(json.dumps(users))
+    os.utime(user_data_path, ns=(old_mtime_ns + 10**9, old_mtime_ns + 10**9))
+
+
+def test_saved_users_are_persisted(tmp_path):
+    user_data_path = tmp_path / "users.json"
+    store = UserStore(user_data_path)
+    store.save_user("alice", USER)
+    assert store.update_user("alice", {"access_token": "new token"})
+    assert not store.update_user("bob", {"access_token": "new token"})
+
+    assert UserStore(user_data_path).get_user("alice") == dict(USER, access_token="new token")
+
+    store.remove_user("alice")
+    assert UserStore(user_data_path).get_user("alice") is None
+
+
+def test_returned_users_are_copies(tmp_path):
+    store = UserStore(tmp_path / "users.json")
+    store.save_user("alice", USER)
+    store.get_user("alice")["access_token"] = "changed"
+
+    assert store.get_user("alice") == USER
+
+
+def test_outside_changes_are_reloaded(tmp_path):
+    user_data_path = tmp_path / "users.json"
+    store = UserStore(user_data_path, reload_check_interval_sec=0)
+    store.save_user("alice", USER)
+    version = store.get_version()
+
+    write_outside_change(user_data_path, {"bob": USER})
+    assert store.get_user("alice") is None
+    assert store.get_user("bob") == USER
+    assert store.get_version() > version
+
+
+def test_own_writes_do_not_change_the_version(tmp_path):
+    store = UserStore(tmp_path / "users.json", reload_check_interval_sec=0)
+    version = store.get_version()
+    store.save_user("alice", USER)
+    store.update_user("alice", {"valid_until": 200.0})
+
+    assert store.get_version() == version
+
+
+def test_outside_changes_wait_for_the_reload_check_interval(tmp_path):
+    user_data_path = tmp_path / "users.json"
+    store = UserStore(user_data_path, reload_check_interval_sec=60)
+    store.save_user("alice", USER)
+    store.get_user("alice")
+
+    write_outside_change(user_data_path, {})
+    assert store.get_user("alice") == USER